@@ -11,11 +11,15 @@ setup(name='swmeas',
       keywords=['science', 'chemistry', 'oceanography', 'carbon'],
       classifiers=['Development Status :: 4 - Beta',
                    'Intended Audience :: Science/Research',
-                   'Programming Language :: Python :: 2 :: Only',
+                   'Programming Language :: Python :: 3',
+                   'Programming Language :: Python :: 3 :: Only',
                    ],
+      python_requires='>=3.7',
       install_requires=['numpy>=1.1',
                         'pyserial>=3.3',
                         'future>=0.16',
+                        'python-dateutil>=2.6',
                         'matplotlib>=2.0'],
       package_data={'swmeas': ['resources/*']},
+      entry_points={'console_scripts': ['swmeas=swmeas.cli:main']},
       zip_safe=True)
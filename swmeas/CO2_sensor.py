@@ -1,11 +1,14 @@
-import serial
-import time
-import os
-from builtins import bytes, range  # for python 2/3 compatability
-from .helpers import fmt, portscan, find_sensor, get_sensor_name
+from builtins import bytes  # for python 2/3 compatability
+from .helpers import RowEncoder, modbus_crc
+from .records import CO2_DTYPE, new_reading
+from .qc import QC_MISSING, QC_COMM
+from .driver import SerialDriver, register
 
+encoder = RowEncoder(dec=1)
 
-class CO2_sensor(object):
+
+@register
+class CO2_sensor(SerialDriver):
     """
     Connect to and take measurements from a K-30 CO2 Sensor.
 
@@ -13,91 +16,67 @@ class CO2_sensor(object):
     ----------
     ID : str
         The serial number of the CO2 Sensor
-    msg : byte str
-        The message sent to the sensor to retrieve
-        a measurement (should not need to be changed).
+    port : str
+        The sensor's port, if known.
+    connect : bool
+        If False, the sensor isn't connected. Used to write
+        readings taken elsewhere (e.g. in a worker process).
     """
+    STYPE = 'CO2'
+    DTYPE = CO2_DTYPE
+    HEADER = 'Time (UTC),CO2 (ppm)'
+    ENCODER = encoder
+    SERIAL = {'baudrate': 9600, 'timeout': .5}
 
-    def __init__(self, ID=None, port=None, name=''):
-        self.ID = ID
-        self.name = name
-        self.port = port
-        self.connect()
-        return
+    # Modbus request for the CO2 reading (in RAM at 0x08)
+    REQUEST = b"\xFE\x44\x00\x08\x02\x9F\x25"
 
-    def connect(self):
-        """
-        Connects to CO2 Sensor identified by Serial Number.
+    def transact(self):
         """
-        if self.port is not None:
-            p = portscan(self.port)
-            if p is not None:
-                self.port = p.device
-                self.ID = p.serial_number
-                self.name = get_sensor_name(self.ID)
-            else:
-                raise serial.SerialException("Can't find port: {}".format(self.port))
-        elif self.ID is not None:
-            p = portscan(self.ID)
-            if p is not None:
-                self.port = p.device
-                self.ID = p.serial_number
-                self.name = get_sensor_name(self.ID)
-            else:
-                raise serial.SerialException("Can't find port with ID: {}".format(self.ID))
-        else:
-            self.ID, self.name, self.port = find_sensor('CO2')
-
-        self.label = "CO2 sensor {} ({}) on port {}\n".format(self.name, self.ID, self.port)
-        print("\n" + '*' * len(self.label) + '\n' +
-              self.label +
-              '*' * len(self.label) + '\n')
-
-        self.sensor = serial.Serial(self.port, baudrate=9600, timeout=.5)
-        return
-
-    # def read(self):
-    #     """
-    #     Read a single CO2 measurement from the sensor.
-
-    #     Returns
-    #     -------
-    #     float : ppm CO2
-    #     """
-    #     # time at start of measurement
-    #     tnow = time.strftime('%Y-%m-%d-%H:%M:%S', time.localtime())
-
-    #     self.sensor.flushInput()
-    #     self.sensor.write(self.msg)
-    #     # read measurement from sensor
-    #     resp = self.sensor.read(7)
-    #     high = ord(resp[3])
-    #     low = ord(resp[4])
-    #     co2 = (high * 256.) + low
-    #     self.last_read = [tnow, co2]
-    #     return [tnow, co2]
-
-    def read(self):
+        Send REQUEST, and return the sensor's response. The record
+        returned by `read` has CO2 NaN and flag QC_MISSING if the sensor
+        did not respond, and flag QC_COMM if the response fails its
+        checksum (see swmeas.qc).
         """
-        Read a single CO2 measurement from the sensor.
+        self.sensor.flushInput()
+        self.sensor.write(self.REQUEST)
+        return self.sensor.read(7)
 
-        Returns
-        -------
-        float : ppm CO2
+    def parse(self, resp, t_utc, t_mono, latency, out=None):
         """
-        # time at start of measurement
-        tnow = time.strftime('%Y-%m-%d-%H:%M:%S', time.localtime())
+        Fill a record from the sensor's response to REQUEST.
 
-        self.sensor.flushInput()
-        msg = b"\xFE\x44\x00\x08\x02\x9F\x25"
-        self.sensor.write(msg)
-        # read measurement from sensor
-        resp = bytes(self.sensor.read(7))
-        high = resp[3]
-        low = resp[4]
-        co2 = (high * 256.) + low
-        self.last_read = [tnow, co2]
-        return [tnow, co2]
+        Parameters
+        ----------
+        resp : bytes
+            Response (7 bytes, fewer if the read timed out).
+        t_utc, t_mono : float
+            Epoch and monotonic time at the start of the request.
+        latency : float
+            Duration of the request (s).
+        out : numpy record
+            Record (of CO2_DTYPE) to fill. If None, a new one is created.
+        """
+        resp = bytes(resp)
+        if len(resp) < 7:
+            # no (or incomplete) response: don't report it as 0 ppm
+            co2 = float('nan')
+            flag = QC_MISSING
+        else:
+            high = resp[3]
+            low = resp[4]
+            co2 = (high * 256.) + low
+            flag = 0 if modbus_crc(resp[:5]) == resp[5:7] else QC_COMM
+
+        if out is None:
+            out = new_reading(CO2_DTYPE)
+        out['time'] = t_utc
+        out['t_mono'] = t_mono
+        out['latency'] = latency
+        out['co2'] = co2
+        out['flag'] = flag
+        self.last_read = out
+        return out
 
     def read_multi(self, n, wait=2.):
         """
@@ -112,75 +91,23 @@ class CO2_sensor(object):
 
         Returns
         -------
-        List of ppm CO2 measurements.
+        ReadingBatch of n (time, ppm CO2) records. The batch is
+        reused by the next call to read_multi.
         """
-        out = []
-        for i in range(n):
-            # time at start of measurement
-            out.append(self.read())
-            time.sleep(wait)
-        self.last_read = out
-        return out
+        return SerialDriver.read_multi(self, n, wait)
 
     def write_batch(self, file='CO2.csv'):
         """
         Append CO2 measurements to csv file with timestamp.
 
-        Adds a new lien to file containing: time,[CO2] * n
+        Adds a new line to file containing: time,[CO2] * n
 
         Parameters
         ----------
         file : str
             Path to save file.
-        n : int
-            Number of measurements to make.
-        wait : float
-            Seconds between measurements
-
-        Returns
-        -------
-        None
-        """
-        if not os.path.exists(file):
-            with open(file, 'a+') as f:
-                f.write('# {}# Time,CO2 (ppm)\n'.format(self.label))
-        # construct write_str
-        if isinstance(self.last_read[0], list):
-            Time = [r[0] for r in self.last_read]
-            CO2 = [r[1] for r in self.last_read]
-            CO2str = fmt([Time[0]] + CO2, 1, ',') + '\n'
-        else:
-            Time = self.last_read[0]
-            CO2 = self.last_read[1]
-            CO2str = Time + ',' + fmt(CO2, 1) + '\n'
-        # save and write out_str
-        self.write_str = CO2str
-        with open(file, 'a+') as f:
-            f.write(CO2str)
-        return
-
-    def write(self, path):
-        if not os.path.exists(file):
-            with open(file, 'a+') as f:
-                f.write('# {}# Time,CO2 (ppm)\n'.format(self.label))
-        # construct writing string
-        if isinstance(self.last_read[0], list):
-            out_str = ''
-            for r in self.last_read:
-                out_str += fmt(r, 1, ',') + '\n'
-        else:
-            out_str = fmt(self.last_read, 1, ',') + '\n'
-        # save and write
-        self.write_str = out_str
-        with open(path, 'a+') as f:
-            f.write(out_str)
-
-    def disconnect(self):
-        """
-        Close connection to sensor (shouldn't be necessary).
         """
-        self.sensor.close()
-        return
+        self.write_str = self.write_field(file, 'co2', 'CO2 (ppm)')
 
 
 if __name__ == '__main__':
@@ -191,6 +118,7 @@ if __name__ == '__main__':
     # save 10 measurements
     for i in range(10):
         print('Measurement {}...'.format(i))
-        sens.save_CO2('explot.csv')
+        sens.read()
+        sens.write('explot.csv')
         print('   Done.')
     print('Done')
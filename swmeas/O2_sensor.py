@@ -1,11 +1,17 @@
-import os
 import serial
-import time
-from builtins import range  # for python 2/3 compatability
-from .helpers import fmt, portscan, find_sensor, get_sensor_name
+from .helpers import RowEncoder
+from .oxygen import O2_MODES, RAW_O2_UNITS
+from .records import O2_DTYPE, O2_FIELDS, new_reading
+from .qc import QC_MISSING, QC_STATUS
+from .driver import SerialDriver, register
+from . import clock
 
+raw_encoder = RowEncoder(dec=1)
+batch_encoder = RowEncoder(dec=2)
 
-class O2_sensor(object):
+
+@register
+class O2_sensor(SerialDriver):
     """
     Connect to and take measurements from a Piccolo2 Pyro O2 / Temperature meter.
 
@@ -13,50 +19,30 @@ class O2_sensor(object):
     ----------
     ID : str
         The serial number of the Sensor.
+    port : str
+        The sensor's port, if known.
+    connect : bool
+        If False, the sensor isn't connected. Used to write
+        readings taken elsewhere (e.g. in a worker process).
     """
-
-    def __init__(self, ID=None, port=None, name=''):
-        self.ID = ID
-        self.port = port
-        self.name = name
-        self.connect()
-
-    def connect(self):
+    STYPE = 'TempO2'
+    DTYPE = O2_DTYPE
+    HEADER = 'time (UTC),' + ','.join(O2_FIELDS)
+    ENCODER = raw_encoder
+    SERIAL = {'baudrate': 19200,
+              'parity': serial.PARITY_NONE,
+              'stopbits': serial.STOPBITS_ONE,
+              'bytesize': serial.EIGHTBITS,
+              'timeout': 1}
+
+    def __init__(self, ID=None, port=None, name='', connect=True):
+        self.powered = False
+        SerialDriver.__init__(self, ID, port, name, connect)
+
+    def setup(self):
         """
-        Connects to O2 Sensor identified by Serial Number.
+        Get the device version, and power up the meter.
         """
-        if self.port is not None:
-            p = portscan(self.port)
-            if p is not None:
-                self.port = p.device
-                self.ID = p.serial_number
-                self.name = get_sensor_name(self.ID)
-            else:
-                raise serial.SerialException("Can't find port: {}".format(self.port))
-        elif self.ID is not None:
-            p = portscan(self.ID)
-            if p is not None:
-                self.port = p.device
-                self.ID = p.serial_number
-                self.name = get_sensor_name(self.ID)
-            else:
-                raise serial.SerialException("Can't find port with ID: {}".format(self.ID))
-        else:
-            self.ID, self.name, self.port = find_sensor('TempO2')
-
-        self.label = "TempO2 sensor {} ({}) on port {}\n".format(self.name, self.ID, self.port)
-        print("\n" + '*' * len(self.label) + '\n' +
-              self.label)
-
-        # open serial
-        self.sensor = serial.Serial(self.port,
-                                    baudrate=19200,
-                                    parity=serial.PARITY_NONE,
-                                    stopbits=serial.STOPBITS_ONE,
-                                    bytesize=serial.EIGHTBITS,
-                                    timeout=1)
-
-        # Get device version
         self.sensor.write("#VERS\r")
         self.VERSION = self.sensor.readline().rstrip()
         print('  Version: {}'.format(self.VERSION))
@@ -64,10 +50,7 @@ class O2_sensor(object):
         # turn on power to CO2 Sensor
         self.power_on()
 
-        print('*' * len(self.label) + '\n')
-        return
-
-    def read(self, P=1013000, S=35000):
+    def read(self, P=1013000, S=35000, out=None):
         """
         Measure variables from sensor
 
@@ -77,11 +60,13 @@ class O2_sensor(object):
             Pressure in ubar (for gas readings).
         S : int
             Salinity in mg/L (for liquid readings).
+        out : numpy record
+            Record (of O2_DTYPE) to fill. If None, a new one is created.
 
         Returns
         -------
-        List of:
-            0: Time at start of measurement
+        Record of:
+            0: Time at start of measurement (UTC epoch seconds)
             1: status
             2: dphi (m)
             3: umolar (nmol / L, liquid only)
@@ -95,10 +80,17 @@ class O2_sensor(object):
             11: humidity (not returned)
             12: resistorTemp (mOhm (uV))
             13: percentO2 (e-3 %O2)
+            14: t_mono (monotonic clock at start of measurement)
+            15: latency (duration of the measurement, s)
+            16: flag (QC_MISSING for an incomplete response, QC_STATUS
+                for a non-zero status; see swmeas.qc)
         """
-        # get time at start of measurement
-        tnow = time.strftime('%Y-%m-%d-%H:%M:%S', time.localtime())
+        return SerialDriver.read(self, out=out, P=P, S=S)
 
+    def transact(self, P=1013000, S=35000):
+        """
+        Measure temperature and O2, and return the 'RAL 1' response.
+        """
         # measure Temp
         self.sensor.write('TMP 1\r')
         self.sensor.readline()
@@ -118,14 +110,60 @@ class O2_sensor(object):
 
         # read all results
         self.sensor.write('RAL 1\r')
-        res = self.sensor.readline()
+        return self.sensor.readline()
 
+    def parse(self, res, t_utc, t_mono, latency, out=None):
+        """
+        Fill a record from the meter's response to 'RAL 1'.
+
+        Parameters
+        ----------
+        res : str
+            Response line.
+        t_utc, t_mono : float
+            Epoch and monotonic time at the start of the measurement.
+        latency : float
+            Duration of the measurement (s).
+        out : numpy record
+            Record (of O2_DTYPE) to fill. If None, a new one is created.
+        """
         # format data
         res = res.replace('RAL 1 ', '').rstrip()
-        res = [int(r) for r in res.split(' ')]
+        try:
+            res = [int(r) for r in res.split(' ')]
+        except ValueError:
+            res = []
+        flag = 0
+        if len(res) < len(O2_FIELDS):
+            # incomplete response: leave no stale values behind
+            res = res + [float('nan')] * (len(O2_FIELDS) - len(res))
+            flag |= QC_MISSING
+        elif res[0] != 0:
+            flag |= QC_STATUS
+
+        if out is None:
+            out = new_reading(O2_DTYPE)
+        out['time'] = t_utc
+        out['t_mono'] = t_mono
+        out['latency'] = latency
+        out['flag'] = flag
+        for f, r in zip(O2_FIELDS, res):
+            out[f] = r
+        self.last_read = out
+        return out
 
-        self.last_read = [tnow] + res
-        return [tnow] + res
+    def status(self, P=1013000, S=35000):
+        """
+        Take a measurement and return only the meter's status (0 when
+        ready), or None if it did not respond. Unlike `read`, the
+        measurement is not kept as a reading: last_read, stats and
+        traces are left alone. Used to poll the meter as it warms up.
+        """
+        res = self.transact(P, S).replace('RAL 1 ', '').split(' ')
+        try:
+            return int(res[0])
+        except ValueError:
+            return None
 
     def read_multi(self, n, wait=1., P=1013000, S=35000):
         """
@@ -144,7 +182,8 @@ class O2_sensor(object):
 
         Returns
         -------
-        An list of n items, each containing 14 variables:
+        ReadingBatch of n records (reused by the next call to
+        read_multi), each containing 14 variables:
             0: Time at start of measurement
             1: status
             2: dphi (m)
@@ -160,12 +199,7 @@ class O2_sensor(object):
             12: resistorTemp (mOhm (uV))
             13: percentO2 (e-3 %O2)
         """
-        out = []
-        for i in range(n):
-            out.append(self.read(P=P, S=S))
-            time.sleep(wait)
-        self.last_read = out
-        return out
+        return SerialDriver.read_multi(self, n, wait, P=P, S=S)
 
     def write_TempO2_batch(self, Tpath='Temp.csv', O2path='O2.csv', mode='water'):
         """
@@ -176,106 +210,70 @@ class O2_sensor(object):
         mode : str
             'air' or 'water' - switches output between percentO2 and umol/L
         """
-        if mode == 'water':
-            o2ind = 3
-            o2unit = 'umol/L'
-        elif mode == 'air':
-            o2ind = 13
-            o2unit = '% O2'
-        else:
+        if mode not in O2_MODES:
             raise ValueError("mode must be either 'water' or 'air'")
-        # create headers, if files don't exist
-        if not os.path.exists(Tpath):
-            with open(Tpath, 'a+') as f:
-                f.write('# {}# Time,Temperature (C)\n'.format(self.label))
-        if not os.path.exists(O2path):
-            with open(O2path, 'a+') as f:
-                f.write('# {}# Time,O2 ({}, {})\n'.format(self.label, mode, o2unit))
-        # construct write strings
-        if isinstance(self.last_read[0], list):
-            Time = [r[0] for r in self.last_read]
-            Temp = [r[6] / 1000. for r in self.last_read]
-            O2 = [r[o2ind] / 1000. for r in self.last_read]
-            Tstr = fmt([Time[0]] + Temp, 2, ',') + '\n'
-            # Time[0] + ',' + ','.join(['{:.2f}'.format(t) for t in Temp]) + '\n'
-            O2str = fmt([Time[0]] + O2, 2, ',') + '\n'
-            # Time[0] + ',' + ','.join(['{:.2f}'.format(o) for o in O2]) + '\n'
-        else:
-            Time = [self.last_read[0] / 1000.]
-            Temp = [self.last_read[6] / 1000.]
-            O2 = [self.last_read[13] / 1000.]
-            Tstr = fmt(Time + Temp, 2, ',') + '\n'
-            # Time + ',' + ','.join(['{:.2f}'.format(t) for t in Temp]) + '\n'
-            O2str = fmt(Time + O2, 2, ',') + '\n'
-            # Time + ',' + ','.join(['{:.2f}'.format(o) for o in O2]) + '\n'
-
-        # write and save data
+        field = O2_MODES[mode]
+        Tstr = self.write_field(Tpath, 'tempSample', 'Temperature (C)',
+                                RAW_O2_UNITS['tempSample'][0], batch_encoder)
+        O2str = self.write_field(O2path, field, 'O2 ({}, {})'.format(mode, RAW_O2_UNITS[field][1]),
+                                 RAW_O2_UNITS[field][0], batch_encoder)
         self.write_str = 'Temp: ' + Tstr + 'O2: ' + O2str
-        with open(Tpath, 'a+') as tf:
-            tf.write(Tstr)
-        with open(O2path, 'a+') as of:
-            of.write(O2str)
         return
 
-    def write(self, path):
-        """
-        Write last read data to file.
-        """
-        # if file doesn't already exist, write column names in a header
-        if not os.path.exists(path):
-            with open(path, 'a+') as f:
-                f.write('# {}# time,status,dphi,umolar,mbar,airSat,tempSample,tempCase,signalIntensity,ambientLight,pressure,humidity,resistorTemp,percentO2\n'.format(self.label))
-        # generate out_str
-        if isinstance(self.last_read[0], list):
-            out_str = ''
-            for r in self.last_read:
-                out_str += fmt(r, 1, ',') + '\n'
-        else:
-            out_str = fmt(self.last_read, 1, ',') + '\n'
-        # write and save data
-        self.write_str = out_str
-        with open(path, 'a+') as f:
-            f.write(out_str)
-        return
-
-    def power_off(self):
+    def power_off(self, verbose=True):
         """
         Turn off the power to the meter (saves power).
+
+        Returns
+        -------
+        bool : True if the meter confirmed power-off.
         """
-        print('Powering down O2 Meter ({})...'.format(self.ID))
+        if verbose:
+            print('Powering down O2 Meter ({})...'.format(self.ID))
         self.sensor.write("#PDWN\r")
         off_status = self.sensor.readline()
 
         if 'PDWN' in off_status:
-            print('  Power Off.')
+            self.powered = False
+            if verbose:
+                print('  Power Off.')
+            return True
         elif 'ERR' in off_status:
             print('Power-off error: {}'.format(off_status.rstrip()))
         else:
             print('Something went wrong during power-off.\n  -> Sensor returned {}'.format(off_status))
-        return
+        return False
 
-    def power_on(self, wait=0.2):
+    def power_on(self, wait=0.2, verbose=True):
         """
         Tun on the power to the meter.
+
+        Returns
+        -------
+        bool : True if the meter confirmed power-on.
         """
-        print('Powering up O2 Meter ({})...'.format(self.ID))
+        if verbose:
+            print('Powering up O2 Meter ({})...'.format(self.ID))
         self.sensor.write("#PWUP\r")
         on_status = self.sensor.readline()
-        time.sleep(wait)
+        clock.sleep(wait)
 
         if 'PWUP' in on_status:
-            print('  Ready!')
+            self.powered = True
+            if verbose:
+                print('  Ready!')
+            return True
         elif 'ERR' in on_status:
             print('Power-on error: {}'.format(on_status.rstrip()))
         else:
             print('Something went wrong during power-on.\n  -> Sensor returned {}'.format(on_status))
-        return
+        return False
 
 
 if __name__ == '__main__':
 
     sens = O2_sensor()
 
-    print(sens.read_multi_Sensor(3, wait=.1))
+    print(sens.read_multi(3, wait=.1).array)
 
     sens.disconnect()
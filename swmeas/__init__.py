@@ -1,5 +1,15 @@
 from .CO2_sensor import *
 from .O2_sensor import *
-from .plots import liveplot
 from .logger import *
-from .helpers import edit_par
\ No newline at end of file
+from .helpers import edit_par
+
+
+def liveplot(*args, **kwargs):
+    """
+    Live plot of logged files. See `swmeas.plots.liveplot`.
+
+    matplotlib is only imported when this is called, so headless
+    loggers don't pay for it.
+    """
+    from .plots import liveplot
+    return liveplot(*args, **kwargs)
@@ -0,0 +1,110 @@
+import os
+from collections import deque
+import numpy as np
+
+from .records import format_time
+
+
+class AdaptiveSampler(object):
+    """
+    Adjust the logging interval to the variability of the signal.
+
+    The interval is divided by `factor` whenever the within-batch
+    standard deviation or the rate of change of recent batch means
+    (least-squares slope) exceeds its threshold. After
+    `calm` consecutive quiet batches it is multiplied by `factor`.
+    The interval always stays within [min_interval, max_interval].
+    Only the interval adapts: the number of readings per batch (n) and
+    the time between them (wait) stay as set.
+
+    Parameters
+    ----------
+    interval : float
+        Starting interval (seconds).
+    min_interval, max_interval : float
+        Bounds of the interval (seconds).
+    std_threshold : float
+        Standard deviation (signal units) above which the signal is
+        considered active. None disables the check.
+    rate_threshold : float
+        Rate of change (signal units per minute) above which the signal
+        is considered active. None disables the check. At least one
+        of std_threshold and rate_threshold must be given.
+    window : int
+        Number of batch means used to calculate the rate of change.
+    factor : float
+        Multiplier applied when changing the interval.
+    calm : int
+        Number of quiet batches before the interval is increased.
+    """
+
+    def __init__(self, interval=30, min_interval=10, max_interval=600,
+                 std_threshold=None, rate_threshold=None, window=3,
+                 factor=2., calm=3):
+        if std_threshold is None and rate_threshold is None:
+            # the signal would never be active, and the interval would
+            # only ever grow to max_interval
+            raise ValueError('At least one of std_threshold and rate_threshold must be given.')
+        self.interval = float(interval)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.std_threshold = std_threshold
+        self.rate_threshold = rate_threshold
+        self.factor = float(factor)
+        self.calm = calm
+        self.history = deque(maxlen=window)
+        self.quiet = 0
+        self.std = np.nan
+        self.rate = np.nan
+
+    def update(self, t, values):
+        """
+        Update the interval with a new batch of readings.
+
+        Parameters
+        ----------
+        t : array_like
+            Epoch times of the readings.
+        values : array_like
+            Signal values of the readings.
+
+        Returns
+        -------
+        float : the new interval (seconds).
+        """
+        t = np.asarray(t, dtype=float)
+        values = np.asarray(values, dtype=float)
+        ok = ~np.isnan(values)
+        if ok.sum() == 0:
+            return self.interval
+        self.history.append((np.mean(t[ok]), np.mean(values[ok])))
+
+        h = np.array(self.history)
+        self.std = np.std(values[ok])
+        if len(h) > 1 and np.ptp(h[:, 0]) > 0:
+            self.rate = abs(np.polyfit(h[:, 0] - h[0, 0], h[:, 1], 1)[0]) * 60.
+        else:
+            self.rate = np.nan
+
+        active = ((self.std_threshold is not None and self.std > self.std_threshold) or
+                  (self.rate_threshold is not None and self.rate > self.rate_threshold))
+        if active:
+            self.quiet = 0
+            self.interval = max(self.min_interval, self.interval / self.factor)
+        else:
+            self.quiet += 1
+            if self.quiet >= self.calm:
+                self.quiet = 0
+                self.interval = min(self.max_interval, self.interval * self.factor)
+        return self.interval
+
+    def write(self, path, t, n, wait):
+        """
+        Append the current sampling settings to a csv file.
+        """
+        if not os.path.exists(path):
+            with open(path, 'a+') as f:
+                f.write('# Adaptive sampling\n# Time (UTC),interval (s),n,wait (s),std,rate (per min)\n')
+        with open(path, 'a+') as f:
+            f.write('{},{:.1f},{:d},{:.2f},{:.3f},{:.3f}\n'.format(
+                format_time(t), self.interval, n, wait, self.std, self.rate))
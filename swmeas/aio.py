@@ -0,0 +1,243 @@
+"""
+asyncio versions of the sensor drivers.
+
+A single event loop can service many sensors at once: while one sensor
+is measuring, the loop reads from the others. Serial ports are read
+without blocking (the loop watches their file descriptors), and LabJack
+calls, which can only block, run in a per-device executor thread.
+
+    import asyncio
+    from swmeas.aio import AsyncCO2_sensor, AsyncO2_sensor, read_all
+
+    sensors = [AsyncCO2_sensor(ID='FTHBSQZ9'), AsyncO2_sensor()]
+    batches = asyncio.run(read_all(sensors, n=5, wait=1.))
+
+Every request has a timeout, after which the reading is recorded as
+missing (see `swmeas.qc`), and reads can be cancelled at any point.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from . import clock
+from .CO2_sensor import CO2_sensor
+from .O2_sensor import O2_sensor
+from .records import monotonic
+try:
+    from .pH_sensor import pH_sensor
+except ImportError:  # LabJackPython not installed
+    pH_sensor = None
+
+
+class AsyncSerial(object):
+    """
+    Non-blocking reads and writes on an open serial.Serial port.
+
+    On POSIX the event loop is woken when the port's file descriptor
+    is readable, and only the bytes already waiting are read. Ports
+    without a file descriptor are read in the loop's default executor
+    instead. The port's own timeout is left as it is, so the blocking
+    methods of the driver (e.g. `O2_sensor.power_on`) still work.
+
+    Parameters
+    ----------
+    ser : serial.Serial
+        An open port.
+    """
+
+    def __init__(self, ser):
+        self.serial = ser
+        self.buffer = bytearray()
+        try:
+            self.fd = ser.fileno()
+        except (AttributeError, IOError, OSError, ValueError):
+            self.fd = None
+
+    def flush_input(self):
+        """
+        Discard any unread input.
+        """
+        self.buffer = bytearray()
+        self.serial.reset_input_buffer()
+
+    def write(self, data):
+        """
+        Write a (short) request. Requests fit in the OS buffer, so this
+        returns immediately.
+        """
+        self.serial.write(data)
+
+    async def _fill(self):
+        loop = asyncio.get_running_loop()
+        if self.fd is None:
+            chunk = await loop.run_in_executor(None, self.serial.read, 1)
+        else:
+            ready = loop.create_future()
+
+            def wake():
+                if not ready.done():
+                    ready.set_result(None)
+            loop.add_reader(self.fd, wake)
+            try:
+                await ready
+            finally:
+                loop.remove_reader(self.fd)
+            # nothing may be waiting after a spurious wake-up, and
+            # read(0) returns at once, whatever the port's timeout
+            chunk = self.serial.read(self.serial.in_waiting)
+        self.buffer += chunk
+
+    async def _until(self, done, timeout):
+        try:
+            await asyncio.wait_for(self._read_until(done), timeout)
+        except asyncio.TimeoutError:
+            pass
+        end = done(self.buffer) or len(self.buffer)
+        out = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return out
+
+    async def _read_until(self, done):
+        while not done(self.buffer):
+            await self._fill()
+
+    async def read(self, n, timeout=1.):
+        """
+        Read n bytes. Returns fewer if timeout (s) expires first.
+        """
+        return await self._until(lambda b: n if len(b) >= n else 0, timeout)
+
+    async def readline(self, eol=b'\r', timeout=1.):
+        """
+        Read up to and including eol. Returns the incomplete line if
+        timeout (s) expires first.
+        """
+        return await self._until(lambda b: b.find(eol) + len(eol) if eol in b else 0, timeout)
+
+
+class AsyncDriver(object):
+    """
+    Mixin giving a driver (see `swmeas.driver`) asyncio `read` and
+    `read_multi`. Drivers implement `atransact(timeout, **kwargs)`,
+    the async counterpart of `transact`.
+    """
+
+    async def read(self, out=None, timeout=1., **kwargs):
+        """
+        Take a single reading. See `Driver.read`.
+
+        timeout : float
+            Seconds to wait for each response. A request that gets no
+            response is recorded as missing (QC_MISSING).
+        """
+        t_mono = monotonic()
+        t_utc = clock.time()
+        try:
+            resp = await self.atransact(timeout, **kwargs)
+        except asyncio.TimeoutError:
+            out = self.missing(t_utc, t_mono, monotonic() - t_mono, out)
+        else:
+            out = self.parse(resp, t_utc, t_mono, monotonic() - t_mono, out)
+        return self._record(out)
+
+    async def read_multi(self, n, wait=1., timeout=1., **kwargs):
+        """
+        Take n readings, wait seconds apart. See `Driver.read_multi`.
+        """
+        self.batch.reset(n)
+        for i in range(n):
+            await self.read(out=self.batch.next(), timeout=timeout, **kwargs)
+            await asyncio.sleep(wait)
+        self.last_read = self.batch
+        return self.batch
+
+
+class AsyncCO2_sensor(AsyncDriver, CO2_sensor):
+    """
+    K-30 CO2 sensor with asyncio `read` and `read_multi`.
+
+    See `CO2_sensor` for parameters.
+    """
+
+    def connect(self):
+        CO2_sensor.connect(self)
+        self.transport = AsyncSerial(self.sensor)
+
+    async def atransact(self, timeout=.5):
+        self.transport.flush_input()
+        self.transport.write(self.REQUEST)
+        return await self.transport.read(7, timeout)
+
+
+class AsyncO2_sensor(AsyncDriver, O2_sensor):
+    """
+    Piccolo2 O2 / Temperature meter with asyncio `read` and `read_multi`.
+
+    P and S (see `O2_sensor.read`) are passed as keyword arguments.
+    See `O2_sensor` for parameters.
+    """
+
+    def connect(self):
+        O2_sensor.connect(self)
+        self.transport = AsyncSerial(self.sensor)
+
+    async def command(self, cmd, timeout=1.):
+        """
+        Send a command, and return the meter's response line.
+        """
+        self.transport.write(cmd.encode('ascii'))
+        resp = await self.transport.readline(b'\r', timeout)
+        return resp.decode('ascii', 'replace')
+
+    async def atransact(self, timeout=1., P=1013000, S=35000):
+        self.transport.flush_input()
+        await self.command('TMP 1\r', timeout)
+        await self.command('ENV 1 -300000 {:.0f} {:.0f} \r'.format(P, S), timeout)
+        await self.command('MSR 1\r', timeout)
+        return await self.command('RAL 1\r', timeout)
+
+
+if pH_sensor is not None:
+    class AsyncpH_sensor(AsyncDriver, pH_sensor):
+        """
+        Durafit pH probe (LabJack U6) with asyncio `read` and `read_multi`.
+
+        LabJack calls block, so they run in a single thread dedicated
+        to the device. A read that times out is recorded as missing
+        (QC_MISSING). Timed-out or cancelled calls are abandoned, but
+        finish in their thread.
+
+        See `pH_sensor` for parameters.
+        """
+
+        def connect(self):
+            pH_sensor.connect(self)
+            self.executor = ThreadPoolExecutor(1)
+
+        async def atransact(self, timeout=2.):
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self.transact), timeout)
+
+        def disconnect(self):
+            self.executor.shutdown(wait=False)
+            pH_sensor.disconnect(self)
+
+
+async def read_all(sensors, n=5, wait=1., **kwargs):
+    """
+    Read a batch from each sensor, concurrently.
+
+    Parameters
+    ----------
+    sensors : list
+        Async sensor objects.
+    n, wait :
+        Passed to each sensor's read_multi.
+
+    Returns
+    -------
+    list of ReadingBatch, in the order of sensors. A sensor that fails
+    returns its exception instead, without affecting the others.
+    """
+    return await asyncio.gather(*[s.read_multi(n, wait, **kwargs) for s in sensors],
+                                return_exceptions=True)
@@ -0,0 +1,275 @@
+"""
+Vectorized seawater carbonate system calculations.
+
+All functions accept scalars or NumPy arrays, and broadcast over them.
+Units are umol/kg (DIC, TA, ions), uatm (pCO2, fCO2), degrees C and
+practical salinity. pH is on the total scale. Calculations are for
+surface pressure, and alkalinity includes carbonate, borate and water
+contributions only.
+
+Constants
+---------
+K0 : Weiss (1974)
+K1, K2 : Lueker et al. (2000)
+KB : Dickson (1990)
+Kw : Millero (1995)
+Total boron : Uppstrom (1974)
+Ksp (calcite, aragonite) : Mucci (1983)
+Calcium : Riley & Tongudai (1967)
+"""
+import numpy as np
+
+R = 8.31446  # J / mol / K
+F = 96485.33  # C / mol
+
+PARAMETERS = ('pH', 'pCO2', 'fCO2', 'DIC', 'TA')
+
+
+def constants(T, S):
+    """
+    Equilibrium constants (mol/kg) at temperature T (C) and salinity S.
+
+    Returns
+    -------
+    dict
+        K0, K1, K2, KB, Kw, BT, Ca, KspC, KspA
+    """
+    TK = np.asarray(T, dtype=float) + 273.15
+    S = np.asarray(S, dtype=float)
+    sqS = np.sqrt(S)
+    lnTK = np.log(TK)
+    T100 = TK / 100.
+
+    K = {}
+    K['K0'] = np.exp(-60.2409 + 93.4517 / T100 + 23.3585 * np.log(T100) +
+                     S * (0.023517 - 0.023656 * T100 + 0.0047036 * T100 ** 2))
+    K['K1'] = 10 ** -(3633.86 / TK - 61.2172 + 9.6777 * lnTK -
+                      0.011555 * S + 0.0001152 * S ** 2)
+    K['K2'] = 10 ** -(471.78 / TK + 25.929 - 3.16967 * lnTK -
+                      0.01781 * S + 0.0001122 * S ** 2)
+    K['KB'] = np.exp((-8966.90 - 2890.53 * sqS - 77.942 * S + 1.728 * S ** 1.5 - 0.0996 * S ** 2) / TK +
+                     148.0248 + 137.1942 * sqS + 1.62142 * S -
+                     (24.4344 + 25.085 * sqS + 0.2474 * S) * lnTK +
+                     0.053105 * sqS * TK)
+    K['Kw'] = np.exp(148.9802 - 13847.26 / TK - 23.6521 * lnTK +
+                     (-5.977 + 118.67 / TK + 1.0495 * lnTK) * sqS - 0.01615 * S)
+    K['BT'] = 0.000416 * S / 35.
+    K['Ca'] = 0.01028 * S / 35.
+    K['KspC'] = 10 ** (-171.9065 - 0.077993 * TK + 2839.319 / TK + 71.595 * np.log10(TK) +
+                       (-0.77712 + 0.0028426 * TK + 178.34 / TK) * sqS -
+                       0.07711 * S + 0.0041249 * S ** 1.5)
+    K['KspA'] = 10 ** (-171.945 - 0.077993 * TK + 2903.293 / TK + 71.595 * np.log10(TK) +
+                       (-0.068393 + 0.0017276 * TK + 88.135 / TK) * sqS -
+                       0.10018 * S + 0.0059415 * S ** 1.5)
+    return K
+
+
+def fugacity_factor(T, P=1.):
+    """
+    Ratio fCO2 / pCO2 (Weiss, 1974).
+
+    Parameters
+    ----------
+    T : array_like
+        Temperature (C).
+    P : array_like
+        Total pressure (atm).
+    """
+    TK = np.asarray(T, dtype=float) + 273.15
+    B = (-1636.75 + 12.0408 * TK - 3.27957e-2 * TK ** 2 + 3.16528e-5 * TK ** 3) * 1e-6
+    delta = (57.7 - 0.118 * TK) * 1e-6
+    return np.exp((B + 2 * delta) * np.asarray(P) * 101325. / (R * TK))
+
+
+def vapour_pressure(T, S):
+    """
+    Water vapour pressure over seawater, in atm (Weiss & Price, 1980).
+    """
+    TK = np.asarray(T, dtype=float) + 273.15
+    return np.exp(24.4543 - 67.4509 * (100. / TK) - 4.8489 * np.log(TK / 100.) -
+                  0.000544 * np.asarray(S))
+
+
+def pCO2_from_xCO2(xCO2, T, S, P=1.):
+    """
+    Convert a dry-air mole fraction (ppm, e.g. from the K-30)
+    to water-saturated pCO2 (uatm) at total pressure P (atm).
+    """
+    return np.asarray(xCO2, dtype=float) * (np.asarray(P) - vapour_pressure(T, S))
+
+
+def pH_from_voltage(V, T, E0, slope=1.):
+    """
+    Convert a pH electrode voltage to pH with a Nernstian response.
+
+    Parameters
+    ----------
+    V : array_like
+        Electrode voltage (V).
+    T : array_like
+        Temperature (C).
+    E0 : float
+        Calibrated standard potential (V).
+    slope : float
+        Fraction of the theoretical Nernst slope.
+    """
+    TK = np.asarray(T, dtype=float) + 273.15
+    return (E0 - np.asarray(V, dtype=float)) / (slope * R * TK * np.log(10) / F)
+
+
+def _alk(H, CO2, K):
+    """
+    Total alkalinity (mol/kg) from [H+] and [CO2*].
+    """
+    HCO3 = CO2 * K['K1'] / H
+    CO3 = HCO3 * K['K2'] / H
+    return HCO3 + 2 * CO3 + K['BT'] * K['KB'] / (K['KB'] + H) + K['Kw'] / H - H
+
+
+def _solve_H(fn, target, shape, iterations=60):
+    """
+    Vectorized bisection for [H+] where fn(H) == target.
+
+    fn must decrease monotonically with H. Searches pH 2 - 12.
+    """
+    lo = np.full(shape, 2.)  # pH bounds
+    hi = np.full(shape, 12.)
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        above = fn(10 ** -mid) > target
+        # alkalinity too high -> [H+] too low -> pH too high
+        hi = np.where(above, mid, hi)
+        lo = np.where(above, lo, mid)
+    return 10 ** -((lo + hi) / 2)
+
+
+def carbonate_system(par1, par2, type1, type2, T=25., S=35., P=1.):
+    """
+    Calculate the carbonate system from any two parameters.
+
+    Parameters
+    ----------
+    par1, par2 : array_like
+        Values of the two known parameters.
+    type1, type2 : str
+        Names of the known parameters: any two of 'pH', 'pCO2',
+        'fCO2', 'DIC' and 'TA' ('pCO2' and 'fCO2' can't be combined).
+    T : array_like
+        Temperature (C).
+    S : array_like
+        Salinity.
+    P : array_like
+        Total (atmospheric) pressure (atm), for fCO2 <-> pCO2.
+
+    Returns
+    -------
+    dict of arrays
+        pH, pCO2, fCO2, DIC, TA, CO2, HCO3, CO3 (umol/kg),
+        OmegaC, OmegaA
+    """
+    for t in (type1, type2):
+        if t not in PARAMETERS:
+            raise ValueError("Unknown parameter '{}'. Must be one of {}".format(t, PARAMETERS))
+    known = {type1: par1, type2: par2}
+    if len(known) != 2 or set(known) == {'pCO2', 'fCO2'}:
+        raise ValueError('Two independent parameters are required.')
+
+    arrays = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in
+                                   (par1, par2, T, S, P)])
+    known = {type1: arrays[0], type2: arrays[1]}
+    T, S, P = arrays[2:]
+    shape = T.shape
+    K = constants(T, S)
+    ff = fugacity_factor(T, P)
+
+    if 'pCO2' in known:
+        known['fCO2'] = known.pop('pCO2') * ff
+
+    # everything below in mol/kg and atm
+    CO2 = H = None
+    if 'fCO2' in known:
+        CO2 = K['K0'] * known['fCO2'] * 1e-6
+    if 'pH' in known:
+        H = 10 ** -known['pH']
+    DIC = known['DIC'] * 1e-6 if 'DIC' in known else None
+    TA = known['TA'] * 1e-6 if 'TA' in known else None
+
+    if H is None:
+        if CO2 is not None and DIC is not None:
+            a = DIC / CO2 - 1
+            H = (K['K1'] + np.sqrt(K['K1'] ** 2 + 4 * a * K['K1'] * K['K2'])) / (2 * a)
+        elif CO2 is not None:
+            H = _solve_H(lambda h: _alk(h, CO2, K), TA, shape)
+        else:
+            def ta_dic(h):
+                co2 = DIC / (1 + K['K1'] / h + K['K1'] * K['K2'] / h ** 2)
+                return _alk(h, co2, K)
+            H = _solve_H(ta_dic, TA, shape)
+
+    if CO2 is None:
+        if DIC is not None:
+            CO2 = DIC / (1 + K['K1'] / H + K['K1'] * K['K2'] / H ** 2)
+        else:
+            carb_alk = TA - K['BT'] * K['KB'] / (K['KB'] + H) - K['Kw'] / H + H
+            CO2 = carb_alk / (K['K1'] / H + 2 * K['K1'] * K['K2'] / H ** 2)
+
+    HCO3 = CO2 * K['K1'] / H
+    CO3 = HCO3 * K['K2'] / H
+    fCO2 = CO2 / K['K0'] * 1e6
+
+    out = {'pH': -np.log10(H),
+           'fCO2': fCO2,
+           'pCO2': fCO2 / ff,
+           'DIC': (CO2 + HCO3 + CO3) * 1e6,
+           'TA': _alk(H, CO2, K) * 1e6,
+           'CO2': CO2 * 1e6,
+           'HCO3': HCO3 * 1e6,
+           'CO3': CO3 * 1e6,
+           'OmegaC': K['Ca'] * CO3 / K['KspC'],
+           'OmegaA': K['Ca'] * CO3 / K['KspA']}
+    return out
+
+
+class CarbonateStage(object):
+    """
+    Live carbonate system calculation on merged log data.
+
+    Wraps a `swmeas.merge.MergeEngine`. Each call to `update` merges
+    newly logged data and returns the carbonate system for the new rows.
+
+    Parameters
+    ----------
+    engine : MergeEngine
+        Must provide 'CO2' (K-30 ppm) and 'Temp' columns.
+    second : tuple
+        (type, value) of the second carbonate parameter, e.g.
+        ('TA', 2300.), or ('pH', column_name) to use a merged column.
+    S : float
+        Salinity.
+    P : float
+        Atmospheric pressure (atm).
+    """
+
+    def __init__(self, engine, second=('TA', 2300.), S=35., P=1.):
+        self.engine = engine
+        self.second = second
+        self.S = S
+        self.P = P
+
+    def __call__(self, t, values):
+        cols = self.engine.columns
+        T = values[:, cols.index('Temp')]
+        pCO2 = pCO2_from_xCO2(values[:, cols.index('CO2')], T, self.S, self.P)
+        stype, sval = self.second
+        if isinstance(sval, str):
+            sval = values[:, cols.index(sval)]
+        return carbonate_system(pCO2, sval, 'pCO2', stype, T, self.S, self.P)
+
+    def update(self):
+        """
+        Returns
+        -------
+        (t, dict of arrays) : tuple
+        """
+        t, values = self.engine.update()
+        return t, self(t, values)
@@ -0,0 +1,356 @@
+"""
+Command line interface.
+
+    swmeas log CO2 --data-dir ./log_data --interval 30
+    swmeas log TempO2 --mode air --dashboard 0.0.0.0:8080
+    swmeas log CO2bus --port /dev/ttyUSB0 --addresses 104 105 106
+    swmeas log pH --probes tank1=2,0 tank2=3,1 --qc
+    swmeas log Pool --sensors sensors.json
+    swmeas log auto --auto-mode TempO2 --path ./log_data
+    swmeas index log_data/*/co2.csv
+    swmeas reprocess ./log_data --tasks o2 merge --mode air -j 8
+    swmeas replicate ./log_data http://central:8090/ --node pi-01
+    swmeas collect /data/central --address 0.0.0.0:8090
+    swmeas soak CO2 --days 90 --qc --index
+    swmeas replay ./log_data/co2.trace --data-dir ./replay_data --speed 10
+    swmeas bench
+
+Only the acquisition code is imported, so the logger (re)starts quickly.
+"""
+import os
+import sys
+import json
+import signal
+import argparse
+import subprocess
+
+# modules timed by `swmeas bench`, after a bare interpreter
+BENCH_MODULES = ['swmeas.cli', 'swmeas', 'swmeas.merge', 'swmeas.plots']
+
+# ru_maxrss can carry over the parent's peak through fork/exec on
+# Linux, so the peak RSS of the new process (VmHWM) is used if available
+_BENCH_CODE = """
+import time
+t0 = time.perf_counter()
+import {}
+t = time.perf_counter() - t0
+try:
+    with open('/proc/self/status') as f:
+        rss = [l.split()[1] for l in f if l.startswith('VmHWM')][0]
+except (IOError, IndexError):
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(t, rss)
+"""
+
+
+def startup_benchmark(modules=None, repeat=5):
+    """
+    Time the import of modules, each in a fresh interpreter.
+
+    Parameters
+    ----------
+    modules : list
+        Modules to import. Defaults to BENCH_MODULES.
+    repeat : int
+        Number of interpreters started per module.
+
+    Returns
+    -------
+    list of (module, median import time (s), median wall time of the
+    whole interpreter (s), peak RSS (kB)).
+    """
+    import time
+    if modules is None:
+        modules = BENCH_MODULES
+    out = []
+    for mod in ['sys'] + list(modules):
+        imp, wall, rss = [], [], []
+        for _ in range(repeat):
+            t0 = time.time()
+            res = subprocess.check_output([sys.executable, '-c', _BENCH_CODE.format(mod)])
+            wall.append(time.time() - t0)
+            t, r = res.split()[-2:]
+            imp.append(float(t))
+            rss.append(int(r))
+        imp.sort()
+        wall.sort()
+        out.append((mod, imp[len(imp) // 2], wall[len(wall) // 2], max(rss)))
+    return out
+
+
+# options of `swmeas log` taken by each logger, besides those taken by
+# all but 'auto' (LOG_COMMON)
+LOG_COMMON = ['data_dir', 'interval', 'stop', 'n', 'wait', 'new_folder_every', 'verbose']
+_OUTPUTS = ['publish', 'dashboard', 'ring', 'qc', 'pyramid', 'database', 'index', 'trace']
+LOG_OPTIONS = {'CO2': ['id'] + _OUTPUTS,
+               'CO2bus': ['id', 'port', 'addresses'] + _OUTPUTS,
+               'TempO2': ['id', 'mode'] + _OUTPUTS,
+               'pH': ['probes'] + _OUTPUTS,
+               'Pool': ['mode', 'dashboard', 'sensors', 'processes'],
+               'auto': ['path', 'params', 'auto_mode']}
+
+
+def unsupported_options(args, defaults):
+    """
+    The options of `swmeas log` given in args that its logger doesn't
+    take, i.e. that differ from defaults.
+    """
+    ok = set(LOG_OPTIONS[args.sensor]) | set(['command', 'func', 'sensor'])
+    if args.sensor != 'auto':
+        ok |= set(LOG_COMMON)
+    return ['-n' if k == 'n' else '--' + k.replace('_', '-')
+            for k, v in sorted(vars(args).items()) if k not in ok and v != defaults.get(k)]
+
+
+def _probe(arg):
+    # 'name=pH,temp' -> (name, (pH channel, temperature channel))
+    try:
+        name, channels = arg.split('=')
+        ph, temp = (int(c) for c in channels.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected name=pH channel,temperature channel, "
+                                         "got '{}'".format(arg))
+    return name, (ph, temp)
+
+
+def _terminate(signum, frame):
+    # unwind like Ctrl-C, so the logger closes its outputs
+    sys.exit(128 + signum)
+
+
+def _log(args):
+    from . import logger
+    signal.signal(signal.SIGTERM, _terminate)
+    if args.sensor == 'auto':
+        logger.auto_log(args.auto_mode, path=args.path, param_file=args.params)
+        return
+
+    kwargs = {'data_dir': args.data_dir,
+              'interval': args.interval,
+              'stop': args.stop,
+              'new_folder_every': args.new_folder_every,
+              'verbose': args.verbose}
+    for k in ('n', 'wait', 'publish', 'dashboard', 'ring', 'database', 'trace'):
+        if getattr(args, k) is not None:
+            kwargs[k] = getattr(args, k)
+    if args.sensor == 'CO2bus':
+        if not args.addresses:
+            raise ValueError('--addresses is required to log a CO2bus.')
+        logger.logCO2bus(args.addresses, port=args.port, ID=args.id, qc=args.qc,
+                         pyramid=args.pyramid, index=args.index, **kwargs)
+        return
+    if args.sensor != 'Pool':
+        kwargs.update(qc=args.qc, pyramid=args.pyramid, index=args.index)
+    if args.sensor in ('CO2', 'TempO2'):
+        kwargs['ID'] = args.id
+    if args.sensor in ('TempO2', 'Pool'):
+        kwargs['mode'] = args.mode
+
+    if args.sensor == 'CO2':
+        logger.logCO2(**kwargs)
+    elif args.sensor == 'TempO2':
+        logger.logTempO2(**kwargs)
+    elif args.sensor == 'pH':
+        if args.probes:
+            kwargs['probes'] = args.probes
+        logger.logpH(**kwargs)
+    else:
+        if args.sensors is None:
+            raise ValueError('--sensors is required to log a Pool.')
+        with open(args.sensors, 'r') as f:
+            sensors = json.load(f)
+        logger.logPool(sensors, processes=args.processes, **kwargs)
+
+
+def _index(args):
+    from .timeindex import build
+    for path in args.files:
+        idx = build(path, every=args.every, interval=args.interval)
+        print('{}: {} entries'.format(path, len(idx)))
+
+
+def _reprocess(args):
+    from .reprocess import reprocess
+    options = {'mode': args.mode}
+    if args.freq is not None:
+        options['freq'] = args.freq
+    res = reprocess(args.root, args.tasks, args.jobs, args.check, args.force,
+                    active=args.active, **options)
+    failed = [f for f, status in res.items()
+              if any(v not in ('done', 'skipped', 'no inputs', 'active') for v in status.values())]
+    if failed:
+        print('{} folders failed: re-run to retry them.'.format(len(failed)))
+    return len(failed) > 0
+
+
+def _replicate(args):
+    from .replicate import Agent
+    Agent(args.data_dir, args.target, node=args.node,
+          batch_bytes=args.batch_kb * 1024).run(args.interval, args.stop, verbose=args.verbose)
+
+
+def _collect(args):
+    from .replicate import Collector
+    Collector(args.root).serve(args.address)
+
+
+def _soak(args):
+    from .soak import soak
+    kwargs = {}
+    for k in ('n', 'wait'):
+        if getattr(args, k) is not None:
+            kwargs[k] = getattr(args, k)
+    report = soak(args.sensor, args.days, args.interval, new_folder_every=args.new_folder_every,
+                  data_dir=args.data_dir, keep=args.keep, qc=args.qc, index=args.index,
+                  pyramid=args.pyramid, database=args.database or None, **kwargs)
+    return len(report['problems']) > 0
+
+
+def _replay(args):
+    from .trace import scan, replay
+    if args.info:
+        for key, s in scan(args.trace).items():
+            print('{}: {} responses, {:.0f} s'.format(
+                key, s['count'], (s['t1'] - s['t0']) if s['count'] else 0))
+        return
+    replay(args.trace, args.data_dir, speed=args.speed or None, key=args.sensor,
+           new_folder_every=args.new_folder_every, qc=args.qc, index=args.index,
+           verbose=args.verbose)
+
+
+def _bench(args):
+    res = startup_benchmark(args.modules or None, args.repeat)
+    print('{:20s} {:>10s} {:>10s} {:>10s}'.format('module', 'import (s)', 'total (s)', 'RSS (MB)'))
+    for mod, imp, wall, rss in res:
+        print('{:20s} {:10.3f} {:10.3f} {:10.1f}'.format(mod, imp, wall, rss / 1024.))
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='swmeas', description='Seawater CO2, O2 and Temp logging.')
+    sub = p.add_subparsers(dest='command')
+
+    log = sub.add_parser('log', help='Start logging.')
+    log.add_argument('sensor', choices=['CO2', 'CO2bus', 'TempO2', 'pH', 'Pool', 'auto'],
+                     help="Sensor to log, or 'auto' to use saved parameters.")
+    log.add_argument('--data-dir', default='./log_data/')
+    log.add_argument('--interval', type=float, default=30)
+    log.add_argument('--stop', type=float, default=0, help='Run time (s). 0 runs until interrupted.')
+    log.add_argument('-n', type=int, help='Readings per interval.')
+    log.add_argument('--wait', type=float, help='Time between readings (s).')
+    log.add_argument('--id', help='Sensor ID (serial number).')
+    log.add_argument('--port', help='CO2bus: serial port of the RS-485 line.')
+    log.add_argument('--addresses', type=lambda a: int(a, 0), nargs='+',
+                     help='CO2bus: Modbus addresses of the sensors (e.g. 104 or 0x68).')
+    log.add_argument('--probes', type=_probe, nargs='+',
+                     help='pH: probes as name=pH channel,temperature channel (e.g. a=2,0 b=3,1).')
+    log.add_argument('--mode', default='water', choices=['water', 'air'], help='O2 output mode.')
+    log.add_argument('--new-folder-every', choices=['day', 'hour'])
+    log.add_argument('--publish', help="Publish readings on 'host:port' or a socket path.")
+    log.add_argument('--dashboard', help="Serve a web dashboard on 'host:port'.")
+    log.add_argument('--ring', help='Name of a shared-memory ring buffer.')
+    log.add_argument('--qc', action='store_true', help='Flag readings with the default QC checks.')
+    log.add_argument('--pyramid', action='store_true', help='Keep min/max/mean pyramids.')
+    log.add_argument('--database', help='Also write readings to this SQLite database.')
+    log.add_argument('--index', action='store_true', help='Keep time indices of the data files.')
+    log.add_argument('--trace', help='Record raw sensor responses to this file, for replay.')
+    log.add_argument('--sensors', help='json list of sensors, for Pool.')
+    log.add_argument('--processes', type=int,
+                     help='Pool: maximum number of worker processes (default: one per sensor).')
+    log.add_argument('--path', help="auto: folder to find the parameter file in.")
+    log.add_argument('--params', help="auto: parameter file.")
+    log.add_argument('--auto-mode', default='CO2', choices=['CO2', 'CO2bus', 'TempO2', 'pH', 'Pool'],
+                     help="auto: logger to run.")
+    log.add_argument('-v', '--verbose', action='store_true')
+    log.set_defaults(func=_log)
+
+    index = sub.add_parser('index', help='(Re)build time indices of csv logs.')
+    index.add_argument('files', nargs='+')
+    index.add_argument('--every', type=int, default=100, help='Rows between index entries.')
+    index.add_argument('--interval', type=float, default=600.,
+                       help='Also index the first row of every interval (s).')
+    index.set_defaults(func=_index)
+
+    rep = sub.add_parser('reprocess', help='Re-derive outputs in every dated log folder.')
+    rep.add_argument('root', help='Log folder.')
+    rep.add_argument('--tasks', nargs='+', choices=['o2', 'qc', 'merge', 'index'],
+                     help='Tasks to run (default: all).')
+    rep.add_argument('-j', '--jobs', type=int, help='Worker processes (default: one per CPU).')
+    rep.add_argument('--mode', default='water', help="o2: 'water', 'air' or a raw field name.")
+    rep.add_argument('--freq', type=float, help='merge: output period (s).')
+    rep.add_argument('--check', default='mtime', choices=['mtime', 'hash'],
+                     help='How to detect changed inputs.')
+    rep.add_argument('--force', action='store_true', help='Ignore checkpoints.')
+    rep.add_argument('--active', type=float, default=3600.,
+                     help='Skip folders with raw logs modified this recently (s), as still being '
+                          'logged to. 0 processes them anyway.')
+    rep.set_defaults(func=_reprocess)
+
+    repl = sub.add_parser('replicate', help='Send new log data to a collector.')
+    repl.add_argument('data_dir')
+    repl.add_argument('target', help="Collector URL ('http://host:port/') or folder.")
+    repl.add_argument('--node', help='Name of this logger (default: hostname).')
+    repl.add_argument('--interval', type=float, default=5., help='Time between transfers (s).')
+    repl.add_argument('--batch-kb', type=int, default=1024, help='Maximum size of a transfer (kB).')
+    repl.add_argument('--stop', type=float, default=0, help='Run time (s). 0 runs until interrupted.')
+    repl.add_argument('-v', '--verbose', action='store_true')
+    repl.set_defaults(func=_replicate)
+
+    coll = sub.add_parser('collect', help='Receive replicated log data.')
+    coll.add_argument('root', help='Folder to store the data of each logger in.')
+    coll.add_argument('--address', default='127.0.0.1:8090')
+    coll.set_defaults(func=_collect)
+
+    soak = sub.add_parser('soak', help='Soak test a logger on a simulated sensor, at high speed.')
+    soak.add_argument('sensor', choices=['CO2', 'TempO2'])
+    soak.add_argument('--days', type=float, default=90., help='Virtual time to log for (days).')
+    soak.add_argument('--interval', type=float, default=30)
+    soak.add_argument('-n', type=int, help='Readings per interval.')
+    soak.add_argument('--wait', type=float, help='Time between readings (s).')
+    soak.add_argument('--new-folder-every', default='day', choices=['day', 'hour'])
+    soak.add_argument('--data-dir', help='Log folder (default: a temporary folder).')
+    soak.add_argument('--keep', action='store_true', help='Keep the temporary log folder.')
+    soak.add_argument('--qc', action='store_true')
+    soak.add_argument('--index', action='store_true')
+    soak.add_argument('--pyramid', action='store_true')
+    soak.add_argument('--database', action='store_true', help='Also write to a SQLite database.')
+    soak.set_defaults(func=_soak)
+
+    play = sub.add_parser('replay', help='Replay a recorded trace through the logger.')
+    play.add_argument('trace')
+    play.add_argument('--data-dir', default='./replay_data/')
+    play.add_argument('--speed', type=float, default=0,
+                      help='1 for the recorded speed, 0 (default) for as fast as possible.')
+    play.add_argument('--sensor', help='Sensor (or bus) to replay, if the trace has several.')
+    play.add_argument('--new-folder-every', choices=['day', 'hour'])
+    play.add_argument('--qc', action='store_true')
+    play.add_argument('--index', action='store_true')
+    play.add_argument('--info', action='store_true', help='List the sensors in the trace, and stop.')
+    play.add_argument('-v', '--verbose', action='store_true')
+    play.set_defaults(func=_replay)
+
+    bench = sub.add_parser('bench', help='Measure import times.')
+    bench.add_argument('modules', nargs='*', help='Modules to time (default: {}).'.format(
+        ', '.join(BENCH_MODULES)))
+    bench.add_argument('--repeat', type=int, default=5)
+    bench.set_defaults(func=_bench)
+    return p
+
+
+def main(argv=None):
+    p = parser()
+    args = p.parse_args(argv)
+    if getattr(args, 'func', None) is None:
+        p.print_help()
+        return 1
+    if args.command == 'log':
+        bad = unsupported_options(args, vars(p.parse_args(['log', args.sensor])))
+        if bad:
+            p.error('{} not supported when logging {}'.format(', '.join(bad), args.sensor))
+        if args.sensor == 'auto' and args.path is None and args.params is None:
+            args.path = os.getcwd()
+    return 1 if args.func(args) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
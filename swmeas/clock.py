@@ -0,0 +1,105 @@
+"""
+The clock used by the loggers and sensor drivers.
+
+All timing of the logging loops (timestamps, sleeps, folder rotation)
+goes through this module. It normally uses the system clock; a soak
+test (see `swmeas.soak`) swaps in a VirtualClock, on which sleeping
+just moves time forward, so days of logging run in seconds.
+"""
+import time as _time
+import datetime as dt
+
+
+class SystemClock(object):
+    """
+    The system clock.
+    """
+    time = staticmethod(_time.time)
+    monotonic = staticmethod(getattr(_time, 'monotonic', _time.time))
+    sleep = staticmethod(_time.sleep)
+
+    def now(self):
+        return dt.datetime.now()
+
+
+class VirtualClock(object):
+    """
+    A clock that only moves when told to (or slept on).
+
+    Parameters
+    ----------
+    start : float
+        Epoch time to start at. Defaults to now.
+    """
+
+    def __init__(self, start=None):
+        self.t = _time.time() if start is None else float(start)
+        self.elapsed = 0.
+        self.listeners = []
+
+    def time(self):
+        return self.t
+
+    def monotonic(self):
+        return self.elapsed
+
+    def now(self):
+        return dt.datetime.fromtimestamp(self.t)
+
+    def sleep(self, seconds):
+        """
+        Move time forward by seconds, then call each listener with the
+        clock.
+        """
+        if seconds > 0:
+            self.t += seconds
+            self.elapsed += seconds
+        for fn in self.listeners:
+            fn(self)
+
+    advance = sleep
+
+
+_clock = SystemClock()
+
+
+def set_clock(clock):
+    """
+    Use clock (a SystemClock or VirtualClock) from now on.
+
+    Returns
+    -------
+    The clock previously in use.
+    """
+    global _clock
+    old, _clock = _clock, clock
+    return old
+
+
+def get_clock():
+    return _clock
+
+
+def time():
+    """
+    Epoch seconds.
+    """
+    return _clock.time()
+
+
+def monotonic():
+    """
+    Seconds on a clock that never goes backwards.
+    """
+    return _clock.monotonic()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
+
+
+def now():
+    """
+    Local time, as a datetime.
+    """
+    return _clock.now()
@@ -0,0 +1,237 @@
+import threading
+from collections import deque
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from .stream import LocalBus, dumps, parse_address
+
+# seconds between keep-alive comments on idle event streams
+KEEPALIVE = 15.
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>swmeas</title>
+<style>
+body {font-family: sans-serif; margin: 1em; background: #fafafa;}
+.panel {background: #fff; border: 1px solid #ddd; margin-bottom: 1em; padding: .5em;}
+.head {display: flex; justify-content: space-between; font-size: .9em;}
+canvas {width: 100%; height: 200px;}
+#status {color: #888; font-size: .8em;}
+</style></head>
+<body>
+<div id="status">connecting...</div>
+<div id="panels"></div>
+<script>
+// one panel per topic, with a trace for each sensor publishing it
+var panels = {}, series = {};
+var COLORS = ['#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd', '#8c564b', '#e377c2', '#17becf'];
+
+function panel(topic, msg) {
+  var div = document.createElement('div');
+  div.className = 'panel';
+  div.innerHTML = '<div class="head"><b></b><span class="last"></span>' +
+                  '<select></select></div><canvas></canvas>';
+  div.querySelector('b').textContent = topic;
+  var sel = div.querySelector('select');
+  (msg.fields || ['value']).forEach(function (f, i) {
+    var o = document.createElement('option');
+    o.value = i; o.textContent = f; sel.appendChild(o);
+  });
+  sel.onchange = function () { draw(topic); };
+  document.getElementById('panels').appendChild(div);
+  return {div: div, sel: sel, keys: []};
+}
+
+function add(msg) {
+  var p = panels[msg.topic] || (panels[msg.topic] = panel(msg.topic, msg));
+  var key = msg.topic + '/' + (msg.sensor || '');
+  var s = series[key];
+  if (!s) {
+    s = series[key] = {label: msg.sensor || msg.topic, color: COLORS[p.keys.length % COLORS.length],
+                       points: []};
+    p.keys.push(key);
+  }
+  msg.time.forEach(function (t, i) { s.points.push([t, msg.values[i]]); });
+  if (s.points.length > 20000) { s.points.splice(0, s.points.length - 20000); }
+}
+
+function draw(topic) {
+  var p = panels[topic], c = p.div.querySelector('canvas'), k = +p.sel.value;
+  var w = c.width = c.clientWidth, h = c.height = c.clientHeight;
+  var traces = p.keys.map(function (key) {
+    var s = series[key];
+    return {s: s, pts: s.points.filter(function (q) { return q[1][k] !== null && isFinite(q[1][k]); })};
+  }).filter(function (tr) { return tr.pts.length > 0; });
+  var ctx = c.getContext('2d');
+  ctx.clearRect(0, 0, w, h);
+  var last = p.div.querySelector('.last');
+  last.textContent = '';
+  if (traces.length < 1) { return; }
+  var t0 = Infinity, t1 = -Infinity, lo = Infinity, hi = -Infinity;
+  traces.forEach(function (tr) {
+    t0 = Math.min(t0, tr.pts[0][0]); t1 = Math.max(t1, tr.pts[tr.pts.length - 1][0]);
+    tr.pts.forEach(function (q) { lo = Math.min(lo, q[1][k]); hi = Math.max(hi, q[1][k]); });
+  });
+  if (hi === lo) { hi += 1; lo -= 1; }
+  var pad = 40;
+  ctx.fillStyle = '#666'; ctx.font = '10px sans-serif';
+  ctx.fillText(hi.toPrecision(5), 0, 10);
+  ctx.fillText(lo.toPrecision(5), 0, h - 12);
+  ctx.fillText(new Date(t0 * 1000).toISOString().slice(0, 19) + 'Z', pad, h - 1);
+  traces.forEach(function (tr) {
+    ctx.beginPath(); ctx.strokeStyle = tr.s.color;
+    tr.pts.forEach(function (q, i) {
+      var x = pad + (w - pad) * (q[0] - t0) / Math.max(t1 - t0, 1e-9);
+      var y = (h - 15) * (1 - (q[1][k] - lo) / (hi - lo)) + 2;
+      if (i === 0) { ctx.moveTo(x, y); } else { ctx.lineTo(x, y); }
+    });
+    ctx.stroke();
+    var q = tr.pts[tr.pts.length - 1], span = document.createElement('span');
+    span.style.color = tr.s.color;
+    span.textContent = ' ' + tr.s.label + ': ' + q[1][k] + ' @ ' + new Date(q[0] * 1000).toISOString();
+    last.appendChild(span);
+  });
+}
+
+function redraw() { Object.keys(panels).forEach(draw); }
+
+fetch('history').then(function (r) { return r.json(); }).then(function (msgs) {
+  msgs.forEach(add); redraw();
+  var es = new EventSource('events');
+  es.onopen = function () { document.getElementById('status').textContent = 'live'; };
+  es.onerror = function () { document.getElementById('status').textContent = 'reconnecting...'; };
+  es.onmessage = function (e) { var m = JSON.parse(e.data); add(m); draw(m.topic); };
+});
+window.onresize = redraw;
+</script>
+</body></html>
+"""
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    dashboard = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, ctype):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path in ('/', '/index.html'):
+            self._send(PAGE, 'text/html; charset=utf-8')
+        elif path == '/history':
+            self._send(dumps(self.dashboard.history()), 'application/json')
+        elif path == '/events':
+            self.events()
+        else:
+            self.send_error(404)
+
+    def events(self):
+        """
+        Server-sent event stream of new messages.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        sub = self.dashboard.bus.subscribe(maxlen=self.dashboard.maxlen)
+        try:
+            while not self.dashboard.closed:
+                msg = sub.get(timeout=KEEPALIVE)
+                if msg is None:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    self.wfile.write(('data: ' + dumps(msg) + '\n\n').encode('utf-8'))
+                self.wfile.flush()
+        except (IOError, OSError):
+            pass  # browser went away
+        finally:
+            sub.close()
+
+
+class Dashboard(object):
+    """
+    Local web dashboard of live readings.
+
+    Serves a page, from a background thread of the logging process,
+    that plots recent readings and is pushed new ones as they arrive
+    (server-sent events). Browsers get the messages already held in
+    memory, so nothing is re-read from disk, and any number of people
+    on the network can watch without a desktop session on the logger.
+
+    Parameters
+    ----------
+    address : str or tuple
+        (host, port) or 'host:port' to serve on. Use '0.0.0.0:port'
+        to make the dashboard visible on the local network.
+    bus : LocalBus
+        Bus carrying the messages. A new one is created if None.
+    history : int
+        Number of messages per topic and sensor sent to newly
+        connected browsers.
+    maxlen : int
+        Maximum number of messages queued per browser.
+    """
+
+    def __init__(self, address='127.0.0.1:8080', bus=None, history=500, maxlen=1000):
+        _, address = parse_address(address)
+        self.bus = LocalBus() if bus is None else bus
+        self.maxlen = maxlen
+        self.closed = False
+        self._history = {}
+        self._nhistory = history
+        self._lock = threading.Lock()
+        self._sub = self.bus.subscribe(maxlen=maxlen)
+
+        handler = type('Handler', (_Handler,), {'dashboard': self})
+        self.server = _Server(address, handler)
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, name='swmeas-dashboard')
+        self.thread.daemon = True
+        self.thread.start()
+        print('Dashboard at http://{}:{}/'.format(*self.address))
+
+    def publish(self, msg):
+        """
+        Show a message (e.g. from `reading_message`) on the dashboard.
+        """
+        self.bus.publish(msg)
+        self._collect()
+
+    def _collect(self):
+        with self._lock:
+            for msg in self._sub.drain():
+                key = (msg.get('topic'), msg.get('sensor'))
+                if key not in self._history:
+                    self._history[key] = deque(maxlen=self._nhistory)
+                self._history[key].append(msg)
+
+    def history(self):
+        """
+        Recent messages of all topics and sensors, oldest first within
+        each.
+        """
+        self._collect()
+        with self._lock:
+            return [m for h in self._history.values() for m in h]
+
+    def close(self):
+        self.closed = True
+        self._sub.close()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,193 @@
+"""
+SQLite storage of readings.
+
+The logger can write its readings to a SQLite database as well as to
+csv files. Each sensor type has a table with a row per reading:
+
+    sensor, time, <value fields>, t_mono, latency, flag
+
+indexed on (sensor, time). The database is in WAL mode, so any number
+of readers can query it while the logger writes:
+
+    from swmeas.database import query
+    d = query('log_data/swmeas.db', 'CO2', t0=time.time() - 3600)
+    d['time'], d['co2']
+
+NaN values are stored as NULL (SQLite has no NaN), and read back as NaN.
+"""
+import sqlite3
+import numpy as np
+
+from . import clock
+
+# numpy kind -> SQLite column type
+SQL_TYPES = {'f': 'REAL', 'i': 'INTEGER', 'u': 'INTEGER'}
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class Database(object):
+    """
+    A SQLite database of readings, for a writer.
+
+    Readings are written in batches: each call to `write` is added to
+    the current transaction, which is committed every commit_every
+    calls (or commit_interval seconds).
+
+    Parameters
+    ----------
+    path : str
+        Database file.
+    commit_every : int
+        Writes per transaction.
+    commit_interval : float
+        Maximum time (s) a write waits to be committed.
+    """
+
+    def __init__(self, path, commit_every=1, commit_interval=60.):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        # transactions are managed here, not by the sqlite3 module
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL is safe with NORMAL: a power cut loses at most the last commits
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.tables = {}
+        self.pending = 0
+        self.t_begin = None
+
+    def table(self, name, dtype):
+        """
+        Create the table of a reading dtype, if it doesn't exist.
+
+        Returns
+        -------
+        The INSERT statement of the table.
+        """
+        if name not in self.tables:
+            dtype = np.dtype(dtype)
+            cols = ['sensor TEXT NOT NULL']
+            for f in dtype.names:
+                cols.append('{} {}'.format(_quote(f), SQL_TYPES.get(dtype[f].kind, 'REAL')))
+            self.conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(_quote(name), ', '.join(cols)))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} (sensor, time)'.format(
+                _quote(name + '_sensor_time'), _quote(name)))
+            self.tables[name] = 'INSERT INTO {} (sensor, {}) VALUES (?{})'.format(
+                _quote(name), ', '.join(_quote(f) for f in dtype.names), ', ?' * len(dtype.names))
+        return self.tables[name]
+
+    def write(self, name, sensor, readings):
+        """
+        Add readings to the database.
+
+        Parameters
+        ----------
+        name : str
+            Table, e.g. the sensor type ('CO2', 'TempO2', 'pH').
+        sensor : str
+            Name (or ID) of the sensor the readings are from.
+        readings : ReadingBatch, structured array or record
+            Readings, of a dtype from `swmeas.records`.
+        """
+        arr = np.atleast_1d(getattr(readings, 'array', readings))
+        insert = self.table(name, arr.dtype)
+        if self.pending == 0:
+            self.conn.execute('BEGIN')
+            self.t_begin = clock.time()
+        self.conn.executemany(insert, [(sensor,) + r for r in arr.tolist()])
+        self.pending += 1
+        if (self.pending >= self.commit_every or
+                clock.time() - self.t_begin >= self.commit_interval):
+            self.commit()
+
+    def commit(self):
+        """
+        Commit the current transaction.
+        """
+        if self.pending:
+            self.conn.execute('COMMIT')
+            self.pending = 0
+
+    def query(self, name, sensor=None, t0=None, t1=None, fields=None, limit=None):
+        """
+        Query readings. See `query`.
+        """
+        return _query(self.conn, name, sensor, t0, t1, fields, limit)
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def connect(path):
+    """
+    Read-only connection to a database, which doesn't block the writer.
+    """
+    conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+    conn.execute('PRAGMA busy_timeout=5000')
+    return conn
+
+
+def query(path, name, sensor=None, t0=None, t1=None, fields=None, limit=None):
+    """
+    Query readings from a database.
+
+    Parameters
+    ----------
+    path : str or sqlite3.Connection
+        Database file, or an open connection (see `connect`).
+    name : str
+        Table, e.g. 'CO2'.
+    sensor : str
+        Only readings from this sensor.
+    t0, t1 : float
+        Only readings with t0 <= time <= t1 (epoch seconds).
+    fields : list
+        Columns to return, after time. Defaults to all of them.
+    limit : int
+        Only the most recent limit readings.
+
+    Returns
+    -------
+    structured array of the readings, in time order.
+    """
+    if isinstance(path, sqlite3.Connection):
+        return _query(path, name, sensor, t0, t1, fields, limit)
+    conn = connect(path)
+    try:
+        return _query(conn, name, sensor, t0, t1, fields, limit)
+    finally:
+        conn.close()
+
+
+def _query(conn, name, sensor, t0, t1, fields, limit):
+    types = dict((r[1], r[2]) for r in conn.execute('PRAGMA table_info({})'.format(_quote(name))))
+    if not types:
+        raise ValueError("No table '{}' in database".format(name))
+    if fields is None:
+        fields = [c for c in types if c not in ('sensor', 'time')]
+    cols = ['time'] + list(fields)
+    where, args = [], []
+    for cond, val in (('sensor = ?', sensor), ('time >= ?', t0), ('time <= ?', t1)):
+        if val is not None:
+            where.append(cond)
+            args.append(val)
+    sql = 'SELECT {} FROM {}'.format(', '.join(_quote(c) for c in cols), _quote(name))
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if limit is not None:
+        sql = 'SELECT * FROM ({} ORDER BY time DESC LIMIT {:d})'.format(sql, limit)
+    rows = conn.execute(sql + ' ORDER BY time', args).fetchall()
+
+    dtype = np.dtype([(c, 'i8' if types[c] == 'INTEGER' else 'f8') for c in cols])
+    out = np.zeros(len(rows), dtype=dtype)
+    if rows:
+        # NULL -> NaN
+        vals = np.array(rows, dtype=float).reshape(len(rows), len(cols))
+        for i, c in enumerate(cols):
+            out[c] = vals[:, i]
+    return out
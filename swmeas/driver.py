@@ -0,0 +1,281 @@
+import os
+import serial
+import numpy as np
+from builtins import range  # for python 2/3 compatability
+
+from .helpers import RowEncoder, portscan, find_sensor, get_sensor_name
+from .records import (ReadingBatch, new_reading, as_array, format_time, values,
+                      value_fields, monotonic)
+from .qc import QC_MISSING
+from . import clock
+
+# {sensor type: driver class}, filled by `register`
+DRIVERS = {}
+
+
+def register(cls):
+    """
+    Class decorator adding a driver to DRIVERS, under its STYPE.
+    """
+    DRIVERS[cls.STYPE] = cls
+    return cls
+
+
+def get_driver(stype):
+    """
+    The driver class of a sensor type.
+    """
+    try:
+        return DRIVERS[stype]
+    except KeyError:
+        raise ValueError("Sensor type must be one of {}".format(sorted(DRIVERS)))
+
+
+class Driver(object):
+    """
+    Base class of sensor drivers.
+
+    A driver declares its schema and protocol:
+
+        STYPE : sensor type name (key in the sensor json and DRIVERS)
+        DTYPE : reading dtype (see `swmeas.records`)
+        HEADER : csv column names written by `write`
+        ENCODER : RowEncoder used by `write`
+        transact(**kwargs) : does one request, returns the raw response
+        parse(resp, t_utc, t_mono, latency, out) : fills a record
+
+    and gets timing, batching, csv output and instrumentation from
+    this class.
+    """
+    STYPE = None
+    DTYPE = None
+    HEADER = ''
+    ENCODER = RowEncoder(dec=1)
+
+    def __init__(self):
+        self.label = ''
+        self.last_read = None
+        self.batch = ReadingBatch(self.DTYPE)
+        self.stats = {'reads': 0, 'flagged': 0, 'latency': 0.}
+        self.indices = None
+
+    def transact(self, **kwargs):
+        raise NotImplementedError
+
+    def parse(self, resp, t_utc, t_mono, latency, out=None):
+        raise NotImplementedError
+
+    def missing(self, t_utc, t_mono, latency, out=None):
+        """
+        Fill a record for a request that got no response: values are
+        NaN, and flag is QC_MISSING.
+        """
+        if out is None:
+            out = new_reading(self.DTYPE)
+        out['time'] = t_utc
+        out['t_mono'] = t_mono
+        out['latency'] = latency
+        for f in value_fields(self.DTYPE):
+            out[f] = float('nan')
+        out['flag'] = QC_MISSING
+        return out
+
+    def _record(self, out):
+        self.stats['reads'] += 1
+        self.stats['latency'] += float(out['latency'])
+        if out['flag']:
+            self.stats['flagged'] += 1
+        self.last_read = out
+        return out
+
+    def read(self, out=None, **kwargs):
+        """
+        Take a single reading.
+
+        Parameters
+        ----------
+        out : numpy record
+            Record (of DTYPE) to fill. If None, a new one is created.
+        **kwargs
+            Passed to transact.
+
+        Returns
+        -------
+        record : (time, values..., t_mono, latency, flag)
+            time is UTC epoch seconds at the start of the request,
+            t_mono the monotonic clock at the same instant, and latency
+            the duration of the request (s).
+        """
+        t_mono = monotonic()
+        t_utc = clock.time()
+        resp = self.transact(**kwargs)
+        latency = monotonic() - t_mono
+        return self._record(self.parse(resp, t_utc, t_mono, latency, out))
+
+    def read_multi(self, n, wait=1., **kwargs):
+        """
+        Take n readings, wait seconds apart.
+
+        Returns
+        -------
+        ReadingBatch of n records. The batch is reused by the next
+        call to read_multi.
+        """
+        self.batch.reset(n)
+        for i in range(n):
+            self.read(out=self.batch.next(), **kwargs)
+            clock.sleep(wait)
+        self.last_read = self.batch
+        return self.batch
+
+    def mean_latency(self):
+        """
+        Mean duration of the requests made so far (s).
+        """
+        return self.stats['latency'] / max(self.stats['reads'], 1)
+
+    def index_files(self, every=100, interval=600.):
+        """
+        Keep a sparse time index of every file written (see
+        `swmeas.timeindex`), for fast reads of time ranges.
+
+        Parameters
+        ----------
+        every, interval :
+            See `swmeas.timeindex.TimeIndex`.
+        """
+        self.indices = {}
+        self._index_kw = {'every': every, 'interval': interval}
+
+    def _append(self, path, out_str, times):
+        with open(path, 'a+') as f:
+            if self.indices is not None:
+                from .timeindex import TimeIndex
+                if path not in self.indices:
+                    self.indices[path] = TimeIndex(path, **self._index_kw)
+                f.seek(0, 2)
+                # rows are ascii, so their lengths are in bytes
+                lens = [len(l) + 1 for l in out_str.split('\n')[:-1]]
+                self.indices[path].add(times, f.tell() + np.cumsum([0] + lens[:-1]))
+            f.write(out_str)
+
+    def _header(self, path, columns):
+        if not os.path.exists(path):
+            with open(path, 'a+') as f:
+                f.write('# {}# {}\n'.format(self.label, columns))
+
+    def write(self, path):
+        """
+        Append the last read values to a csv file, one row per reading.
+        """
+        self._header(path, self.HEADER)
+        rows = as_array(self.last_read)
+        out_str = self.ENCODER.encode(format_time(rows['time']), values(rows))
+        self.write_str = out_str
+        self._append(path, out_str, rows['time'])
+
+    def write_field(self, path, field, title, scale=1., encoder=None):
+        """
+        Append one field of the last batch as a single row
+        [time, value_0, ..., value_n] of a csv file.
+
+        Parameters
+        ----------
+        path : str
+            csv file.
+        field : str
+            Field of DTYPE.
+        title : str
+            Column title, used in the header of new files.
+        scale : float
+            Multiplier applied to the values.
+        encoder : RowEncoder
+            Defaults to ENCODER.
+
+        Returns
+        -------
+        str : the row written.
+        """
+        self._header(path, 'Time (UTC),{}'.format(title))
+        rows = as_array(self.last_read)
+        if encoder is None:
+            encoder = self.ENCODER
+        out_str = encoder.encode(format_time(rows['time'][:1]), rows[field].reshape(1, -1) * scale)
+        self._append(path, out_str, rows['time'][:1])
+        return out_str
+
+    @classmethod
+    def fields(cls):
+        """
+        Names of the value fields of a reading.
+        """
+        return value_fields(cls.DTYPE)
+
+
+class SerialDriver(Driver):
+    """
+    Base class of drivers for sensors on a serial port.
+
+    Adds finding the port (by port name, by ID, or from the sensor
+    json file) and opening it with SERIAL settings.
+
+    Parameters
+    ----------
+    ID : str
+        A unique identifier of the sensor (e.g. serial number).
+    port : str
+        The sensor's port, if known.
+    name : str
+        Name of the sensor.
+    connect : bool
+        If False, the sensor isn't connected. Used to write
+        readings taken elsewhere (e.g. in a worker process).
+    """
+    SERIAL = {}
+
+    def __init__(self, ID=None, port=None, name='', connect=True):
+        Driver.__init__(self)
+        self.ID = ID
+        self.port = port
+        self.name = name
+        if connect:
+            self.connect()
+
+    def find_port(self):
+        """
+        Set port, ID and name, from port or ID if given, otherwise
+        from the first listed sensor of this type that is plugged in.
+        """
+        for what, key in (('port', self.port), ('port with ID', self.ID)):
+            if key is not None:
+                p = portscan(key)
+                if p is None:
+                    raise serial.SerialException("Can't find {}: {}".format(what, key))
+                self.port = p.device
+                self.ID = p.serial_number
+                self.name = get_sensor_name(self.ID)
+                return
+        self.ID, self.name, self.port = find_sensor(self.STYPE)
+
+    def connect(self):
+        """
+        Find and open the sensor's port.
+        """
+        self.find_port()
+        self.label = "{} sensor {} ({}) on port {}\n".format(self.STYPE, self.name, self.ID, self.port)
+        print("\n" + '*' * len(self.label) + '\n' + self.label)
+        self.sensor = serial.Serial(self.port, **self.SERIAL)
+        self.setup()
+        print('*' * len(self.label) + '\n')
+
+    def setup(self):
+        """
+        Called once the port is open. Override to initialise the sensor.
+        """
+        pass
+
+    def disconnect(self):
+        """
+        Close connection to sensor (shouldn't be necessary).
+        """
+        self.sensor.close()
@@ -2,8 +2,9 @@ import sys
 import os
 import json
 import datetime as dt
-from dateutil import parser
-from serial.tools import list_ports
+import numpy as np
+
+from . import clock
 
 
 # Helper functions
@@ -19,39 +20,125 @@ def fmt(x, dec=1, sep=None):
         If specified, all items in list are joined using this str.
     """
     if dec is not None:
-        fmt_str = '{:.' + str(dec) + 'f}'
+        fmt_str = '%.' + str(dec) + 'f'
     else:
-        fmt_str = '{:}'
+        fmt_str = '%s'
     if isinstance(x, (float, int)):
-        return fmt_str.format(x)
+        return fmt_str % x
     elif hasattr(x, '__iter__'):
-        out = []
-        for i in x:
-            if isinstance(i, (float, int)):
-                out.append(fmt_str.format(i))
-            else:
-                out.append(i)
+        x = list(x)
         if sep is None:
-            return out
+            return [fmt_str % i if isinstance(i, (float, int)) else i for i in x]
         else:
-            return sep.join(out)
+            items = [fmt_str if isinstance(i, (float, int)) else '%s' for i in x]
+            return sep.join(items) % tuple(x)
+
+
+class RowEncoder(object):
+    """
+    Bulk csv encoder for rows of [time, value_0, ..., value_n].
+
+    The row template is compiled once per schema, and a whole batch
+    of rows is formatted in a single string operation.
+
+    Parameters
+    ----------
+    dec : int or list
+        Decimal places for all values, or for each value column.
+    sep : str
+        Column separator.
+    chunk : int
+        Maximum number of rows formatted in one operation.
+    """
+
+    def __init__(self, dec=1, sep=',', chunk=10000):
+        self.dec = dec
+        self.sep = sep
+        self.chunk = chunk
+        self.templates = {}
+
+    def template(self, ncol):
+        """
+        %-style template for one row with ncol value columns.
+        """
+        if ncol not in self.templates:
+            if isinstance(self.dec, (list, tuple)):
+                decs = self.dec
+            else:
+                decs = [self.dec] * ncol
+            cols = ['%s'] + ['%s' if d is None else '%.' + str(d) + 'f' for d in decs]
+            self.templates[ncol] = self.sep.join(cols) + '\n'
+        return self.templates[ncol]
+
+    def encode(self, times, values):
+        """
+        Format rows.
+
+        Parameters
+        ----------
+        times : array_like of str
+            Formatted time of each row.
+        values : array_like
+            (n_rows, n_cols) values.
+
+        Returns
+        -------
+        str : n_rows newline-terminated lines.
+        """
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values.reshape(1, -1)
+        n, ncol = values.shape
+        tmpl = self.template(ncol)
+        cells = np.empty((n, ncol + 1), dtype=object)
+        cells[:, 0] = times
+        cells[:, 1:] = values
+        out = []
+        for i in range(0, n, self.chunk):
+            c = cells[i:i + self.chunk]
+            out.append((tmpl * len(c)) % tuple(c.ravel().tolist()))
+        return ''.join(out)
+
+
+def encode_rows(times, values, dec=1, sep=','):
+    """
+    Format rows of [time, value_0, ..., value_n] in one pass.
+
+    See `RowEncoder`.
+    """
+    return RowEncoder(dec, sep).encode(times, values)
+
 
 def write(dat, file, dec=None, sep=','):
     """
     Append data to file.
     """
-    wstr = ''
     if isinstance(dat[0], list):
-        lines = []
-        for d in dat:
-            lines.append(fmt(d, dec, sep))
-        wstr = '\n'.join(lines)
+        wstr = '\n'.join(fmt(d, dec, sep) for d in dat)
     else:
-        wstr += fmt(dat, dec, sep)
-    
+        wstr = fmt(dat, dec, sep)
+
     with open(file, 'a+') as f:
         f.write(wstr)
 
+
+def modbus_crc(msg):
+    """
+    Modbus CRC-16 of a message, as the two bytes appended to it
+    (low byte first).
+    """
+    crc = 0xFFFF
+    for b in bytearray(msg):
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return bytes(bytearray([crc & 0xFF, crc >> 8]))
+
+
+# parsed folder names of timed_dir: {name: datetime, or None if not a date}
+_dir_times = {}
+
+
 def timed_dir(directory, new_folder_every='day'):
     if new_folder_every is None or 'day' in new_folder_every:
         time_gap = dt.timedelta(days=1)
@@ -62,15 +149,20 @@ def timed_dir(directory, new_folder_every='day'):
     else:
         raise ValueError("now_folder_every must be either 'day' or 'hour'")
 
-    now = dt.datetime.now()
+    now = clock.now()
 
+    from dateutil import parser
     dtimes = []
     current_dirs = os.listdir(directory)
     for d in current_dirs:
-        try:
-            dtimes.append(parser.parse(d))
-        except ValueError:
-            pass
+        # names are only parsed once, as this runs every loop
+        if d not in _dir_times:
+            try:
+                _dir_times[d] = parser.parse(d)
+            except ValueError:
+                _dir_times[d] = None
+        if _dir_times[d] is not None:
+            dtimes.append(_dir_times[d])
 
     if len(dtimes) > 0:
         most_recent = max(dtimes)
@@ -101,6 +193,7 @@ def portscan(ID=None, silent=True):
     if not, list of ports.
 
     """
+    from serial.tools import list_ports
     ports = list_ports.comports()
 
     if ID is not None:
@@ -173,8 +266,11 @@ def find_sensor(stype=None, SNs_json=None):
     """
     sensor_dict = load_sensor_IDs(SNs_json)
 
+    # e.g. 'CO2' is also in 'CO2bus_sensor_SNs'
+    skey = '{}_sensor_SNs'.format(stype)
     try:
-        skey = [k for k in sensor_dict.keys() if stype in k][0]
+        if skey not in sensor_dict:
+            skey = [k for k in sensor_dict.keys() if stype in k][0]
     except IndexError:
         raise ValueError(("Sensor type '{}' not in SNs_json keys.\n".format(stype) +
                           "Correct stype, or update SNs_json file."))
@@ -187,6 +283,7 @@ def find_sensor(stype=None, SNs_json=None):
     # else:
     #     raise ValueError("Sensor type '{}' not supported.\nShould be either 'CO2' or 'TempO2'.".format(stype))
 
+    from serial.tools import list_ports
     ports = list_ports.comports()
 
     available = []
@@ -0,0 +1,265 @@
+"""
+Several K-30 CO2 sensors on one RS-485 (Modbus RTU) line.
+
+Each K-30 is given its own Modbus slave address, and a single port
+polls them back to back, so the number of sensors isn't limited by
+USB adapters.
+
+    bus = CO2Bus({0x68: 'tank1', 0x69: 'tank2'}, port='/dev/ttyUSB0')
+    bus.read_multi(5, wait=2.)
+    bus.write_batch('./log_data')  # co2_tank1.csv, co2_tank2.csv
+
+Addresses that keep failing are polled less often (see CO2Bus), so a
+dead sensor doesn't slow down the others.
+"""
+from builtins import bytes  # for python 2/3 compatability
+
+from .helpers import modbus_crc
+from .records import monotonic
+from . import clock
+from .qc import QC_MISSING, QC_COMM
+from .driver import SerialDriver, register
+from .CO2_sensor import CO2_sensor
+
+# 'read RAM' function code, and the exception reply to it
+READ_RAM = 0x44
+READ_RAM_ERROR = READ_RAM | 0x80
+
+
+def request(address):
+    """
+    Modbus request for the CO2 reading of the K-30 at address.
+    """
+    msg = bytes(bytearray([address, READ_RAM, 0x00, 0x08, 0x02]))
+    return msg + modbus_crc(msg)
+
+
+class K30Unit(CO2_sensor):
+    """
+    One K-30 on a CO2Bus. Reads, batches and writes like a CO2_sensor,
+    but talks through the bus's port.
+
+    Parameters
+    ----------
+    bus : CO2Bus
+        The bus the sensor is on.
+    address : int
+        Modbus slave address of the sensor (1-247).
+    name : str
+        Name of the sensor. Defaults to its address.
+    """
+
+    def __init__(self, bus, address, name=''):
+        CO2_sensor.__init__(self, port=bus.port, name=name or '{:#04x}'.format(address),
+                            connect=False)
+        self.bus = bus
+        self.address = address
+        self.REQUEST = request(address)
+        self.label = '{} sensor {} at address {:#04x}\n'.format(self.STYPE, self.name, address)
+
+    def transact(self):
+        """
+        Send REQUEST, and return the sensor's response. Exception
+        replies are 5 bytes long, so are returned without waiting for
+        the timeout.
+        """
+        port = self.bus.sensor
+        port.flushInput()
+        port.write(self.REQUEST)
+        resp = port.read(5)
+        if len(resp) == 5 and bytearray(resp)[1] != READ_RAM_ERROR:
+            resp += port.read(2)
+        return resp
+
+    def parse(self, resp, t_utc, t_mono, latency, out=None):
+        """
+        As `CO2_sensor.parse`, but a reply from another address, or an
+        exception reply, is flagged QC_COMM.
+        """
+        out = CO2_sensor.parse(self, resp, t_utc, t_mono, latency, out)
+        head = bytearray(resp[:2])
+        if len(head) == 2 and (head[0] != self.address or head[1] != READ_RAM):
+            out['co2'] = float('nan')
+            out['flag'] = QC_COMM
+        return out
+
+
+@register
+class CO2Bus(SerialDriver):
+    """
+    Poll several K-30 CO2 sensors sharing a serial (RS-485) port.
+
+    Sensors are read in turn, each as soon as the previous one has
+    answered (after the Modbus inter-frame gap). Errors are counted per
+    address: after max_failures failed reads in a row an address is
+    only retried every retry_every rounds, and is recorded as missing
+    (QC_MISSING) in between.
+
+    Parameters
+    ----------
+    addresses : list or dict
+        Modbus slave addresses of the sensors, or {address: name}.
+    port : str
+        The bus's port. If None, found from ID, or from the serial
+        numbers of RS-485 adapters listed under 'CO2bus_sensor_SNs' in
+        the sensor json file (see `swmeas.helpers.find_sensor`).
+    ID : str
+        Serial number of the RS-485 adapter.
+    name : str
+        Name of the bus.
+    connect : bool
+        If False, the port isn't opened. Used to write readings taken
+        elsewhere.
+    max_failures : int
+        Failed reads in a row before an address is polled less often.
+    retry_every : int
+        Rounds between polls of a failing address.
+    """
+    STYPE = 'CO2bus'
+    DTYPE = CO2_sensor.DTYPE
+    SERIAL = CO2_sensor.SERIAL
+
+    def __init__(self, addresses, port=None, ID=None, name='', connect=True,
+                 max_failures=3, retry_every=10):
+        if not isinstance(addresses, dict):
+            addresses = dict((a, '') for a in addresses)
+        # keys are str once saved to json (see write_par)
+        addresses = dict((int(a), n) for a, n in addresses.items())
+        for a in addresses:
+            if not 1 <= a <= 247:
+                raise ValueError("Modbus slave addresses must be 1-247, not {}".format(a))
+        self.max_failures = max_failures
+        self.retry_every = retry_every
+        self.rounds = 0
+        # silence between Modbus frames: 3.5 characters of 11 bits
+        self.gap = 3.5 * 11. / self.SERIAL['baudrate']
+        SerialDriver.__init__(self, ID=ID, port=port, name=name, connect=False)
+        self.units = [K30Unit(self, a, n) for a, n in sorted(addresses.items())]
+        self.errors = dict((u.address, {'reads': 0, 'missing': 0, 'comm': 0, 'consecutive': 0})
+                           for u in self.units)
+        if connect:
+            self.connect()
+
+    def setup(self):
+        for u in self.units:
+            u.label = u.label[:-1] + ' on port {}\n'.format(self.port)
+            print('  ' + u.label[:-1])
+
+    def unit(self, address):
+        """
+        The K30Unit at address.
+        """
+        for u in self.units:
+            if u.address == address:
+                return u
+        raise ValueError("No sensor at address {}".format(address))
+
+    def skipped(self, address):
+        """
+        True if address is failing and not due a retry this round.
+        """
+        return (self.errors[address]['consecutive'] >= self.max_failures and
+                self.rounds % self.retry_every != 0)
+
+    def _count(self, address, flag):
+        err = self.errors[address]
+        err['reads'] += 1
+        if flag & QC_MISSING:
+            err['missing'] += 1
+        if flag & QC_COMM:
+            err['comm'] += 1
+        if flag & (QC_MISSING | QC_COMM):
+            err['consecutive'] += 1
+            if err['consecutive'] == self.max_failures:
+                print('CO2 sensor at address {:#04x} not responding. '
+                      'Retrying every {} rounds.'.format(address, self.retry_every))
+        else:
+            if err['consecutive'] >= self.max_failures:
+                print('CO2 sensor at address {:#04x} responding again.'.format(address))
+            err['consecutive'] = 0
+
+    def poll(self, outs=None):
+        """
+        Read each sensor once.
+
+        Parameters
+        ----------
+        outs : list
+            Records to fill, one per unit. If None, new ones are created.
+
+        Returns
+        -------
+        list of records, in the order of units.
+        """
+        if outs is None:
+            outs = [None] * len(self.units)
+        res = []
+        for u, out in zip(self.units, outs):
+            if self.skipped(u.address):
+                out = u._record(u.missing(clock.time(), monotonic(), 0., out))
+            else:
+                clock.sleep(self.gap)
+                out = u.read(out=out)
+                self._count(u.address, int(out['flag']))
+            res.append(out)
+        self.rounds += 1
+        return res
+
+    def read(self, out=None):
+        """
+        Read each sensor once. See poll.
+        """
+        self.last_read = self.poll(out)
+        return self.last_read
+
+    def read_multi(self, n, wait=2.):
+        """
+        Read every sensor n times. A round of reads starts every wait
+        seconds (or as soon as the last one has finished, if the bus
+        is slower than that).
+
+        Returns
+        -------
+        dict of {address: ReadingBatch}. The batches are reused by the
+        next call to read_multi.
+        """
+        for u in self.units:
+            u.batch.reset(n)
+        for i in range(n):
+            t0 = monotonic()
+            self.poll([u.batch.next() for u in self.units])
+            left = wait - (monotonic() - t0)
+            if left > 0:
+                clock.sleep(left)
+        for u in self.units:
+            u.last_read = u.batch
+        self.last_read = dict((u.address, u.batch) for u in self.units)
+        return self.last_read
+
+    def index_files(self, every=100, interval=600.):
+        """
+        Keep sparse time indices of each sensor's files. See
+        `Driver.index_files`.
+        """
+        for u in self.units:
+            u.index_files(every, interval)
+
+    def write_batch(self, save_dir='.'):
+        """
+        Append each sensor's last batch to save_dir/co2_{name}.csv
+        (see `CO2_sensor.write_batch`).
+        """
+        self.write_str = ''
+        for u in self.units:
+            u.write_batch('{}/co2_{}.csv'.format(save_dir, u.name))
+            self.write_str += u.name + ': ' + u.write_str
+
+    def error_summary(self):
+        """
+        Print the error counts of each address.
+        """
+        print('{:>8s} {:>10s} {:>8s} {:>8s} {:>8s}'.format('address', 'name', 'reads', 'missing', 'comm'))
+        for u in self.units:
+            e = self.errors[u.address]
+            print('{:#8x} {:>10s} {:8d} {:8d} {:8d}'.format(u.address, u.name, e['reads'],
+                                                             e['missing'], e['comm']))
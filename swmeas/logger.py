@@ -1,15 +1,19 @@
 import os
-import time
 import warnings
 
 from .O2_sensor import O2_sensor
 from .CO2_sensor import CO2_sensor
 from .helpers import read_par, write_par, most_recent_json, timed_dir, find_sensor
+from .oxygen import O2_MODES, RAW_O2_UNITS
+from .outputs import Outputs
+from . import clock
 
 
 def logCO2(data_dir='./log_data/', interval=30, stop=0,
            n=5, wait=1., ID=None, sensor_json=None,
-           new_folder_every=None, verbose=False, **kwargs):
+           new_folder_every=None, verbose=False, publish=None,
+           ring=None, adaptive=None, qc=None, pyramid=False, dashboard=None,
+           index=False, database=None, sensor=None, trace=None, **kwargs):
     """
     Log CO2 and save to files in data_dir.
 
@@ -32,61 +36,191 @@ def logCO2(data_dir='./log_data/', interval=30, stop=0,
     ID : str
         A unique identifier of the sensor (e.g. serial number). If None
         a sensor of the correct type is found automatically.
+    publish : str
+        If specified, each reading is published to subscribers on this
+        address ('host:port' or a Unix socket path). See `swmeas.stream`.
+    ring : str
+        If specified, recent readings are kept in a shared-memory ring
+        buffer named '{ring}_CO2'. See `swmeas.ringbuffer`.
+    adaptive : dict
+        If specified, the interval adapts to the variability of the
+        co2 signal, using these keyword arguments to
+        `swmeas.adaptive.AdaptiveSampler`: std_threshold and/or
+        rate_threshold, and e.g. min_interval, max_interval. n and
+        wait aren't adapted. The interval in use is recorded in CO2_sampling.csv.
+    qc : bool or dict
+        If True, readings are quality-controlled with the default
+        checks of `swmeas.qc` (or those in qc, if a dict), and the
+        flags of each batch are recorded in co2_qc.csv.
+    pyramid : bool
+        If True, min/max/mean summaries of the co2 record are kept
+        up to date in data_dir/pyramid, for plotting long records.
+        See `swmeas.pyramid`.
+    dashboard : str
+        If specified, readings are shown on a web dashboard served
+        on this address (e.g. '0.0.0.0:8080'). See `swmeas.dashboard`.
+    index : bool
+        If True, a sparse time index of each data file is kept
+        alongside it ('{file}.idx'), for fast reads of time ranges.
+        See `swmeas.timeindex`.
+    database : str
+        If specified, readings are also written to this SQLite
+        database. See `swmeas.database`.
+    sensor : Driver
+        Log this (already connected) sensor, instead of finding one.
+    trace : str
+        If specified, the raw response of every reading is recorded to
+        this file, for replay. See `swmeas.trace`.
     """
     # record parameters
     if not os.path.exists(data_dir):
         os.mkdir(data_dir)
-    write_par(locals(), data_dir + '/logCO2.json')
+    write_par(dict(locals(), sensor=None), data_dir + '/logCO2.json')
 
     # if ID not specified, find a sensor listed in json file
-    if ID is None:
+    if sensor is not None:
+        co2 = sensor
+    elif ID is None:
         co2 = CO2_sensor()  # find sensor automatically
     else:
         co2 = CO2_sensor(ID=ID)
+    outputs = Outputs('CO2', data_dir, interval, n, wait, [('co2', 'co2', 1.)], prefix='co2',
+                      publish=publish, dashboard=dashboard, ring=ring, adaptive=adaptive,
+                      qc=qc, pyramid=pyramid, index=index, database=database, trace=trace)
+    outputs.add(co2)
 
     print('Logging CO2...')
 
     # initialize sensor
-    start_time = os.times()[-1]
+    start_time = clock.monotonic()
     time_now = start_time
     run = True
 
-    while run:
-        # create timed subdirectory, if required
-        if new_folder_every is not None:
-            save_dir = timed_dir(data_dir, new_folder_every)
-        else:
-            save_dir = data_dir
-        # do the logging
-        time_startloop = os.times()[-1]  # time at start of loop
-        elapsed = time_startloop - start_time  # total elapsed time at start of loop
-        # print('Elapsed Time: {:.1f}'.format(elapsed))
-        # print('  CO2 Measurement')
-        co2.read_multi(n, wait)
-        co2.write_batch(save_dir + '/co2.csv')
-        if verbose:
-            print(co2.write_str[:-1])
-        # print('')
-
-        # timing mechanics
-        loop_time = os.times()[-1] - time_startloop
-        # print('loop time: {:.1f}'.format(loop_time))
-        if stop > 0:
-            # if the next interval's start time > stop time
-            if elapsed + loop_time + interval > stop:
+    try:
+        while run:
+            # create timed subdirectory, if required
+            if new_folder_every is not None:
+                save_dir = timed_dir(data_dir, new_folder_every)
+            else:
+                save_dir = data_dir
+            # do the logging
+            time_startloop = clock.monotonic()  # time at start of loop
+            elapsed = time_startloop - start_time  # total elapsed time at start of loop
+            # print('Elapsed Time: {:.1f}'.format(elapsed))
+            # print('  CO2 Measurement')
+            co2.read_multi(n, wait)
+            co2.write_batch(save_dir + '/co2.csv')
+            interval = outputs.write(save_dir)
+            if verbose:
+                print(co2.write_str[:-1])
+            # print('')
+
+            # timing mechanics
+            loop_time = clock.monotonic() - time_startloop
+            # print('loop time: {:.1f}'.format(loop_time))
+            if stop > 0:
+                # if the next interval's start time > stop time
+                if elapsed + loop_time + interval > stop:
+                    print('\nFinished.')
+                    break  # stop the loop
+            if loop_time < interval:
+                sleeptime = interval - loop_time
+                # print('sleep time: {:.1f}'.format(sleeptime))
+                clock.sleep(sleeptime)
+    finally:
+        # also on Ctrl-C, or an error
+        outputs.close()
+
+    return
+
+
+def logCO2bus(addresses, port=None, data_dir='./log_data/', interval=30, stop=0,
+              n=5, wait=2., ID=None, new_folder_every=None, verbose=False,
+              publish=None, ring=None, adaptive=None, qc=None, pyramid=False,
+              dashboard=None, index=False, database=None, sensor=None,
+              trace=None, **kwargs):
+    """
+    Log several K-30 CO2 sensors on one RS-485 (Modbus) line, and save
+    each to co2_{name}.csv in data_dir.
+
+    Parameters
+    ----------
+    addresses : list or dict
+        Modbus slave addresses of the sensors, or {address: name}.
+    port : str
+        The bus's serial port.
+    ID : str
+        Serial number of the RS-485 adapter, if port isn't given.
+    n, wait :
+        Readings of each sensor per loop, and time between them.
+    publish, dashboard, ring, adaptive, qc, pyramid, index, database, trace :
+        See `logCO2`. Messages are published with topic 'CO2' and the
+        label of each sensor. Each sensor has its own ring buffer
+        ('{ring}_CO2_{name}'), QC flags (co2_{name}_qc.csv) and pyramid
+        ('co2_{name}'). With adaptive, the interval follows the most
+        variable sensor, and is recorded in CO2_{name}_sampling.csv.
+    sensor : CO2Bus
+        Log this bus, instead of connecting one.
+    **kwargs
+        name, max_failures and retry_every are passed to
+        `swmeas.k30bus.CO2Bus`. Others are ignored.
+
+    See `logCO2` for the other parameters.
+    """
+    if not os.path.exists(data_dir):
+        os.mkdir(data_dir)
+    write_par(dict(locals(), sensor=None), data_dir + '/logCO2bus.json')
+
+    if sensor is not None:
+        bus = sensor
+    else:
+        from .k30bus import CO2Bus
+        # kwargs also holds the options of other loggers (e.g. from auto_log)
+        bus = CO2Bus(addresses, port=port, ID=ID,
+                     **dict((k, kwargs[k]) for k in ('name', 'max_failures', 'retry_every')
+                            if k in kwargs))
+    outputs = Outputs('CO2', data_dir, interval, n, wait, [('co2', 'co2', 1.)], prefix='co2',
+                      publish=publish, dashboard=dashboard, ring=ring, adaptive=adaptive,
+                      qc=qc, pyramid=pyramid, index=index, database=database, trace=trace)
+    for u in bus.units:
+        outputs.add(u, u.name)
+
+    print('Logging CO2 from {} sensors...'.format(len(bus.units)))
+
+    start_time = clock.monotonic()
+    try:
+        while True:
+            if new_folder_every is not None:
+                save_dir = timed_dir(data_dir, new_folder_every)
+            else:
+                save_dir = data_dir
+            time_startloop = clock.monotonic()
+            elapsed = time_startloop - start_time
+            bus.read_multi(n, wait)
+            bus.write_batch(save_dir)
+            interval = outputs.write(save_dir)
+            if verbose:
+                print(bus.write_str[:-1])
+
+            loop_time = clock.monotonic() - time_startloop
+            if stop > 0 and elapsed + loop_time + interval > stop:
                 print('\nFinished.')
-                break  # stop the loop
-        if loop_time < interval:
-            sleeptime = interval - loop_time
-            # print('sleep time: {:.1f}'.format(sleeptime))
-            time.sleep(sleeptime)
+                break
+            if loop_time < interval:
+                clock.sleep(interval - loop_time)
+    finally:
+        outputs.close()
+        bus.error_summary()
 
     return
 
 
 def logTempO2(data_dir='./log_data/', interval=30, stop=0,
               n=5, wait=.5, ID=None, sensor_json=None,
-              mode='water', new_folder_every=None, verbose=False, **kwargs):
+              mode='water', new_folder_every=None, verbose=False,
+              publish=None, ring=None, adaptive=None, duty_cycle=None, qc=None,
+              pyramid=False, dashboard=None, index=False, database=None, sensor=None,
+              trace=None, **kwargs):
     """
     Log O2 and Temp and save to files in data_dir.
 
@@ -109,60 +243,202 @@ def logTempO2(data_dir='./log_data/', interval=30, stop=0,
     ID : str
         A unique identifier of the sensor (e.g. serial number). If None
         a sensor of the correct type is found automatically.
+    publish : str
+        If specified, each reading is published to subscribers on this
+        address ('host:port' or a Unix socket path). See `swmeas.stream`.
+    ring : str
+        If specified, recent readings are kept in a shared-memory ring
+        buffer named '{ring}_TempO2'. See `swmeas.ringbuffer`.
+    adaptive : dict
+        If specified, the interval adapts to the variability of the
+        O2 signal, using these keyword arguments to
+        `swmeas.adaptive.AdaptiveSampler`: std_threshold and/or
+        rate_threshold, and e.g. min_interval, max_interval. n and
+        wait aren't adapted. The interval in use is recorded in TempO2_sampling.csv.
+    duty_cycle : dict
+        If specified, the meter is powered down between measurements,
+        using these keyword arguments to `swmeas.power.DutyCycle`
+        (e.g. warmup, margin, power_on_W). Energy use and duty ratio
+        are recorded in TempO2_power.csv.
+    qc : bool or dict
+        If True, readings are quality-controlled with the default
+        checks of `swmeas.qc` (or those in qc, if a dict), and the
+        flags of each batch are recorded in TempO2_qc.csv.
+    pyramid : bool
+        If True, min/max/mean summaries of the temp and o2 records
+        are kept up to date in data_dir/pyramid, for plotting long
+        records. See `swmeas.pyramid`.
+    dashboard : str
+        If specified, readings are shown on a web dashboard served
+        on this address (e.g. '0.0.0.0:8080'). See `swmeas.dashboard`.
+    index : bool
+        If True, a sparse time index of each data file is kept
+        alongside it ('{file}.idx'), for fast reads of time ranges.
+        See `swmeas.timeindex`.
+    database : str
+        If specified, readings are also written to this SQLite
+        database. See `swmeas.database`.
+    sensor : Driver
+        Log this (already connected) sensor, instead of finding one.
+    trace : str
+        If specified, the raw response of every reading is recorded to
+        this file, for replay. See `swmeas.trace`.
     """
     # record parameters
     if not os.path.exists(data_dir):
         os.mkdir(data_dir)
 
-    write_par(locals(), data_dir + '/logTempO2.json')
+    write_par(dict(locals(), sensor=None), data_dir + '/logTempO2.json')
 
     # initialize sensor
-    if ID is None:
+    if sensor is not None:
+        o2 = sensor
+    elif ID is None:
         o2 = O2_sensor()  # find sensor automatically
     else:
         o2 = O2_sensor(ID=ID)
+    f = O2_MODES[mode]
+    outputs = Outputs('TempO2', data_dir, interval, n, wait,
+                      [(f, 'o2', RAW_O2_UNITS[f][0]), ('tempSample', 'temp', RAW_O2_UNITS['tempSample'][0])],
+                      publish=publish, dashboard=dashboard, ring=ring, adaptive=adaptive,
+                      qc=qc, pyramid=pyramid, index=index, database=database, trace=trace,
+                      mode=mode)
+    outputs.add(o2)
+    dc = None
+    if duty_cycle is not None:
+        from .power import DutyCycle
+        dc = DutyCycle(o2, **duty_cycle)
 
     print('Logging TempO2...')
 
     # set up timing
-    start_time = os.times()[-1]
+    start_time = clock.monotonic()
     time_now = start_time
     run = True
 
-    while run:
-        # create timed subdirectory, if required
-        if new_folder_every is not None:
-            save_dir = timed_dir(data_dir, new_folder_every)
-        else:
-            save_dir = data_dir
-        # do the logging
-        time_startloop = os.times()[-1]  # time at start of loop
-        elapsed = time_startloop - start_time  # total elapsed time at start of loop
-        # print('Elapsed Time: {:.1f}'.format(time_startloop - start_time))
-        # print('  O2-Temp Measurement')
-        o2.read_multi(n, wait)
-        o2.write_TempO2_batch(save_dir + '/temp.csv', save_dir + '/o2.csv', mode=mode)
-        if verbose:
-            print(o2.write_str[:-1])
-        o2.write(save_dir + '/TempO2_raw.csv')
-        # print('')
-
-        # timing mechanics
-        loop_time = os.times()[-1] - time_startloop
-        # print('loop time: {:.1f}'.format(loop_time))
-        if stop > 0:
-            # if the next interval's start time > stop time
-            if elapsed + loop_time + interval > stop:
+    try:
+        while run:
+            # create timed subdirectory, if required
+            if new_folder_every is not None:
+                save_dir = timed_dir(data_dir, new_folder_every)
+            else:
+                save_dir = data_dir
+            # do the logging
+            time_startloop = clock.monotonic()  # time at start of loop
+            elapsed = time_startloop - start_time  # total elapsed time at start of loop
+            # print('Elapsed Time: {:.1f}'.format(time_startloop - start_time))
+            # print('  O2-Temp Measurement')
+            o2.read_multi(n, wait)
+            o2.write_TempO2_batch(save_dir + '/temp.csv', save_dir + '/o2.csv', mode=mode)
+            if verbose:
+                print(o2.write_str[:-1])
+            o2.write(save_dir + '/TempO2_raw.csv')
+            interval = outputs.write(save_dir)
+            if dc is not None:
+                dc.write(save_dir + '/TempO2_power.csv', o2.batch.column('time')[0])
+            # print('')
+
+            # timing mechanics
+            loop_time = clock.monotonic() - time_startloop
+            # print('loop time: {:.1f}'.format(loop_time))
+            if stop > 0:
+                # if the next interval's start time > stop time
+                if elapsed + loop_time + interval > stop:
+                    print('\nFinished.')
+                    break  # stop the loop
+            if loop_time < interval:
+                sleeptime = interval - loop_time
+                # print('sleep time: {:.1f}'.format(sleeptime))
+                if dc is not None:
+                    dc.idle(sleeptime)
+                else:
+                    clock.sleep(sleeptime)
+    finally:
+        outputs.close()
+        if dc is not None:
+            print('Duty ratio: {duty:.3f}, energy: {energy_Wh:.4f} Wh '
+                  '(always on: {always_on_Wh:.4f} Wh)'.format(**dc.report()))
+
+    return
+
+
+def logpH(data_dir='./log_data/', interval=30, stop=0, n=5, wait=1., GainIndex=0,
+          probes=None, new_folder_every=None, verbose=False, publish=None, ring=None,
+          adaptive=None, qc=None, pyramid=False, dashboard=None, index=False,
+          database=None, sensor=None, trace=None, **kwargs):
+    """
+    Log pH probe voltages and save to pH.csv in data_dir.
+
+    Parameters
+    ----------
+    GainIndex, probes :
+        See `swmeas.pH_sensor.pH_sensor`.
+    adaptive :
+        As for `logCO2`, following the voltage of the first probe. The
+        interval in use is recorded in pH_sampling.csv.
+    qc, pyramid :
+        As for `logCO2`. QC flags are recorded in pH_qc.csv, and
+        pyramids are kept of the voltages of each probe.
+    ring :
+        As for `logCO2`, named '{ring}_pH'.
+    sensor : pH_sensor
+        Log this (already connected) sensor, instead of connecting one.
+
+    See `logCO2` for the other parameters.
+    """
+    if not os.path.exists(data_dir):
+        os.mkdir(data_dir)
+    write_par(dict(locals(), sensor=None), data_dir + '/logpH.json')
+
+    if sensor is not None:
+        ph = sensor
+    else:
+        from .pH_sensor import pH_sensor
+        ph = pH_sensor(GainIndex, probes)
+    outputs = Outputs('pH', data_dir, interval, n, wait, [(f, f, 1.) for f in ph.volt_fields],
+                      publish=publish, dashboard=dashboard, ring=ring, adaptive=adaptive,
+                      qc=qc, pyramid=pyramid, index=index, database=database, trace=trace)
+    outputs.add(ph)
+
+    print('Logging pH...')
+
+    start_time = clock.monotonic()
+    try:
+        while True:
+            if new_folder_every is not None:
+                save_dir = timed_dir(data_dir, new_folder_every)
+            else:
+                save_dir = data_dir
+            time_startloop = clock.monotonic()
+            elapsed = time_startloop - start_time
+            ph.read_multi(n, wait)
+            ph.write(save_dir + '/pH.csv')
+            interval = outputs.write(save_dir)
+            if verbose:
+                print(ph.write_str[:-1])
+
+            loop_time = clock.monotonic() - time_startloop
+            if stop > 0 and elapsed + loop_time + interval > stop:
                 print('\nFinished.')
-                break  # stop the loop
-        if loop_time < interval:
-            sleeptime = interval - loop_time
-            # print('sleep time: {:.1f}'.format(sleeptime))
-            time.sleep(sleeptime)
+                break
+            if loop_time < interval:
+                clock.sleep(interval - loop_time)
+    finally:
+        outputs.close()
 
     return
 
 
+def logPool(sensors, data_dir='./log_data/', **kwargs):
+    """
+    Log many sensors in parallel worker processes.
+
+    See `swmeas.workers.logPool`.
+    """
+    from .workers import logPool
+    return logPool(sensors, data_dir, **kwargs)
+
+
 def auto_log(mode='All', path=None, param_file=None):
     """
     Starts logging using parameters saved in .json file.
@@ -174,7 +450,10 @@ def auto_log(mode='All', path=None, param_file=None):
     mode : str
         - 'All' calls logAll
         - 'CO2' calls logCO2
+        - 'CO2bus' calls logCO2bus
         - 'TempO2' calls logTempO2
+        - 'pH' calls logpH
+        - 'Pool' calls logPool (see `swmeas.workers`)
     path : str (optional)
         If specified, parameters are imported from the most
         recently modified .json file found in path.
@@ -183,12 +462,15 @@ def auto_log(mode='All', path=None, param_file=None):
 
     """
     fndict = {'CO2': logCO2,
-              'TempO2': logTempO2}
+              'CO2bus': logCO2bus,
+              'TempO2': logTempO2,
+              'pH': logpH,
+              'Pool': logPool}
 
     if mode in fndict:
         fn = fndict[mode]
     else:
-        raise ValueError("{} is not a valid option.\n  > Please use 'All', 'CO2' or 'TempO2'.".format(mode))
+        raise ValueError("{} is not a valid option.\n  > Please use 'All', 'CO2', 'CO2bus', 'TempO2', 'pH' or 'Pool'.".format(mode))
     if param_file is None and path is None:
         raise ValueError('Please specify either param_file or path.')
     elif param_file is not None:
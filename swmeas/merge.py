@@ -0,0 +1,334 @@
+import os
+import time
+import numpy as np
+
+from .helpers import encode_rows
+from .records import O2_FIELDS, format_time, ph_fields, probe_names
+
+replace = getattr(os, 'replace', os.rename)
+
+# columns of TempO2_raw.csv, after time
+RAW_O2_COLUMNS = O2_FIELDS
+
+
+def ph_source(probes=None, file='pH.csv'):
+    """
+    Source of the probe voltages (the volt_fields of
+    `swmeas.pH_sensor.pH_sensor`) in a pH log.
+
+    Parameters
+    ----------
+    probes : dict or list
+        The pH probes, as given to pH_sensor (or logpH). None for the
+        default, single probe.
+
+    Returns
+    -------
+    (file, columns) : tuple, e.g. ('pH.csv', {'pH_a': 0, 'pH_temp_a': 1})
+    """
+    fields = ph_fields(probe_names(probes))[:-1]
+    return file, dict((f, i) for i, f in enumerate(fields))
+
+
+# default sources in a log directory: {name: (file, columns)}
+# columns=None means the row mean of a batch file.
+DEFAULT_SOURCES = {'CO2': ('co2.csv', None),
+                   'Temp': ('temp.csv', None),
+                   'O2': ('o2.csv', None),
+                   'pH': ph_source()}
+
+
+def parse_times(tstrs):
+    """
+    Vectorized conversion of logged time strings to epoch seconds.
+
+    Parameters
+    ----------
+    tstrs : array_like of str
+        Times as written by the sensors: ISO 8601 UTC
+        ('%Y-%m-%dT%H:%M:%S.fffZ'), or '%Y-%m-%d-%H:%M:%S' local time
+        in logs from earlier versions.
+
+    Returns
+    -------
+    array of float
+        Seconds since 1970-01-01.
+    """
+    iso = [t[:10] + 'T' + t[11:].rstrip('Z') for t in tstrs]
+    out = np.array(iso, dtype='datetime64[ms]').astype(np.int64) / 1000.
+    legacy = np.array([len(t) > 10 and t[10] == '-' for t in tstrs], dtype=bool)
+    if legacy.any():
+        out[legacy] = local_to_epoch(out[legacy])
+    return out
+
+
+def local_to_epoch(t):
+    """
+    Epoch seconds of local times, given as seconds since 1970-01-01
+    local time. The UTC offset (incl. daylight saving) is looked up
+    once per hour of data.
+    """
+    hours, inv = np.unique(np.floor(t / 3600.), return_inverse=True)
+    offsets = np.array([time.mktime(time.gmtime(h * 3600.)[:8] + (-1,)) - h * 3600.
+                        for h in hours])
+    return t + offsets[inv.ravel()]
+
+
+def read_log(path, offset=0, end=None):
+    """
+    Read complete data rows from a log file, starting at a byte offset.
+
+    Parameters
+    ----------
+    path : str
+        Log file.
+    offset : int
+        Byte offset to start reading from.
+    end : int
+        Byte offset to stop reading at (the start of a row). If None,
+        reads to the end of the file.
+
+    Returns
+    -------
+    (times, values, offset) : tuple
+        times : array of epoch seconds, values : 2D array (NaN padded
+        if rows differ in length), offset : byte offset after the last
+        complete row read.
+    """
+    if not os.path.exists(path):
+        return np.empty(0), np.empty((0, 0)), offset
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read() if end is None else f.read(max(end - offset, 0))
+
+    end = chunk.rfind(b'\n') + 1
+    lines = [l for l in chunk[:end].decode('utf-8').split('\n')
+             if l and not l.startswith('#')]
+    offset += end
+
+    if len(lines) == 0:
+        return np.empty(0), np.empty((0, 0)), offset
+
+    rows = [l.split(',') for l in lines]
+    width = max(len(r) for r in rows) - 1
+    values = np.full((len(rows), width), np.nan)
+    for i, r in enumerate(rows):
+        values[i, :len(r) - 1] = r[1:]
+    times = parse_times([r[0] for r in rows])
+    return times, values, offset
+
+
+def asof(t, tsrc, vsrc, tolerance=None):
+    """
+    As-of join: the last value in vsrc at or before each time in t.
+
+    Parameters
+    ----------
+    t : array
+        Target times.
+    tsrc, vsrc : array
+        Sorted source times and values (1D or 2D).
+    tolerance : float
+        Maximum age (seconds) of a joined value. Older values are NaN.
+    """
+    i = np.searchsorted(tsrc, t, side='right') - 1
+    valid = i >= 0
+    if tolerance is not None:
+        valid &= (t - tsrc[np.clip(i, 0, None)]) <= tolerance
+    out = vsrc[np.clip(i, 0, None)].astype(float)
+    out[~valid] = np.nan
+    return out
+
+
+def interp(t, tsrc, vsrc, tolerance=None):
+    """
+    Linear interpolation of vsrc onto t.
+
+    Values outside the source time range, or in gaps larger than
+    tolerance, are NaN.
+    """
+    out = np.interp(t, tsrc, vsrc, left=np.nan, right=np.nan)
+    if tolerance is not None and len(tsrc) > 1:
+        i = np.searchsorted(tsrc, t)
+        hi = np.clip(i, 0, len(tsrc) - 1)
+        lo = np.clip(i - 1, 0, len(tsrc) - 1)
+        exact = tsrc[hi] == t
+        out[((tsrc[hi] - tsrc[lo]) > tolerance) & ~exact] = np.nan
+    return out
+
+
+class MergeEngine(object):
+    """
+    Align separately logged streams onto a common time grid.
+
+    Sources are read incrementally: each call to `update` reads only
+    rows appended since the last call, and returns only grid rows that
+    have not been returned before and are covered by every source.
+    Sources whose files don't exist (e.g. pH.csv, where no pH probes
+    are logged) don't hold up the grid, and give NaN columns.
+
+    Parameters
+    ----------
+    directory : str
+        Log directory containing the source files.
+    sources : dict
+        {name: (file, columns)}. columns is None for batch files
+        (e.g. co2.csv), which are reduced to their row mean, or a
+        {name: index} dict selecting columns of a per-reading file
+        (e.g. TempO2_raw.csv).
+    freq : float
+        Grid spacing, in seconds.
+    method : str
+        'asof' (last observation) or 'interp' (linear interpolation).
+    tolerance : float
+        Maximum age / gap (seconds) of data used for a grid point.
+        Defaults to 3 * freq.
+    """
+
+    def __init__(self, directory='./', sources=None, freq=60., method='interp',
+                 tolerance=None):
+        if method not in ('asof', 'interp'):
+            raise ValueError("method must be either 'asof' or 'interp'")
+        if sources is None:
+            sources = DEFAULT_SOURCES
+        self.directory = directory
+        self.sources = sources
+        self.freq = float(freq)
+        self.method = method
+        if tolerance is None:
+            tolerance = 3 * self.freq
+        self.tolerance = tolerance
+
+        self.offsets = {k: 0 for k in sources}
+        self.data = {k: (np.empty(0), np.empty((0, 0))) for k in sources}
+        # sources whose files have been found
+        self.found = set()
+        self.last_t = None
+
+    @property
+    def columns(self):
+        cols = []
+        for k, (f, c) in sorted(self.sources.items()):
+            if c is None:
+                cols.append(k)
+            else:
+                cols += sorted(c, key=c.get)
+        return cols
+
+    def _append(self, name, times, values):
+        t0, v0 = self.data[name]
+        if len(t0) == 0:
+            t, v = times, values
+        else:
+            w = max(v0.shape[1], values.shape[1])
+            v = np.full((len(t0) + len(times), w), np.nan)
+            v[:len(t0), :v0.shape[1]] = v0
+            v[len(t0):, :values.shape[1]] = values
+            t = np.concatenate([t0, times])
+        order = np.argsort(t, kind='mergesort')
+        t, v = t[order], v[order]
+        # keep only what is needed to fill the next grid rows
+        if self.last_t is not None:
+            first = max(np.searchsorted(t, self.last_t - self.tolerance) - 1, 0)
+            t, v = t[first:], v[first:]
+        self.data[name] = (t, v)
+
+    def _columns(self, name):
+        """
+        Source values reduced to output columns.
+        """
+        t, v = self.data[name]
+        cols = self.sources[name][1]
+        if name not in self.found:
+            return t, [np.empty(0)] * (1 if cols is None else len(cols))
+        if cols is None:
+            with np.errstate(invalid='ignore'):
+                return t, [np.nanmean(v, 1)] if v.size else [np.empty(0)]
+        return t, [v[:, i] for i in sorted(cols.values())]
+
+    def update(self):
+        """
+        Read new data and return newly completed grid rows.
+
+        Returns
+        -------
+        (t, values) : tuple
+            t : array of epoch seconds, values : (len(t), n_columns) array
+            with columns as in `self.columns`.
+        """
+        for name, (fname, _) in self.sources.items():
+            path = os.path.join(self.directory, fname)
+            if os.path.exists(path):
+                self.found.add(name)
+            times, values, self.offsets[name] = read_log(path, self.offsets[name])
+            if len(times):
+                self._append(name, times, values)
+
+        found = [self.data[k][0] for k in self.found]
+        if len(found) == 0 or any(len(t) == 0 for t in found):
+            return np.empty(0), np.empty((0, len(self.columns)))
+
+        start = max(t[0] for t in found)
+        end = min(t[-1] for t in found)
+        if self.last_t is not None:
+            start = self.last_t + self.freq
+        start = np.ceil(start / self.freq) * self.freq
+        grid = np.arange(start, end + self.freq / 2, self.freq)
+        grid = grid[grid <= end]
+        if len(grid) == 0:
+            return grid, np.empty((0, len(self.columns)))
+
+        join = asof if self.method == 'asof' else interp
+        out = []
+        for name in sorted(self.sources):
+            t, cols = self._columns(name)
+            for c in cols:
+                ok = ~np.isnan(c)
+                if ok.sum() == 0:
+                    out.append(np.full(len(grid), np.nan))
+                else:
+                    out.append(join(grid, t[ok], c[ok], self.tolerance))
+
+        self.last_t = grid[-1]
+        return grid, np.column_stack(out)
+
+    def write(self, path, t, values, dec=3, append=True):
+        """
+        Append merged rows to a csv file.
+
+        With append=False, the file is replaced by the rows instead: they
+        are written to path + '.tmp', which then replaces path, so a
+        reader never sees a partial file.
+        """
+        header = ('# Merged data, {:.0f} s grid ({})\n'.format(self.freq, self.method) +
+                  '# Time (UTC),' + ','.join(self.columns) + '\n')
+        rows = encode_rows(format_time(t), values, dec) if len(t) else ''
+        if not append:
+            with open(path + '.tmp', 'w') as f:
+                f.write(header + rows)
+            replace(path + '.tmp', path)
+            return
+        if not os.path.exists(path):
+            rows = header + rows
+        if rows:
+            with open(path, 'a+') as f:
+                f.write(rows)
+
+
+def merge_dir(directory, out_file='merged.csv', sources=None, freq=60.,
+              method='interp', tolerance=None):
+    """
+    Merge the logs in directory into a single wide csv file. An
+    existing out_file is replaced, so merging again (e.g. by
+    `swmeas.reprocess`) doesn't duplicate rows.
+
+    Returns
+    -------
+    MergeEngine
+        Call `update` / `write` on it to merge newly arrived data.
+    """
+    engine = MergeEngine(directory, sources, freq, method, tolerance)
+    t, values = engine.update()
+    engine.write(os.path.join(directory, out_file), t, values, append=False)
+    return engine
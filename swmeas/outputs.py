@@ -0,0 +1,178 @@
+from .records import value_fields
+
+# The optional outputs of the loggers, set up, fed and closed in one
+# place. Their modules are imported when an output is first used, so a
+# plain logger starts quickly.
+
+
+class Outputs(object):
+    """
+    The optional outputs of a logger: streaming, a dashboard, shared
+    ring buffers, adaptive sampling, QC, pyramids, time indices, a
+    database and a trace.
+
+    Each output is set up only if its option is given. Sensors are
+    added with `add`, every batch they read is passed on by `write`,
+    and `close` closes everything that holds a file or socket.
+
+    Parameters
+    ----------
+    stype : str
+        Sensor type: the topic of published messages, the database
+        table, and the suffix of ring buffer names (e.g. 'CO2').
+    data_dir : str
+        The logger's folder. Pyramids are kept in data_dir/pyramid.
+    interval, n, wait :
+        The logger's sampling. Recorded in traces and sampling files.
+    signals : list
+        (field, name, scale) of each signal summarised in a pyramid
+        named name. Adaptive sampling follows the first.
+    prefix : str
+        Prefix of the QC file ({prefix}_qc.csv). Defaults to stype.
+    publish, dashboard, ring, adaptive, qc, pyramid, index, database, trace :
+        The logger options of the same names (see `swmeas.logger.logCO2`).
+    **params
+        Further logger parameters recorded in the trace (e.g. mode).
+    """
+
+    def __init__(self, stype, data_dir, interval, n, wait, signals=(), prefix=None,
+                 publish=None, dashboard=None, ring=None, adaptive=None, qc=None,
+                 pyramid=False, index=False, database=None, trace=None, **params):
+        self.stype = stype
+        self.data_dir = data_dir
+        self.interval = interval
+        self.n = n
+        self.wait = wait
+        self.signals = list(signals)
+        self.prefix = stype if prefix is None else prefix
+        self.ring = ring
+        self.adaptive = adaptive
+        self.qc = qc
+        self.pyramid = pyramid
+        self.index = index
+        self.params = params
+        self.sensors = []
+
+        self.rec = None
+        if trace is not None:
+            from .trace import Recorder
+            self.rec = Recorder(trace)
+        self.db = None
+        if database is not None:
+            from .database import Database
+            self.db = Database(database)
+        self.pub = None
+        if publish is not None:
+            from .stream import Publisher
+            self.pub = Publisher(publish)
+        self.dash = None
+        if dashboard is not None:
+            from .dashboard import Dashboard
+            self.dash = Dashboard(dashboard)
+
+    def add(self, sensor, name=None):
+        """
+        Send the readings of a sensor to the outputs.
+
+        Parameters
+        ----------
+        sensor : Driver
+            A sensor read by the logger.
+        name : str
+            Distinguishes the sensor's QC and sampling files, pyramids
+            and ring buffer from those of the logger's other sensors
+            (e.g. the units of a `swmeas.k30bus.CO2Bus`).
+        """
+        suffix = '' if name is None else '_' + name
+        out = {'sensor': sensor, 'suffix': suffix}
+        if self.index:
+            sensor.index_files()
+        if self.rec is not None:
+            self.rec.attach(sensor, interval=self.interval, n=self.n, wait=self.wait, **self.params)
+        if self.ring is not None:
+            from .ringbuffer import SharedRing
+            out['ring'] = SharedRing('{}_{}{}'.format(self.ring, self.stype, suffix),
+                                     width=len(value_fields(sensor.DTYPE)) + 1, create=True)
+        if self.adaptive is not None and self.signals:
+            from .adaptive import AdaptiveSampler
+            out['sampler'] = AdaptiveSampler(self.interval, **self.adaptive)
+        if self.qc:
+            from .qc import QCStage
+            out['qc'] = QCStage(self.stype, self.qc if isinstance(self.qc, dict) else None,
+                                fields=value_fields(sensor.DTYPE))
+        if self.pyramid:
+            from .pyramid import Pyramid
+            out['pyramids'] = [(f, Pyramid(self.data_dir + '/pyramid', pname + suffix), scale)
+                               for f, pname, scale in self.signals]
+        self.sensors.append(out)
+
+    def write(self, save_dir):
+        """
+        Pass the last batch of every sensor to the outputs.
+
+        QC flags are set before the batch is published or stored.
+
+        Parameters
+        ----------
+        save_dir : str
+            Folder of the batch's data files, for the QC and sampling
+            files.
+
+        Returns
+        -------
+        float : the interval to the next batch, the shortest one asked
+        for by the adaptive samplers (or the logger's interval).
+        """
+        if self.pub is not None or self.dash is not None:
+            from .stream import reading_message
+        samplers = []
+        for out in self.sensors:
+            sensor, suffix = out['sensor'], out['suffix']
+            batch = sensor.batch
+            if 'qc' in out:
+                out['qc'](batch)
+                out['qc'].write('{}/{}{}_qc.csv'.format(save_dir, self.prefix, suffix), batch)
+            for f, pyr, scale in out.get('pyramids', []):
+                pyr.add(batch.column('time'), batch.column(f) * scale)
+            if self.pub is not None or self.dash is not None:
+                msg = reading_message(self.stype, sensor.label, sensor.last_read)
+                if self.pub is not None:
+                    self.pub.publish(msg)
+                if self.dash is not None:
+                    self.dash.publish(msg)
+            if self.db is not None:
+                self.db.write(self.stype, getattr(sensor, 'name', '') or getattr(sensor, 'ID', None)
+                              or self.stype + suffix, batch)
+            if 'ring' in out:
+                from .ringbuffer import readings_to_array
+                out['ring'].append(readings_to_array(sensor.last_read))
+            if 'sampler' in out:
+                f, _, scale = self.signals[0]
+                out['sampler'].update(batch.column('time'), batch.column(f) * scale)
+                samplers.append((out, batch.column('time')[0]))
+        if samplers:
+            # every sensor is read each loop, so follow the busiest signal
+            self.interval = min(out['sampler'].interval for out, _ in samplers)
+            for out, t in samplers:
+                out['sampler'].interval = self.interval
+                out['sampler'].write('{}/{}{}_sampling.csv'.format(save_dir, self.stype, out['suffix']),
+                                     t, self.n, self.wait)
+        if self.rec is not None:
+            self.rec.flush()
+        return self.interval
+
+    def close(self):
+        """
+        Close the streams, ring buffers, database and trace.
+        """
+        if self.pub is not None:
+            self.pub.close()
+        if self.dash is not None:
+            self.dash.close()
+        for out in self.sensors:
+            if 'ring' in out:
+                out['ring'].close()
+        if self.db is not None:
+            self.db.close()
+        if self.rec is not None:
+            self.rec.close()
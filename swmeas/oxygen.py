@@ -0,0 +1,214 @@
+import os
+import json
+from itertools import groupby
+import numpy as np
+
+from .merge import RAW_O2_COLUMNS
+from .carbonate import vapour_pressure
+from .helpers import encode_rows
+
+replace = getattr(os, 'replace', os.rename)
+
+# multiplier converting raw Piccolo2 integers to physical units
+RAW_O2_UNITS = {'status': (1, ''),
+                'dphi': (1e-3, 'degrees'),
+                'umolar': (1e-3, 'umol/L'),
+                'mbar': (1e-3, 'mbar'),
+                'airSat': (1e-3, '% air sat'),
+                'tempSample': (1e-3, 'C'),
+                'tempCase': (1e-3, 'C'),
+                'signalIntensity': (1e-3, 'mV'),
+                'ambientLight': (1e-3, 'mV'),
+                'pressure': (1e-3, 'mbar'),
+                'humidity': (1e-3, '% RH'),
+                'resistorTemp': (1e-3, 'Ohm'),
+                'percentO2': (1e-3, '% O2')}
+
+# {mode: raw field} written to o2.csv
+O2_MODES = {'water': 'umolar',
+            'air': 'percentO2'}
+
+# ml/L -> umol/L for an ideal gas at STP (Garcia & Gordon, 1992)
+ML_TO_UMOL = 44.6596
+
+
+def convert_raw(raw):
+    """
+    Convert raw Piccolo2 records to physical units.
+
+    Parameters
+    ----------
+    raw : array_like
+        (n, 13) array of raw integer fields, in the order returned
+        by `O2_sensor.read` (excluding time).
+
+    Returns
+    -------
+    dict of arrays, keyed by field name.
+    """
+    raw = np.atleast_2d(np.asarray(raw, dtype=float))
+    scale = np.array([RAW_O2_UNITS[k][0] for k in RAW_O2_COLUMNS])
+    phys = raw * scale
+    return {k: phys[:, i] for i, k in enumerate(RAW_O2_COLUMNS)}
+
+
+def O2_solubility(T, S, P=1.):
+    """
+    O2 solubility in seawater, in equilibrium with water-saturated air.
+
+    Garcia & Gordon (1992), Benson & Krause coefficients.
+
+    Parameters
+    ----------
+    T : array_like
+        Temperature (C).
+    S : array_like
+        Salinity.
+    P : array_like
+        Total pressure (atm).
+
+    Returns
+    -------
+    array
+        Solubility (umol/L).
+    """
+    T = np.asarray(T, dtype=float)
+    S = np.asarray(S, dtype=float)
+    Ts = np.log((298.15 - T) / (273.15 + T))
+    lnC = (2.00907 + 3.22014 * Ts + 4.05010 * Ts ** 2 + 4.94457 * Ts ** 3 -
+           0.256847 * Ts ** 4 + 3.88767 * Ts ** 5 +
+           S * (-6.24523e-3 - 7.37614e-3 * Ts - 1.03410e-2 * Ts ** 2 - 8.17083e-3 * Ts ** 3) -
+           4.88682e-7 * S ** 2)
+    pw = vapour_pressure(T, S)
+    return np.exp(lnC) * ML_TO_UMOL * (np.asarray(P) - pw) / (1 - pw)
+
+
+def O2_saturation(O2, T, S, P=1.):
+    """
+    O2 saturation (%) of an O2 concentration (umol/L).
+    """
+    return 100. * np.asarray(O2, dtype=float) / O2_solubility(T, S, P)
+
+
+def derive(raw, S=35., P=None):
+    """
+    Physical units, solubility and saturation from raw records.
+
+    Parameters
+    ----------
+    raw : array_like
+        (n, 13) array of raw fields.
+    S : array_like
+        Salinity.
+    P : array_like
+        Pressure (atm). If None, uses the meter's pressure field
+        where available, or 1 atm.
+
+    Returns
+    -------
+    dict of arrays
+        Fields of `convert_raw`, plus 'solubility' (umol/L) and
+        'saturation' (%).
+    """
+    out = convert_raw(raw)
+    if P is None:
+        P = np.where(out['pressure'] > 0, out['pressure'] / 1013.25, 1.)
+    out['solubility'] = O2_solubility(out['tempSample'], S, P)
+    out['saturation'] = 100. * out['umolar'] / out['solubility']
+    return out
+
+
+def _read_raw(path):
+    """
+    Read TempO2_raw.csv. Returns (header lines, time strs, raw array).
+    """
+    header = []
+    times = []
+    rows = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('#'):
+                header.append(line)
+            elif line.strip():
+                r = line.rstrip().split(',')
+                times.append(r[0])
+                rows.append(r[1:])
+    return header, times, np.array(rows, dtype=float).reshape(len(rows), len(RAW_O2_COLUMNS))
+
+
+def _batches(path):
+    """
+    The batches of a Temp or O2 batch file, as (time str of the first
+    reading, number of readings) of each row.
+    """
+    out = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.startswith('#') and line.strip():
+                r = line.rstrip().split(',')
+                out.append((r[0], len(r) - 1))
+    return out
+
+
+def rederive_TempO2(raw_path, Tpath='temp.csv', O2path='o2.csv', mode='water', n=None):
+    """
+    Regenerate Temp and O2 batch files from a TempO2_raw.csv log.
+
+    Parameters
+    ----------
+    raw_path : str
+        Path to TempO2_raw.csv.
+    Tpath, O2path : str
+        Output files, replaced once the new ones are complete.
+    mode : str
+        'air' or 'water', or any raw field name.
+    n : int
+        Readings per batch. If None, the batches of the existing Tpath
+        are kept (so a logger restarted with another n is followed),
+        or if there isn't one, n is taken from logTempO2.json alongside
+        raw_path (or its parent folder).
+    """
+    field = O2_MODES.get(mode, mode)
+    if field not in RAW_O2_COLUMNS:
+        raise ValueError("mode must be either 'water', 'air' or a raw field name.")
+
+    header, times, raw = _read_raw(raw_path)
+    phys = convert_raw(raw)
+    label = header[0][2:] if header else '\n'
+
+    if n is None and os.path.exists(Tpath):
+        batches = _batches(Tpath)
+    else:
+        if n is None:
+            d = os.path.dirname(os.path.abspath(raw_path))
+            for p in (d, os.path.dirname(d)):
+                par_file = os.path.join(p, 'logTempO2.json')
+                if os.path.exists(par_file):
+                    with open(par_file, 'r') as f:
+                        n = json.load(f)['n']
+                    break
+            else:
+                raise ValueError('n not specified, and no logTempO2.json found.')
+        batches = [(times[i], n) for i in range(0, len(times) // n * n, n)]
+
+    first = {}
+    for i, t in enumerate(times):
+        first.setdefault(t, i)
+    # a batch written just before a crash may be missing from the raw file
+    batches = [(first[t], k) for t, k in batches if t in first and first[t] + k <= len(times)]
+
+    Tstr, O2str = '', ''
+    for k, group in groupby(batches, key=lambda b: b[1]):
+        start = np.array([i for i, _ in group])
+        idx = start[:, None] + np.arange(k)
+        tb = [times[i] for i in start]
+        Tstr += encode_rows(tb, phys['tempSample'][idx], dec=2)
+        O2str += encode_rows(tb, phys[field][idx], dec=2)
+
+    for path, title, out_str in ((Tpath, 'Temperature (C)', Tstr),
+                                 (O2path, 'O2 ({}, {})'.format(mode, RAW_O2_UNITS[field][1]), O2str)):
+        with open(path + '.tmp', 'w') as f:
+            f.write('# {}# Time (UTC),{}\n'.format(label, title))
+            f.write(out_str)
+        replace(path + '.tmp', path)
+    return
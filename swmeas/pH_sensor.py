@@ -1,9 +1,25 @@
-import time
 import u6
+import numpy as np
+from .records import PH_DTYPE, new_reading, reading_dtype, ph_fields, value_fields
+from .driver import Driver, register
+from .helpers import RowEncoder
 
-class pH_sensor(object):
+# default probe: pH on AIN2, temperature on AIN0
+PROBES = [('', (2, 0))]
+
+# U6 feedback packets are at most 64 bytes, both ways: the command has
+# a 7 byte header and 4 bytes per AIN24, and the response a 9 byte
+# header and 3 bytes per AIN24 (so 14 AIN24s per transaction)
+MAX_FEEDBACK = min((64 - 7) // 4, (64 - 9) // 3)
+
+
+@register
+class pH_sensor(Driver):
     """
-    Connect to and take measurements from a Durafit pH probe via a LabJack U6-Pro
+    Connect to and take measurements from Durafit pH probes via a LabJack U6-Pro
+
+    All probes are read in a single feedback transaction (split only if
+    it exceeds the U6's packet size), and converted to voltages together.
 
     For LabJack Communication Protocol, refer to LabJackPython [1] and the U6-Pro
     User Guide [2]
@@ -16,16 +32,61 @@ class pH_sensor(object):
     GainIndex : int
         The GainIndex used in recording measurements. See `u6.U6().getFeedback()`
         documentation.
+    probes : dict or list
+        {name: (pH channel, temperature channel)}, or a list of
+        (name, (pH channel, temperature channel)) pairs, of each probe.
+        Readings have fields pH_{name} and pH_temp_{name} for each probe
+        (see `swmeas.records.ph_fields`). Defaults to a single probe
+        named '' on AIN2 and AIN0, with fields pH and pH_temp.
+    connect : bool
+        If False, the LabJack isn't connected (or calibrated). Used to
+        parse readings taken elsewhere (e.g. replayed from a trace).
     """
-    def __init__(self, GainIndex=0):
+    STYPE = 'pH'
+    DTYPE = PH_DTYPE
+    HEADER = 'Time (UTC),pH (V),pH temperature (V),LabJack temperature (K)'
+    # probe signals are a few mV, so record them to the uV
+    ENCODER = RowEncoder(dec=6)
+
+    def __init__(self, GainIndex=0, probes=None, connect=True):
+        if probes is None:
+            probes = PROBES
+        elif isinstance(probes, dict):
+            probes = sorted(probes.items())
+        # channels may be lists, e.g. once saved to json
+        self.probes = [(name, tuple(channels)) for name, channels in probes]
+        if self.probes != PROBES:
+            self.DTYPE = reading_dtype(ph_fields(n for n, _ in self.probes))
+            self.HEADER = 'Time (UTC),' + ','.join(
+                '{} ({})'.format(f, 'K' if f == 'LJ_temp' else 'V') for f in value_fields(self.DTYPE))
+        # fields filled from the voltages of the probe channels
+        self.volt_fields = value_fields(self.DTYPE)[:-1]
+        Driver.__init__(self)
+        self.label = '{} sensor ({} probes) on LabJack U6\n'.format(self.STYPE, len(self.probes))
+        self.gainindex = GainIndex
+        if not connect:
+            return
         self.connect()
         self.config = self.sensor.configU6()
-        self.gainindex = GainIndex
-        self.last_read = None
-        # define read commands
-        self.comm = {'LJTemp': u6.AIN24(14),
-                     'pH': u6.AIN24(2, ResolutionIndex=12, GainIndex=self.gainindex),
-                     'Temp': u6.AIN24(0, ResolutionIndex=9, GainIndex=self.gainindex)}
+        # define read commands: pH and temperature of each probe, then
+        # the LabJack's own temperature
+        self.comm = []
+        for name, (pH, temp) in self.probes:
+            self.comm += [u6.AIN24(pH, ResolutionIndex=12, GainIndex=self.gainindex),
+                          u6.AIN24(temp, ResolutionIndex=9, GainIndex=self.gainindex)]
+        self.comm.append(u6.AIN24(14))
+        self.calibrate()
+
+    def calibrate(self):
+        """
+        Cache the U6's calibration constants, as used by
+        binaryToCalibratedAnalogVoltage and
+        binaryToCalibratedAnalogTemperature.
+        """
+        self.cal = self.sensor.getCalibratedSlopesCenter(self.gainindex, 0)
+        self.cal_temp = self.sensor.getCalibratedSlopesCenter(0, 1)
+        self.temp_slope = self.sensor.calInfo.temperatureSlope
+        self.temp_offset = self.sensor.calInfo.temperatureOffset
 
     def connect(self):
         """
@@ -42,41 +103,62 @@ class pH_sensor(object):
         """
         self.sensor.close()
 
-    def read(self):
+    def transact(self):
         """
-        Read Durafit pH and Temperature voltage, and LabJack Temperature.
-
-        Returns
-        -------
-        [time, pH voltage, probe temperature voltage, LabJack temperature Kelvin]
+        Read the pH and temperature channels of every probe, and the
+        LabJack temperature.
         """
-        # time at start of measurement
-        tnow = time.strftime('%Y-%m-%d-%H:%M:%S', time.localtime())
-
-        # record bits from LabJack
-        bLJ_temp, bpH_temp, bpH = self.sensor.getFeedback(self.comm['LJTemp'], self.comm['Temp'], self.comm['pH'])
-
-        # convert to temperature / voltage
-        LJ_temp = self.sensor.binaryToCalibratedAnalogTemperature(bLJ_temp)
-        pH_temp = self.sensor.binaryToCalibratedAnalogVoltage(self.gainindex, bpH_temp)
-        pH = self.sensor.binaryToCalibratedAnalogVoltage(self.gainindex, bpH)
+        bits = []
+        for i in range(0, len(self.comm), MAX_FEEDBACK):
+            bits += self.sensor.getFeedback(*self.comm[i:i + MAX_FEEDBACK])
+        return bits
 
-        self.last_read = [tnow, pH, pH_temp, LJ_temp]
+    @staticmethod
+    def to_volts(bits, cal):
+        """
+        Calibrated voltages of raw 24 bit readings (vectorised
+        binaryToCalibratedAnalogVoltage).
 
-        return self.last_read
+        Parameters
+        ----------
+        bits : array_like
+            Raw readings.
+        cal : tuple
+            (negSlope, posSlope, center) of the gain and resolution used.
+        """
+        negSlope, posSlope, center = cal
+        b = np.asarray(bits, dtype=float) / 256.
+        return np.where(b < center, (center - b) * negSlope, (b - center) * posSlope)
 
-    def read_multi(self, n, wait=1.):
+    def parse(self, bits, t_utc, t_mono, latency, out=None):
         """
-        Read Durafit pH and Temperature voltage, and LabJack Temperature.
+        Fill a record from the result of getFeedback.
 
-        Returns
-        -------
-        n * [time, pH voltage, probe temperature voltage, LabJack temperature Kelvin]
+        Parameters
+        ----------
+        bits : list
+            Raw readings of the pH and temperature channels of each
+            probe, then of the LabJack temperature.
+        t_utc, t_mono : float
+            Epoch and monotonic time at the start of the measurement.
+        latency : float
+            Duration of the measurement (s).
+        out : numpy record
+            Record (of DTYPE) to fill. If None, a new one is created.
         """
+        # convert to temperature / voltage
+        volts = self.to_volts(bits[:-1], self.cal)
+        LJ_temp = self.temp_slope * self.to_volts(bits[-1:], self.cal_temp)[0] + self.temp_offset
 
-        out = []
-        for i in range(n):
-            out.append(self.read())
-            time.sleep(wait)
+        if out is None:
+            out = new_reading(self.DTYPE)
+        out['time'] = t_utc
+        out['t_mono'] = t_mono
+        out['latency'] = latency
+        for f, v in zip(self.volt_fields, volts):
+            out[f] = v
+        out['LJ_temp'] = LJ_temp
+        out['flag'] = 0
         self.last_read = out
-        return out
\ No newline at end of file
+
+        return out
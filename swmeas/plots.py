@@ -6,6 +6,7 @@ from matplotlib.animation import FuncAnimation
 from matplotlib import dates
 from datetime import timedelta
 from dateutil import parser
+from .pyramid import Pyramid
 
 
 def dfmt(dstr):
@@ -15,7 +16,94 @@ def dfmt(dstr):
     return dates.date2num(parser.parse(dstr))
 
 
-def liveplot(files, directory='./', xlim_min=60, interval=10, latest_dir=False):
+def epoch2dt(t):
+    """
+    Epoch seconds to datetime64, for plotting.
+    """
+    return (np.asarray(t) * 1000).astype('datetime64[ms]')
+
+
+def draw_pyramid(ax, pyr, t0, t1, max_points=1000):
+    """
+    Draw the bins of the level of pyr suited to the window t0-t1
+    (epoch seconds): the mean as a line, min-max range shaded.
+
+    Returns
+    -------
+    The level label, or None if the window is too short for any level
+    (nothing is drawn).
+    """
+    label, d = pyr.window(t0, t1, max_points)
+    if label is None:
+        return None
+    t, n, mn, mx, mean = d
+    t = epoch2dt(t)
+    ax.plot(t, mean, c='k', drawstyle='steps-post')
+    ax.fill_between(t, mn, mx, color=(0, 0, 0, 0.2), zorder=-1, step='post')
+    return label
+
+
+def plot_pyramid(names, directory='./log_data/pyramid', start=None, end=None, max_points=1000):
+    """
+    Plot long records from their pyramids (see `swmeas.pyramid`).
+
+    The level shown is chosen for the visible window, and re-chosen
+    when zooming or panning, so even years of data draw quickly.
+
+    Parameters
+    ----------
+    names : str or list
+        Pyramid names (e.g. 'co2').
+    directory : str
+        Folder containing the pyramids.
+    start, end : float
+        Window to show (epoch seconds). Defaults to all data.
+    max_points : int
+        Maximum number of bins drawn per variable.
+    """
+    if isinstance(names, str):
+        names = [names]
+    pyrs = [Pyramid(directory, n) for n in names]
+    if start is None or end is None:
+        coarse = [p.level(p.levels[-1][0])[0] for p in pyrs]
+        coarse = np.concatenate(coarse)
+        if start is None:
+            start = coarse.min()
+        if end is None:
+            end = coarse.max() + pyrs[0].levels[-1][1]
+
+    fig, axs = plt.subplots(len(names), 1, figsize=(5, 2 * len(names)), sharex=True, squeeze=False)
+    axs = axs[:, 0]
+    state = {'busy': False}
+
+    def redraw(t0, t1):
+        state['busy'] = True
+        for ax, pyr in zip(axs, pyrs):
+            ax.clear()
+            label = draw_pyramid(ax, pyr, t0, t1, max_points)
+            if label is None:
+                # too short for the pyramid: draw the finest level anyway
+                d = pyr.level(pyr.levels[0][0])
+                ax.plot(epoch2dt(d[0]), d[4], c='k', drawstyle='steps-post')
+                label = pyr.levels[0][0]
+            ax.set_ylabel('{} ({})'.format(pyr.name, label))
+        axs[0].set_xlim(epoch2dt(t0), epoch2dt(t1))
+        state['busy'] = False
+
+    def on_xlim(ax):
+        if not state['busy']:
+            x0, x1 = ax.get_xlim()
+            redraw(dates.num2date(x0).timestamp(), dates.num2date(x1).timestamp())
+
+    redraw(start, end)
+    for ax in axs:
+        ax.callbacks.connect('xlim_changed', on_xlim)
+    fig.tight_layout(rect=(0.05, .0, 1, 1))
+    plt.show()
+    return fig, axs
+
+
+def liveplot(files, directory='./', xlim_min=60, interval=10, latest_dir=False, pyramid=None):
     """
     create a live plot of the files listed in paths
 
@@ -32,6 +120,11 @@ def liveplot(files, directory='./', xlim_min=60, interval=10, latest_dir=False):
     dir : str
         If True, searches for most recently named
         dir in path. Useful for plotting logs.
+    pyramid : str
+        Folder containing pyramids of the files (e.g.
+        './log_data/pyramid', see `swmeas.pyramid`). If given,
+        windows long enough are drawn from the appropriate pyramid
+        level instead of the raw files, so xlim_min can span months.
     """
     if latest_dir:
         try:
@@ -60,6 +153,18 @@ def liveplot(files, directory='./', xlim_min=60, interval=10, latest_dir=False):
     def liveplot(i, axs, files):
 
         for ax, file in zip(axs.flat, files):
+            if pyramid is not None:
+                pyr = Pyramid(pyramid, os.path.splitext(os.path.basename(file))[0])
+                t = pyr.level(pyr.levels[0][0])[0]
+                if len(t) > 0:
+                    t1 = t[-1] + pyr.levels[0][1]
+                    ax.clear()
+                    label = draw_pyramid(ax, pyr, t1 - xlim_min * 60., t1)
+                    if label is not None:
+                        ax.set_ylabel('{} ({})'.format(os.path.basename(file), label))
+                        ax.set_xlim(epoch2dt(t1 - xlim_min * 60.), epoch2dt(t1))
+                        continue
+
             # load data
             d = np.genfromtxt(filepath + '/' + file, delimiter=',', converters={0: dfmt})
 
@@ -0,0 +1,131 @@
+import os
+
+from . import clock
+from .records import monotonic, format_time
+
+
+class DutyCycle(object):
+    """
+    Power an O2 meter down between logging cycles.
+
+    Between measurements the meter is switched off, and switched back
+    on ahead of the next measurement by the time it takes to warm up.
+    The warm-up time is learned: after each power-up the meter's
+    status is polled, poll_wait seconds apart, until it is 0, and the
+    time taken updates a running (exponentially weighted) estimate.
+
+    Parameters
+    ----------
+    sensor : O2_sensor
+        A connected meter.
+    warmup : float
+        Initial estimate of the warm-up time (seconds).
+    margin : float
+        Extra time (seconds) allowed before each deadline.
+    min_off : float
+        The meter is only powered down if it would be off for at
+        least this long (seconds).
+    alpha : float
+        Weight of each new warm-up measurement in the estimate.
+    max_polls : int
+        Maximum number of status polls while waiting for warm-up.
+    poll_wait : float
+        Seconds between status polls.
+    power_on_W, power_off_W : float
+        Power draw when on / off (W), used to estimate energy use.
+        Nominal values: measure your own hardware.
+    """
+
+    def __init__(self, sensor, warmup=2., margin=.5, min_off=5., alpha=.3,
+                 max_polls=10, poll_wait=.5, power_on_W=.3, power_off_W=.005):
+        self.sensor = sensor
+        self.warmup = float(warmup)
+        self.margin = float(margin)
+        self.min_off = float(min_off)
+        self.alpha = float(alpha)
+        self.max_polls = max_polls
+        self.poll_wait = float(poll_wait)
+        self.power_on_W = power_on_W
+        self.power_off_W = power_off_W
+
+        self.on_time = 0.
+        self.off_time = 0.
+        self.cycles = 0
+        self.last_change = monotonic()
+
+    def _account(self):
+        now = monotonic()
+        if self.sensor.powered:
+            self.on_time += now - self.last_change
+        else:
+            self.off_time += now - self.last_change
+        self.last_change = now
+
+    def wake(self):
+        """
+        Power up the meter and wait until it returns valid readings.
+
+        Returns
+        -------
+        float : the measured warm-up time (seconds).
+        """
+        self._account()
+        t0 = monotonic()
+        self.sensor.power_on(verbose=False)
+        for _ in range(self.max_polls):
+            if self.sensor.status() == 0:
+                break
+            clock.sleep(self.poll_wait)
+        measured = monotonic() - t0
+        self.warmup = (1 - self.alpha) * self.warmup + self.alpha * measured
+        self.cycles += 1
+        return measured
+
+    def idle(self, seconds):
+        """
+        Spend `seconds` between measurements, powered down if possible.
+
+        The meter is powered back up so that it is warm when the
+        time is up.
+        """
+        deadline = monotonic() + seconds
+        lead = self.warmup + self.margin
+        if seconds - lead >= self.min_off:
+            self._account()
+            self.sensor.power_off(verbose=False)
+            clock.sleep(max(0, deadline - lead - monotonic()))
+            self.wake()
+        remaining = deadline - monotonic()
+        if remaining > 0:
+            clock.sleep(remaining)
+
+    def report(self):
+        """
+        Energy use and duty ratio since the DutyCycle was created.
+
+        Returns
+        -------
+        dict
+        """
+        self._account()
+        total = self.on_time + self.off_time
+        energy = self.on_time * self.power_on_W + self.off_time * self.power_off_W
+        return {'on_time': self.on_time,
+                'off_time': self.off_time,
+                'duty': self.on_time / total if total > 0 else 1.,
+                'energy_Wh': energy / 3600.,
+                'always_on_Wh': total * self.power_on_W / 3600.,
+                'warmup': self.warmup,
+                'cycles': self.cycles}
+
+    def write(self, path, t):
+        """
+        Append the current power report to a csv file.
+        """
+        if not os.path.exists(path):
+            with open(path, 'a+') as f:
+                f.write('# Duty cycling\n# Time (UTC),warmup (s),duty,energy (Wh),always on (Wh)\n')
+        r = self.report()
+        with open(path, 'a+') as f:
+            f.write('{},{:.2f},{:.4f},{:.5f},{:.5f}\n'.format(
+                format_time(t), r['warmup'], r['duty'], r['energy_Wh'], r['always_on_Wh']))
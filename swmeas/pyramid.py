@@ -0,0 +1,247 @@
+import os
+import json
+import numpy as np
+
+from .records import format_time
+from .merge import read_log
+
+replace = getattr(os, 'replace', os.rename)
+
+# (label, bin width in seconds), finest first
+LEVELS = [('1min', 60),
+          ('10min', 600),
+          ('1h', 3600),
+          ('1day', 86400)]
+
+
+def combine(start, n, mn, mx, sm, width):
+    """
+    Combine (sorted) bins, or single values, into bins of `width` seconds.
+
+    Parameters
+    ----------
+    start : array
+        Bin start times (or value times), epoch seconds.
+    n, mn, mx, sm : array
+        Count, minimum, maximum and sum of each bin.
+    width : float
+        Width of the output bins (seconds).
+
+    Returns
+    -------
+    (start, n, min, max, sum) of the output bins.
+    """
+    b = np.floor(np.asarray(start, dtype=float) / width) * width
+    if len(b) == 0:
+        return b, n, mn, mx, sm
+    # late arrivals are counted in the latest bin
+    b = np.maximum.accumulate(b)
+    idx = np.concatenate([[0], np.flatnonzero(np.diff(b)) + 1])
+    return (b[idx], np.add.reduceat(n, idx), np.minimum.reduceat(mn, idx),
+            np.maximum.reduceat(mx, idx), np.add.reduceat(sm, idx))
+
+
+class Pyramid(object):
+    """
+    Multi-resolution min/max/mean summaries of a logged variable.
+
+    Each level is a csv file of (time, n, min, max, mean) bins, named
+    '{name}_{label}.csv' in `directory`. Bins are written as they are
+    completed; the incomplete bin of each level, and the read offsets
+    of followed log files, are kept in '{name}_pyramid.json' so the
+    pyramid can be updated incrementally, across restarts.
+
+    A pyramid should have a single writer (the logger, or `build`).
+    Any number of readers can use `level` and `window`.
+
+    Parameters
+    ----------
+    directory : str
+        Folder containing the pyramid files.
+    name : str
+        Name of the variable (e.g. 'co2').
+    levels : list
+        (label, bin width in seconds) of each level, finest first.
+    """
+
+    def __init__(self, directory, name, levels=LEVELS):
+        self.directory = directory
+        self.name = name
+        self.levels = levels
+        self.state_path = os.path.join(directory, '{}_pyramid.json'.format(name))
+        self.cache = {label: (np.empty(0), np.empty((0, 4)), 0) for label, _ in levels}
+        self.load_state()
+
+    def path(self, label):
+        return os.path.join(self.directory, '{}_{}.csv'.format(self.name, label))
+
+    def load_state(self):
+        """
+        (Re)load the open bins and source offsets.
+        """
+        self.open = {}
+        self.offsets = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            self.open = {k: tuple(v) for k, v in state['open'].items()}
+            self.offsets = state['offsets']
+
+    def save_state(self):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'open': self.open, 'offsets': self.offsets}, f)
+        replace(tmp, self.state_path)
+
+    def add(self, t, values):
+        """
+        Add readings to the pyramid.
+
+        Parameters
+        ----------
+        t : array_like
+            Epoch times, in order.
+        values : array_like
+            Values, (m,) or (m, k) for k values per time. NaNs are ignored.
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        t = np.asarray(t, dtype=float)
+        v = np.asarray(values, dtype=float).reshape(len(t), -1)
+        t = np.repeat(t, v.shape[1])
+        v = v.ravel()
+        ok = ~np.isnan(v)
+        t, v = t[ok], v[ok]
+        bins = (t, np.ones(len(t)), v, v, v.copy())
+
+        for label, width in self.levels:
+            if label in self.open:
+                bins = tuple(np.concatenate([[o], b]) for o, b in zip(self.open[label], bins))
+            if len(bins[0]) == 0:
+                break
+            bins = combine(*bins, width=width)
+            self.open[label] = tuple(float(b[-1]) for b in bins)
+            bins = tuple(b[:-1] for b in bins)
+            if len(bins[0]) > 0:
+                self._write(label, bins)
+        self.save_state()
+
+    def _write(self, label, bins):
+        path = self.path(label)
+        new = not os.path.exists(path)
+        start, n, mn, mx, sm = bins
+        with open(path, 'a+') as f:
+            if new:
+                f.write('# {} ({} bins)\n# Time (UTC),n,min,max,mean\n'.format(self.name, label))
+            f.write(''.join('{},{:d},{:.3f},{:.3f},{:.3f}\n'.format(*r) for r in
+                            zip(format_time(start), n.astype(int), mn, mx, sm / n)))
+
+    def update(self, path):
+        """
+        Add the rows of a log file written since the last update.
+
+        Parameters
+        ----------
+        path : str
+            A batch log file (e.g. co2.csv).
+        """
+        key = os.path.abspath(path)
+        t, v, offset = read_log(path, self.offsets.get(key, 0))
+        self.offsets[key] = offset
+        if len(t) > 0:
+            self.add(t, v)
+        else:
+            self.save_state()
+
+    def level(self, label):
+        """
+        All bins of a level, including the bin in progress.
+
+        Returns
+        -------
+        (t, n, min, max, mean) : tuple of arrays
+        """
+        t, b, offset = self.cache[label]
+        nt, nb, offset = read_log(self.path(label), offset)
+        if len(nt) > 0:
+            t = np.concatenate([t, nt])
+            b = np.concatenate([b, nb[:, :4]])
+            self.cache[label] = (t, b, offset)
+
+        # the bin in progress includes the open bins of finer levels
+        width = dict(self.levels)[label]
+        opened = [self.open[l] for l, w in self.levels if w <= width and l in self.open]
+        if opened:
+            # coarsest first, so bin starts are in order
+            ot, on, omn, omx, osm = combine(*np.array(opened).T[:, ::-1], width=width)
+            new = ot > t[-1] if len(t) > 0 else np.ones(len(ot), dtype=bool)
+            t = np.concatenate([t, ot[new]])
+            b = np.concatenate([b, np.column_stack([on, omn, omx, osm / on])[new]])
+        return t, b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+
+    def choose(self, span, max_points=1000, min_points=30):
+        """
+        Label of the finest level with at most max_points bins in span
+        seconds, or None if that level has fewer than min_points bins
+        (i.e. the raw data should be used).
+        """
+        for label, width in self.levels:
+            if span / float(width) <= max_points:
+                if span / float(width) < min_points:
+                    return None
+                return label
+        return self.levels[-1][0]
+
+    def window(self, t0, t1, max_points=1000, min_points=30):
+        """
+        The bins of the appropriate level between t0 and t1.
+
+        Returns
+        -------
+        (label, (t, n, min, max, mean)), where label is None if the
+        window is short enough to use the raw data.
+        """
+        label = self.choose(t1 - t0, max_points, min_points)
+        if label is None:
+            return None, None
+        d = self.level(label)
+        width = dict(self.levels)[label]
+        i0, i1 = np.searchsorted(d[0], [t0 - width, t1], side='right')
+        return label, tuple(x[i0:i1] for x in d)
+
+
+def build(directory, file, name=None, out_dir=None, levels=LEVELS):
+    """
+    Build (or bring up to date) the pyramid of a logged file.
+
+    Reads `file` in directory, and in any subdirectories (e.g. those
+    created by new_folder_every) in sorted order. Rows already added
+    are skipped, so this can be re-run as the log grows.
+
+    Parameters
+    ----------
+    directory : str
+        Log folder.
+    file : str
+        Batch log file name (e.g. 'co2.csv').
+    name : str
+        Pyramid name. Defaults to the file name without extension.
+    out_dir : str
+        Pyramid folder. Defaults to directory/pyramid.
+
+    Returns
+    -------
+    Pyramid
+    """
+    if name is None:
+        name = os.path.splitext(file)[0]
+    if out_dir is None:
+        out_dir = os.path.join(directory, 'pyramid')
+    pyr = Pyramid(out_dir, name, levels)
+    paths = [os.path.join(directory, file)]
+    paths += [os.path.join(directory, d, file) for d in sorted(os.listdir(directory))
+              if os.path.isdir(os.path.join(directory, d))]
+    for p in paths:
+        if os.path.exists(p):
+            pyr.update(p)
+    return pyr
@@ -0,0 +1,320 @@
+import os
+import warnings
+import numpy as np
+
+from .records import O2_FIELDS, format_time
+
+# QC flag bits. A reading's flag is the bitwise OR of all that apply.
+QC_OK = 0
+QC_MISSING = 1  # no, or incomplete, response from the sensor
+QC_COMM = 2  # response failed its checksum
+QC_RANGE = 4  # value outside plausible range
+QC_SPIKE = 8  # value departs from the local median
+QC_STUCK = 16  # value unchanged for too many readings
+QC_STATUS = 32  # O2 meter reported a non-zero status
+QC_SIGNAL = 64  # O2 signal intensity too low
+QC_AMBIENT = 128  # O2 ambient light too high
+
+FLAG_NAMES = {QC_MISSING: 'missing', QC_COMM: 'comm', QC_RANGE: 'range',
+              QC_SPIKE: 'spike', QC_STUCK: 'stuck', QC_STATUS: 'status',
+              QC_SIGNAL: 'signal', QC_AMBIENT: 'ambient'}
+
+# Default checks, by sensor type then field (raw sensor units). Fields
+# with a suffix (e.g. the pH_{probe} fields of several pH probes) take
+# the checks of the field they extend (see `field_config`).
+#   range : (min, max) plausible values
+#   spike : maximum departure from the running median
+#   stuck : maximum number of identical consecutive readings
+#   status : flag non-zero values
+#   min / max : (limit, flag) thresholds
+DEFAULT_QC = {
+    'CO2': {'co2': {'range': (0., 10000.), 'spike': 200., 'stuck': 20}},
+    'TempO2': {'status': {'status': True},
+               'umolar': {'range': (0., 1000000.), 'spike': 50000., 'stuck': 20},
+               'percentO2': {'range': (0., 100000.)},
+               'tempSample': {'range': (-5000., 45000.), 'spike': 2000.},
+               'signalIntensity': {'min': (20000., QC_SIGNAL)},
+               'ambientLight': {'max': (2000000., QC_AMBIENT)}},
+    'pH': {'pH': {'range': (-2.5, 2.5), 'spike': .05},
+           'pH_temp': {}},
+}
+
+SPIKE_WINDOW = 5
+
+
+def describe(flag):
+    """
+    Names of the flags set in a flag value.
+    """
+    return [name for bit, name in sorted(FLAG_NAMES.items()) if flag & bit]
+
+
+def range_check(x, lo, hi):
+    """
+    True where x is outside [lo, hi] (NaNs are not flagged).
+    """
+    x = np.asarray(x, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return (x < lo) | (x > hi)
+
+
+def running_median(x, window=SPIKE_WINDOW):
+    """
+    Centred running median, with edges padded by the nearest value.
+    """
+    x = np.asarray(x, dtype=float)
+    if len(x) == 0:
+        return x
+    h = window // 2
+    padded = np.concatenate([np.repeat(x[:1], h), x, np.repeat(x[-1:], h)])
+    idx = np.arange(len(x))[:, None] + np.arange(window)[None, :]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN windows
+        return np.nanmedian(padded[idx], axis=1)
+
+
+def spike_check(x, threshold, window=SPIKE_WINDOW):
+    """
+    True where x departs from its running median by more than threshold.
+    """
+    x = np.asarray(x, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.abs(x - running_median(x, window)) > threshold
+
+
+def stuck_check(x, n):
+    """
+    True for readings in runs of more than n identical values.
+    """
+    x = np.asarray(x, dtype=float)
+    if len(x) == 0:
+        return np.zeros(0, dtype=bool)
+    change = np.concatenate([[True], x[1:] != x[:-1]])
+    run = np.cumsum(change) - 1
+    length = np.bincount(run)
+    return length[run] > n
+
+
+def field_config(config, fields):
+    """
+    Checks of the fields of a sensor.
+
+    Each field takes the checks of the longest configured name that is
+    either the field itself or a prefix of it followed by '_', e.g.
+    pH_temp_a takes the checks of pH_temp, and pH_a those of pH.
+
+    Parameters
+    ----------
+    config : dict
+        {field: {check: parameters}}, as in DEFAULT_QC.
+    fields : list
+        Field names of the sensor's readings.
+
+    Returns
+    -------
+    dict : {field: {check: parameters}} of the fields with checks.
+    """
+    out = {}
+    for f in fields:
+        names = [k for k in config if f == k or f.startswith(k + '_')]
+        if names:
+            out[f] = config[max(names, key=len)]
+    return out
+
+
+def scale_config(checks, scale):
+    """
+    Checks of a field, with limits multiplied by scale (e.g. to apply
+    checks in raw units to values in physical units).
+    """
+    out = dict(checks)
+    if 'range' in checks:
+        out['range'] = tuple(v * scale for v in checks['range'])
+    if 'spike' in checks:
+        out['spike'] = checks['spike'] * scale
+    for k in ('min', 'max'):
+        if k in checks:
+            limit, bit = checks[k]
+            out[k] = (limit * scale, bit)
+    return out
+
+
+def check(data, config):
+    """
+    Vectorized QC of a set of fields.
+
+    Parameters
+    ----------
+    data : dict or structured array
+        Arrays of values, by field name, all of the same length.
+    config : dict
+        {field: {check: parameters}}, as in DEFAULT_QC. Fields missing
+        from data are skipped.
+
+    Returns
+    -------
+    array of uint16 flags, one per reading
+    """
+    if hasattr(data, 'dtype'):
+        n = len(data)
+    else:
+        n = len(next(iter(data.values()), []))
+    flags = np.zeros(n, dtype=np.uint16)
+    for field, checks in config.items():
+        try:
+            x = np.asarray(data[field], dtype=float)
+        except (KeyError, ValueError):
+            continue
+        flags[np.isnan(x)] |= QC_MISSING
+        if 'range' in checks:
+            flags[range_check(x, *checks['range'])] |= QC_RANGE
+        if 'spike' in checks:
+            flags[spike_check(x, checks['spike'])] |= QC_SPIKE
+        if 'stuck' in checks:
+            flags[stuck_check(x, checks['stuck'])] |= QC_STUCK
+        if checks.get('status'):
+            flags[np.nan_to_num(x) != 0] |= QC_STATUS
+        with np.errstate(invalid='ignore'):
+            if 'min' in checks:
+                limit, bit = checks['min']
+                flags[x < limit] |= bit
+            if 'max' in checks:
+                limit, bit = checks['max']
+                flags[x > limit] |= bit
+    return flags
+
+
+class QCStage(object):
+    """
+    Live QC of reading batches.
+
+    Keeps the tail of previous batches, so spike and stuck-value
+    checks see across batch boundaries. Flags are ORed into the
+    'flag' field of each reading, alongside any communication
+    flags set by the sensor.
+
+    Parameters
+    ----------
+    stype : str
+        Sensor type, a key of DEFAULT_QC.
+    config : dict
+        Checks to use instead of DEFAULT_QC[stype].
+    history : int
+        Number of previous readings kept.
+    fields : list
+        Value fields of the sensor's readings. If given, the checks
+        are matched to them with `field_config`, e.g. to check every
+        probe of a pH sensor.
+    """
+
+    def __init__(self, stype='CO2', config=None, history=50, fields=None):
+        self.config = DEFAULT_QC[stype] if config is None else config
+        if fields is not None:
+            self.config = field_config(self.config, fields)
+        self.history = history
+        self.tail = None
+
+    def __call__(self, batch):
+        """
+        Flag a ReadingBatch (or structured array) in place.
+
+        Returns
+        -------
+        array of flags for the batch.
+        """
+        arr = batch.array if hasattr(batch, 'array') else batch
+        if self.tail is None or len(self.tail) == 0:
+            joined = arr
+        else:
+            joined = np.concatenate([self.tail, arr])
+        flags = check(joined, self.config)[len(joined) - len(arr):]
+        arr['flag'] |= flags
+        self.tail = joined[-self.history:].copy()
+        return arr['flag']
+
+    def write(self, path, batch):
+        """
+        Append the batch's flags as a row (time, flag_0, ..., flag_n).
+        """
+        arr = batch.array if hasattr(batch, 'array') else batch
+        if not os.path.exists(path):
+            with open(path, 'a+') as f:
+                f.write('# QC flags (bitmask, see swmeas.qc)\n# Time (UTC),flags\n')
+        with open(path, 'a+') as f:
+            f.write(str(format_time(arr['time'][0])) + ',' +
+                    ','.join(str(v) for v in arr['flag']) + '\n')
+
+
+def batch_field(path, stype):
+    """
+    The field and scale of the values in a batch file: co2*.csv hold
+    co2, temp.csv tempSample and o2.csv the field of the mode in its
+    header, both in physical units (see `swmeas.oxygen.RAW_O2_UNITS`).
+
+    Returns
+    -------
+    (field, scale) : scale converts raw units to those of the file.
+    """
+    from .oxygen import O2_MODES, RAW_O2_UNITS
+    name = os.path.basename(path).lower()
+    if name.startswith('temp'):
+        field = 'tempSample'
+    elif name.startswith('o2'):
+        # header: '# Time (UTC),O2 ({mode}, {unit})'
+        mode = 'water'
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.startswith('#'):
+                    break
+                if ',O2 (' in line:
+                    mode = line.split(',O2 (', 1)[1].split(',')[0].strip()
+        field = O2_MODES.get(mode, mode)
+    elif stype == 'CO2':
+        return 'co2', 1.
+    else:
+        raise ValueError("Can't tell which field {} holds.".format(path))
+    if field not in RAW_O2_UNITS:
+        raise ValueError("Unknown O2 mode in {}.".format(path))
+    return field, RAW_O2_UNITS[field][0]
+
+
+def qc_log(path, stype, config=None, out_path=None):
+    """
+    QC an existing log file in bulk.
+
+    Parameters
+    ----------
+    path : str
+        A batch file (co2.csv, temp.csv or o2.csv, one row of n
+        readings per time), or TempO2_raw.csv (one reading per row).
+    stype : str
+        Sensor type, a key of DEFAULT_QC. Batch files get the checks
+        of the field they hold (see `batch_field`), in their units.
+    out_path : str
+        If given, flags are written here, in the layout of the input.
+
+    Returns
+    -------
+    (times, flags) : tuple of arrays
+        flags has the same shape as the values in the file. Missing
+        values (including the padding of short rows) are QC_MISSING.
+    """
+    from .merge import read_log
+    config = DEFAULT_QC[stype] if config is None else config
+    times, vals, _ = read_log(path)
+
+    if os.path.basename(path).startswith('TempO2_raw'):
+        data = {f: vals[:, i] for i, f in enumerate(O2_FIELDS)}
+        flags = check(data, config).reshape(-1, 1)
+    else:
+        field, scale = batch_field(path, stype)
+        checks = scale_config(config.get(field, {}), scale)
+        flags = check({field: vals.ravel()}, {field: checks}).reshape(vals.shape)
+
+    if out_path is not None:
+        tstr = format_time(times)
+        with open(out_path, 'w') as f:
+            f.write('# QC flags for {} (bitmask, see swmeas.qc)\n# Time (UTC),flags\n'.format(path))
+            for t, row in zip(tstr, flags):
+                f.write(t + ',' + ','.join(str(v) for v in row) + '\n')
+    return times, flags
@@ -0,0 +1,214 @@
+import numpy as np
+
+# clock of the t_mono field (see swmeas.clock)
+from .clock import monotonic
+
+# fields returned by each sensor type, after time
+CO2_FIELDS = ['co2']
+O2_FIELDS = ['status', 'dphi', 'umolar', 'mbar', 'airSat', 'tempSample',
+             'tempCase', 'signalIntensity', 'ambientLight', 'pressure',
+             'humidity', 'resistorTemp', 'percentO2']
+PH_FIELDS = ['pH', 'pH_temp', 'LJ_temp']
+
+# UTC epoch seconds at the start of the reading
+TIME_FIELD = ('time', 'f8')
+# monotonic clock at the start of the reading, and its duration (s)
+TIMING_FIELDS = [('t_mono', 'f8'), ('latency', 'f4')]
+# quality control bitmask (see swmeas.qc)
+FLAG_FIELD = ('flag', 'u2')
+# fields following the values in every reading
+META_FIELDS = TIMING_FIELDS + [FLAG_FIELD]
+
+
+
+def reading_dtype(fields, value_type='f8'):
+    """
+    Structured dtype of a single reading: time, one value per field,
+    then the monotonic timestamp, latency and QC flags of the reading.
+    """
+    return np.dtype([TIME_FIELD] + [(f, value_type) for f in fields] + META_FIELDS)
+
+
+def ph_fields(probes):
+    """
+    Fields of a pH reading from several probes: pH and pH_temp of each
+    probe (suffixed with the probe's name, if it has one), then LJ_temp.
+    """
+    fields = []
+    for name in probes:
+        sfx = '_' + name if name else ''
+        fields += ['pH' + sfx, 'pH_temp' + sfx]
+    return fields + ['LJ_temp']
+
+
+def probe_names(probes=None):
+    """
+    Names of pH probes, in the order of their fields. probes are as
+    taken by `swmeas.pH_sensor.pH_sensor`: None (a single probe named
+    ''), {name: channels} or a list of (name, channels) pairs.
+    """
+    if probes is None:
+        return ['']
+    if isinstance(probes, dict):
+        return sorted(probes)
+    return [name for name, _ in probes]
+
+
+def value_fields(dtype):
+    """
+    Names of the value fields in a reading dtype.
+    """
+    return dtype.names[1:-len(META_FIELDS)]
+
+
+def format_time(t):
+    """
+    Format epoch times as ISO 8601 UTC strings, with milliseconds.
+
+    Parameters
+    ----------
+    t : array_like
+        UTC epoch seconds.
+
+    Returns
+    -------
+    array of str
+    """
+    ms = np.round(np.asarray(t, dtype=float) * 1000).astype(np.int64)
+    return np.char.add(np.datetime_as_string(ms.astype('datetime64[ms]'), unit='ms'), 'Z')
+
+
+CO2_DTYPE = reading_dtype(CO2_FIELDS)
+O2_DTYPE = reading_dtype(O2_FIELDS)
+PH_DTYPE = reading_dtype(PH_FIELDS)
+
+
+def new_reading(dtype):
+    """
+    A single, empty reading record.
+
+    Records support positional indexing, so r[0] is the time and
+    r[1] onwards the values, as with the lists previously returned by `read`.
+    """
+    return np.zeros(1, dtype=dtype)[0]
+
+
+class ReadingBatch(object):
+    """
+    A batch of readings, backed by a preallocated structured array.
+
+    Sensors fill records in place (see `next`), so reading, reducing
+    and writing a batch doesn't create per-sample Python objects.
+    The batch is reused: `reset` at the start of each `read_multi`.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype
+        Reading dtype, e.g. CO2_DTYPE.
+    size : int
+        Initial capacity. The batch grows if more records are added.
+    """
+    __slots__ = ('dtype', 'data', 'n')
+
+    def __init__(self, dtype, size=16):
+        self.dtype = np.dtype(dtype)
+        self.data = np.zeros(size, dtype=self.dtype)
+        self.n = 0
+
+    def reset(self, size=None):
+        """
+        Empty the batch, ensuring capacity for `size` records.
+        """
+        self.n = 0
+        if size is not None and size > len(self.data):
+            self.data = np.zeros(size, dtype=self.dtype)
+
+    def next(self):
+        """
+        The next empty record, to be filled in place.
+        """
+        if self.n == len(self.data):
+            grown = np.zeros(2 * len(self.data), dtype=self.dtype)
+            grown[:self.n] = self.data
+            self.data = grown
+        rec = self.data[self.n]
+        self.n += 1
+        return rec
+
+    def append(self, record):
+        """
+        Copy a record (or tuple of values) into the batch.
+        """
+        self.next()
+        self.data[self.n - 1] = tuple(record)
+
+    @property
+    def array(self):
+        """
+        Structured array view of the filled records.
+        """
+        return self.data[:self.n]
+
+    @property
+    def fields(self):
+        return value_fields(self.dtype)
+
+    def column(self, name):
+        return self.array[name]
+
+    def values(self):
+        """
+        (n, n_fields) float array of all values (excluding time).
+        """
+        return values(self.array)
+
+    def tolist(self):
+        return [list(r) for r in self.array.tolist()]
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return self.array[i]
+
+    def __iter__(self):
+        return iter(self.array)
+
+
+def as_array(reading, dtype=None):
+    """
+    Structured array from a ReadingBatch, a single record or legacy lists.
+
+    Parameters
+    ----------
+    reading : ReadingBatch, numpy record/array or list
+        Reading(s) as returned by `read` or `read_multi`.
+    dtype : numpy.dtype
+        Required only for list input with non-default fields. Inferred
+        from the row length otherwise.
+    """
+    if isinstance(reading, ReadingBatch):
+        return reading.array
+    if isinstance(reading, np.void):
+        return np.array([reading], dtype=reading.dtype)
+    if isinstance(reading, np.ndarray):
+        return np.atleast_1d(reading)
+    # legacy [epoch_time, value, ...] list, or list of them
+    if len(reading) > 0 and isinstance(reading[0], (list, tuple, np.void)):
+        rows = [tuple(r) + (np.nan, np.nan, 0) for r in reading]
+    else:
+        rows = [tuple(reading) + (np.nan, np.nan, 0)]
+    if dtype is None:
+        dtype = reading_dtype(['v{}'.format(i) for i in range(len(rows[0]) - 1 - len(META_FIELDS))])
+    return np.array(rows, dtype=dtype)
+
+
+def values(arr):
+    """
+    (n, n_fields) float array of the values (excluding time) in arr.
+    """
+    names = value_fields(arr.dtype)
+    out = np.empty((len(arr), len(names)))
+    for i, f in enumerate(names):
+        out[:, i] = arr[f]
+    return out
@@ -0,0 +1,382 @@
+"""
+Incremental replication of log folders to a central store.
+
+An Agent on each logger follows the files in its data_dir and ships the
+bytes appended since its last transfer to a Collector, which keeps a
+copy of each logger's folder under '{root}/{node}/'. Many files are
+batched into one compressed transfer, offsets are saved (in
+'.replicate.json') only once the collector has acknowledged them, and
+failed transfers are retried with back-off, so nothing is sent twice
+or lost across restarts.
+
+On the central machine:
+
+    swmeas collect /data/central --address 0.0.0.0:8090
+
+and on each logger:
+
+    swmeas replicate ./log_data http://central:8090/ --node pi-01
+
+The target can also be a local folder, which is written directly.
+
+Log files (csv, traces, ...) only grow, so normally only their new bytes
+are sent (up to the last complete line of csv files). Logs that are
+rewritten (e.g. re-derived by `swmeas.reprocess`) are detected by
+checksums, and sent again from the start. Small json files (parameters,
+pyramid state) are rewritten in place, so are sent again whenever they
+are modified. Either way, no transfer is larger than batch_bytes.
+"""
+import os
+import json
+import time
+import zlib
+import struct
+import socket
+import fnmatch
+try:
+    from urllib.request import Request, urlopen
+    from http.server import BaseHTTPRequestHandler
+except ImportError:
+    from urllib2 import Request, urlopen
+    from BaseHTTPServer import BaseHTTPRequestHandler
+
+from .dashboard import _Server
+from .stream import parse_address
+
+replace = getattr(os, 'replace', os.rename)
+
+STATE = '.replicate.json'
+
+# files that aren't replicated: state, temporary files, indices (can
+# be rebuilt), and SQLite files (can't be copied while written)
+EXCLUDE = [STATE, '*.tmp', '*.idx', '*.db', '*.db-wal', '*.db-shm', '.reprocess.json']
+
+# files rewritten in place, which are sent again from the start whenever
+# they are modified. Others are sent from where the last transfer ended,
+# unless their checksums (see TAIL) show they have been rewritten.
+REWRITTEN = ['*.json']
+
+# text files, sent up to their last complete line
+LINES = ['*.csv']
+
+# bytes at the start of a file, and before the offset, checked to tell
+# an appended file from a rewritten one
+TAIL = 256
+
+
+def pack(node, chunks):
+    """
+    Compress chunks into a transfer.
+
+    Parameters
+    ----------
+    node : str
+        Name of the sending logger.
+    chunks : list
+        (path, offset, data, reset) of each chunk. If reset, the file
+        is replaced by data (offset is 0).
+
+    Returns
+    -------
+    bytes
+    """
+    header = json.dumps({'node': node,
+                         'chunks': [[p, o, len(d), r] for p, o, d, r in chunks]}).encode('utf-8')
+    return zlib.compress(struct.pack('>I', len(header)) + header + b''.join(c[2] for c in chunks))
+
+
+def unpack(payload):
+    """
+    Inverse of pack. Returns (node, chunks).
+    """
+    raw = zlib.decompress(payload)
+    n = struct.unpack('>I', raw[:4])[0]
+    header = json.loads(raw[4:4 + n].decode('utf-8'))
+    pos = 4 + n
+    chunks = []
+    for p, o, length, r in header['chunks']:
+        chunks.append((p, o, raw[pos:pos + length], r))
+        pos += length
+    return header['node'], chunks
+
+
+class Collector(object):
+    """
+    Central store of replicated log folders.
+
+    Chunks are written at the offsets they were read from, so a
+    transfer that is repeated (e.g. after a lost acknowledgement) is
+    applied only once. A chunk that would leave a gap is not written,
+    and the acknowledged size tells the agent where to resend from.
+
+    Parameters
+    ----------
+    root : str
+        Folder holding a subfolder per node.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        self.server = None
+
+    def _path(self, node, path):
+        dest = os.path.abspath(os.path.join(self.root, node, path))
+        if not dest.startswith(os.path.join(self.root, node) + os.sep):
+            raise ValueError("Path outside the node's folder: {}/{}".format(node, path))
+        return dest
+
+    def receive(self, payload):
+        """
+        Apply a transfer.
+
+        Returns
+        -------
+        dict of {path: size of the stored copy}, for every path in the
+        transfer.
+        """
+        node, chunks = unpack(payload)
+        if not node or os.sep in node or node.startswith('.'):
+            raise ValueError("Invalid node name: {}".format(node))
+        sizes = {}
+        for path, offset, data, reset in chunks:
+            dest = self._path(node, path)
+            d = os.path.dirname(dest)
+            if not os.path.exists(d):
+                os.makedirs(d)
+            size = 0 if reset or not os.path.exists(dest) else os.path.getsize(dest)
+            if offset > size:
+                sizes[path] = size  # gap: resend from size
+                continue
+            with open(dest, 'r+b' if os.path.exists(dest) and not reset else 'wb') as f:
+                f.seek(offset)
+                f.write(data)
+                f.truncate()
+            sizes[path] = offset + len(data)
+        return sizes
+
+    send = receive  # a Collector can be an Agent's target
+
+    def serve(self, address='127.0.0.1:8090'):
+        """
+        Receive transfers over HTTP (POST), until interrupted.
+        """
+        _, address = parse_address(address)
+        handler = type('Handler', (_Handler,), {'collector': self})
+        self.server = _Server(address, handler)
+        print('Collecting into {} at http://{}:{}/'.format(self.root, *self.server.server_address))
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    collector = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = self.rfile.read(int(self.headers['Content-Length']))
+        try:
+            body = json.dumps(self.collector.receive(payload)).encode('utf-8')
+        except (ValueError, zlib.error) as e:
+            self.send_error(400, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HTTPTarget(object):
+    """
+    A Collector served over HTTP (see `Collector.serve`).
+    """
+
+    def __init__(self, url, timeout=30.):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, payload):
+        req = Request(self.url, data=payload,
+                      headers={'Content-Type': 'application/octet-stream'})
+        resp = urlopen(req, timeout=self.timeout)
+        try:
+            return json.loads(resp.read().decode('utf-8'))
+        finally:
+            resp.close()
+
+
+def _ends(f, size):
+    """
+    CRCs of the first and last TAIL bytes of the first size bytes of f.
+    """
+    f.seek(0)
+    head = zlib.crc32(f.read(min(TAIL, size)))
+    f.seek(max(size - TAIL, 0))
+    return [head, zlib.crc32(f.read(size - max(size - TAIL, 0)))]
+
+
+def _matches(name, patterns):
+    return any(fnmatch.fnmatch(name, p) for p in patterns)
+
+
+class Agent(object):
+    """
+    Replicates a log folder to a collector.
+
+    Parameters
+    ----------
+    data_dir : str
+        Folder to replicate (including subfolders).
+    target : str or object
+        'http://...' for a collector served over HTTP, or a folder
+        (written by a local Collector). Any object with a
+        `send(payload) -> {path: size}` method can also be used.
+    node : str
+        Name of this logger on the collector. Defaults to the hostname.
+    batch_bytes : int
+        Maximum (uncompressed) bytes per transfer.
+    exclude : list
+        File name patterns that aren't replicated.
+    """
+
+    def __init__(self, data_dir, target, node=None, batch_bytes=1 << 20, exclude=None):
+        self.data_dir = data_dir
+        if isinstance(target, str):
+            if target.startswith(('http://', 'https://')):
+                target = HTTPTarget(target)
+            else:
+                target = Collector(target)
+        self.target = target
+        self.node = node or socket.gethostname()
+        self.batch_bytes = batch_bytes
+        self.exclude = EXCLUDE if exclude is None else exclude
+        self.state_path = os.path.join(data_dir, STATE)
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                self.state = json.load(f)
+        self.sent = 0  # compressed bytes sent
+        self._mtimes = {}
+
+    def save_state(self):
+        with open(self.state_path + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        replace(self.state_path + '.tmp', self.state_path)
+
+    def files(self):
+        """
+        Paths (relative to data_dir) of the files to replicate.
+        """
+        out = []
+        for d, dirs, files in os.walk(self.data_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if not _matches(name, self.exclude):
+                    out.append(os.path.relpath(os.path.join(d, name), self.data_dir))
+        return out
+
+    def _chunk(self, rel, room):
+        """
+        The next chunk (of at most room bytes) of a file, or None if it
+        is up to date.
+        """
+        path = os.path.join(self.data_dir, rel)
+        st = os.stat(path)
+        self._mtimes[rel] = st.st_mtime
+        s = self.state.get(rel, {})
+        offset = s.get('offset', 0)
+        name = os.path.basename(rel)
+        with open(path, 'rb') as f:
+            if _matches(name, REWRITTEN):
+                reset = s.get('mtime') != st.st_mtime
+            else:
+                reset = st.st_size < offset
+                if not reset and offset:
+                    # rewritten if the first bytes, or those before the
+                    # offset, have changed
+                    reset = _ends(f, offset) != [s.get('head'), s.get('tail')]
+            if reset:
+                offset = 0
+            elif offset == st.st_size:
+                return None
+            f.seek(offset)
+            data = f.read(min(st.st_size - offset, room))
+        if _matches(name, LINES):
+            # only complete lines, unless one line fills the batch
+            end = data.rfind(b'\n') + 1
+            if end:
+                data = data[:end]
+            elif len(data) < room:
+                return None
+        return rel, offset, data, reset
+
+    def sync(self):
+        """
+        Send one batch of new data.
+
+        Returns
+        -------
+        int : uncompressed bytes sent (0 if everything is up to date).
+        """
+        chunks = []
+        room = self.batch_bytes
+        self._mtimes = {}
+        for rel in self.files():
+            if room <= 0:
+                break
+            try:
+                c = self._chunk(rel, room)
+            except (IOError, OSError):
+                continue  # removed while scanning
+            if c is not None:
+                chunks.append(c)
+                room -= len(c[2])
+        if not chunks:
+            return 0
+
+        payload = pack(self.node, chunks)
+        sizes = self.target.send(payload)
+        self.sent += len(payload)
+
+        for rel, offset, data, reset in chunks:
+            size = sizes.get(rel)
+            if size is None:
+                continue
+            path = os.path.join(self.data_dir, rel)
+            # as read, so a file modified since is sent again
+            s = {'offset': size, 'mtime': self._mtimes[rel]}
+            with open(path, 'rb') as f:
+                s['head'], s['tail'] = _ends(f, size)
+            self.state[rel] = s
+        self.save_state()
+        return sum(len(c[2]) for c in chunks)
+
+    def run(self, interval=5., stop=0, max_backoff=300., verbose=False):
+        """
+        Replicate until interrupted (or for stop seconds).
+
+        New data is sent every interval seconds, and straight away while
+        there is a backlog. Failed transfers are retried after 1, 2, 4,
+        ... seconds, up to max_backoff.
+        """
+        start = time.time()
+        backoff = 1.
+        while stop <= 0 or time.time() - start < stop:
+            try:
+                n = self.sync()
+            except (IOError, OSError, ValueError) as e:
+                print('Replication failed ({}), retrying in {:.0f} s'.format(e, backoff))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+                continue
+            backoff = 1.
+            if verbose and n:
+                print('Sent {} bytes ({} compressed in total)'.format(n, self.sent))
+            if n < self.batch_bytes:
+                time.sleep(interval)
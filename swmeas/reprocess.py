@@ -0,0 +1,270 @@
+"""
+Bulk reprocessing of log folders.
+
+Re-derives outputs (e.g. o2.csv in another mode, QC flags, merged
+files) in every dated folder of a log tree (as created by
+new_folder_every), with the folders shared out to a pool of processes:
+
+    from swmeas.reprocess import reprocess
+    reprocess('./log_data', tasks=['o2', 'qc'], mode='air', processes=8)
+
+or from the command line:
+
+    swmeas reprocess ./log_data --tasks o2 qc --mode air
+
+Each folder records what has been done in a checkpoint file
+('.reprocess.json'): the options of each task, and the sizes and
+modification times (or content hashes) of its inputs. A task is skipped
+if neither has changed since, so an interrupted run carries on where it
+stopped, and re-runs only redo folders with new data.
+
+Folders still being logged to (raw logs modified within the last
+`active` seconds, typically only the newest) are left alone, as the
+logger appends to files that tasks rewrite.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import multiprocessing as mp
+
+replace = getattr(os, 'replace', os.rename)
+
+CHECKPOINT = '.reprocess.json'
+
+# folders created by timed_dir ('day' or 'hour')
+DATED = re.compile(r'^\d{4}-\d{2}-\d{2}(-\d{2})?$')
+
+
+def _o2(folder, mode='water', **kwargs):
+    from .oxygen import rederive_TempO2
+    rederive_TempO2(os.path.join(folder, 'TempO2_raw.csv'),
+                    os.path.join(folder, 'temp.csv'),
+                    os.path.join(folder, 'o2.csv'), mode=mode)
+
+
+def _qc(folder, **kwargs):
+    from .qc import qc_log
+    for file, stype in (('co2.csv', 'CO2'), ('TempO2_raw.csv', 'TempO2')):
+        path = os.path.join(folder, file)
+        if os.path.exists(path):
+            qc_log(path, stype, out_path=path[:-4] + '_qc.csv')
+
+
+def _merge(folder, freq=60., **kwargs):
+    from .merge import merge_dir, ph_source, DEFAULT_SOURCES
+    # the pH columns depend on the probes logged, saved in logpH.json
+    # alongside the logs (or in their parent folder)
+    probes = None
+    for p in (folder, os.path.dirname(os.path.abspath(folder))):
+        par_file = os.path.join(p, 'logpH.json')
+        if os.path.exists(par_file):
+            with open(par_file, 'r') as f:
+                probes = json.load(f).get('probes')
+            break
+    merge_dir(folder, sources=dict(DEFAULT_SOURCES, pH=ph_source(probes)), freq=freq)
+
+
+def _index(folder, **kwargs):
+    from .timeindex import build
+    for file in ('co2.csv', 'temp.csv', 'o2.csv', 'TempO2_raw.csv'):
+        path = os.path.join(folder, file)
+        if os.path.exists(path):
+            build(path)
+
+
+# {name: (function(folder, **options), input files, options used)}
+# A task runs in a folder if any of its inputs are there.
+TASKS = {'o2': (_o2, ['TempO2_raw.csv'], ['mode']),
+         'qc': (_qc, ['co2.csv', 'TempO2_raw.csv'], []),
+         'merge': (_merge, ['co2.csv', 'temp.csv', 'o2.csv', 'pH.csv'], ['freq']),
+         'index': (_index, ['co2.csv', 'temp.csv', 'o2.csv', 'TempO2_raw.csv'], [])}
+
+# tasks run in this order, as merge and index use the outputs of o2
+ORDER = ['o2', 'qc', 'merge', 'index']
+
+# logs appended to by the loggers, which tasks only read
+LOGGED = ['co2.csv', 'TempO2_raw.csv']
+
+
+def find_folders(root):
+    """
+    The dated folders of a log tree, in time order (or root itself, if
+    it has none).
+    """
+    folders = [os.path.join(root, d) for d in sorted(os.listdir(root))
+               if DATED.match(d) and os.path.isdir(os.path.join(root, d))]
+    return folders or [root]
+
+
+def signature(folder, files, check='mtime'):
+    """
+    Signature of the input files in folder: {file: [size, mtime]}, or
+    {file: sha1 of contents} if check is 'hash'. Missing files are left out.
+    """
+    sig = {}
+    for file in files:
+        path = os.path.join(folder, file)
+        if not os.path.exists(path):
+            continue
+        if check == 'hash':
+            h = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            sig[file] = h.hexdigest()
+        else:
+            st = os.stat(path)
+            sig[file] = [st.st_size, st.st_mtime]
+    return sig
+
+
+def is_active(folder, active=3600.):
+    """
+    True if a raw log in folder (LOGGED) was modified less than active
+    seconds ago, i.e. a logger may still be writing to the folder.
+    """
+    now = time.time()
+    for file in LOGGED:
+        path = os.path.join(folder, file)
+        if os.path.exists(path) and now - os.stat(path).st_mtime < active:
+            return True
+    return False
+
+
+def load_checkpoint(folder):
+    path = os.path.join(folder, CHECKPOINT)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except ValueError:  # partly written
+            pass
+    return {}
+
+
+def save_checkpoint(folder, cp):
+    path = os.path.join(folder, CHECKPOINT)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(cp, f, indent=2)
+    replace(path + '.tmp', path)
+
+
+def process_folder(folder, tasks, options=None, check='mtime', force=False):
+    """
+    Run tasks in a folder, skipping those already done on the same
+    inputs with the same options.
+
+    Returns
+    -------
+    (folder, {task: 'done', 'skipped', 'no inputs' or an error message})
+    """
+    options = options or {}
+    cp = load_checkpoint(folder)
+    status = {}
+    for name in tasks:
+        fn, inputs, opts = TASKS[name]
+        sig = signature(folder, inputs, check)
+        if not sig:
+            status[name] = 'no inputs'
+            continue
+        state = {'inputs': sig, 'check': check,
+                 'options': dict((k, options[k]) for k in opts if k in options)}
+        done = cp.get(name, {})
+        if not force and all(done.get(k) == v for k, v in state.items()):
+            status[name] = 'skipped'
+            continue
+        try:
+            fn(folder, **options)
+        except Exception as e:
+            status[name] = '{}: {}'.format(type(e).__name__, e)
+            continue
+        state['time'] = time.time()
+        cp[name] = state
+        # checkpoint after each task, so an interrupted run resumes here
+        save_checkpoint(folder, cp)
+        status[name] = 'done'
+    return folder, status
+
+
+def _process(args):
+    return process_folder(*args)
+
+
+def reprocess(root, tasks=None, processes=None, check='mtime', force=False,
+              verbose=True, active=3600., **options):
+    """
+    Run tasks in every dated folder of a log tree, in parallel.
+
+    Parameters
+    ----------
+    root : str
+        Log folder (data_dir of the logger).
+    tasks : list
+        Names of TASKS to run. Defaults to all of them.
+    processes : int
+        Number of worker processes. Defaults to the number of CPUs.
+    check : str
+        How to tell if inputs have changed: 'mtime' (size and
+        modification time) or 'hash' (content).
+    force : bool
+        If True, ignore the checkpoints, and redo everything.
+    active : float
+        Folders with raw logs (LOGGED) modified less than this many
+        seconds ago are skipped (with status 'active' for every task). 0 processes
+        them anyway.
+    **options
+        Passed to the tasks (e.g. mode='air' for 'o2', freq for 'merge').
+
+    Returns
+    -------
+    dict of {folder: {task: status}}.
+    """
+    if tasks is None:
+        tasks = ORDER
+    for t in tasks:
+        if t not in TASKS:
+            raise ValueError("Task must be one of {}".format(ORDER))
+    tasks = [t for t in ORDER if t in tasks]
+    if check not in ('mtime', 'hash'):
+        raise ValueError("check must be either 'mtime' or 'hash'")
+
+    out = {}
+    folders = []
+    for f in find_folders(root):
+        if active > 0 and is_active(f, active):
+            out[f] = dict((t, 'active') for t in tasks)
+        else:
+            folders.append(f)
+    if verbose and out:
+        print('Skipping {} folder(s) still being logged to: {}'.format(len(out), ', '.join(sorted(out))))
+    jobs = [(f, tasks, options, check, force) for f in folders]
+    if processes is None:
+        processes = mp.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+
+    if processes == 1:
+        results = map(_process, jobs)
+        pool = None
+    else:
+        pool = mp.Pool(processes)
+        # one folder at a time, so slow folders don't hold up the rest
+        results = pool.imap_unordered(_process, jobs, chunksize=1)
+    try:
+        for i, (folder, status) in enumerate(results):
+            out[folder] = status
+            if verbose:
+                print('[{}/{}] {}: {}'.format(i + 1, len(jobs), folder,
+                                              ', '.join('{} {}'.format(t, status[t]) for t in tasks)))
+    except KeyboardInterrupt:
+        # finished tasks are checkpointed: re-run to carry on
+        if pool is not None:
+            pool.terminate()
+            pool = None
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return out
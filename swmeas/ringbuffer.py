@@ -0,0 +1,205 @@
+import os
+import mmap
+import time
+import tempfile
+import numpy as np
+
+from .records import as_array, values, value_fields
+
+MAGIC = b'SWMRING1'
+# header: magic, seq, head, capacity, width (int64 each after magic)
+HEADER_BYTES = 64
+DEFAULT_CAPACITY = 2 ** 16
+
+replace = getattr(os, 'replace', os.rename)
+
+
+def ring_path(name, directory=None):
+    """
+    Path of the memory-mapped file backing ring buffer `name`.
+
+    Uses /dev/shm where available, so the buffer lives in memory.
+    """
+    if directory is None:
+        if os.path.isdir('/dev/shm'):
+            directory = '/dev/shm'
+        else:
+            directory = tempfile.gettempdir()
+    return os.path.join(directory, 'swmeas_{}.ring'.format(name))
+
+
+def readings_to_array(reading):
+    """
+    Convert reading(s) from `read` or `read_multi` to a float array.
+
+    Column 0 of the output is the epoch time of each reading.
+    """
+    arr = as_array(reading)
+    out = np.empty((len(arr), len(value_fields(arr.dtype)) + 1), dtype=np.float64)
+    out[:, 0] = arr['time']
+    out[:, 1:] = values(arr)
+    return out
+
+
+class SharedRing(object):
+    """
+    Fixed-size ring buffer of float64 records in shared memory.
+
+    A single writer (the logger) appends records, and any number of
+    reader processes can open the same buffer by name and take
+    consistent snapshots without locking. Consistency is guaranteed
+    by a sequence counter (seqlock): the writer makes it odd while
+    updating and even when done, and readers retry if it changed
+    during their copy.
+
+    Parameters
+    ----------
+    name : str
+        Name of the buffer, shared between writer and readers.
+    width : int
+        Number of columns per record (including time in column 0).
+        Only required when creating a buffer.
+    capacity : int
+        Number of records held before the oldest are overwritten.
+    create : bool
+        If True, create (or reset) the buffer. Otherwise attach
+        to an existing buffer. A reset buffer is a new file, so
+        readers still attached to the old one keep reading it,
+        rather than faulting on a truncated mapping.
+    directory : str
+        Folder holding the backing file. See `ring_path`.
+    """
+
+    def __init__(self, name, width=None, capacity=DEFAULT_CAPACITY,
+                 create=False, directory=None):
+        self.name = name
+        self.path = ring_path(name, directory)
+
+        if create:
+            if width is None:
+                raise ValueError('width must be specified when creating a SharedRing.')
+            size = HEADER_BYTES + capacity * width * 8
+            tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(MAGIC + np.array([0, 0, capacity, width], dtype=np.int64).tobytes())
+                f.truncate(size)
+            replace(tmp, self.path)
+        elif not os.path.exists(self.path):
+            raise IOError("No ring buffer named '{}' at {}".format(name, self.path))
+
+        self.file = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.header = np.frombuffer(self.mm, dtype=np.int64, count=4, offset=8)
+
+        if self.mm[:8] != MAGIC:
+            raise IOError('{} is not a swmeas ring buffer.'.format(self.path))
+
+        self.capacity = int(self.header[2])
+        self.width = int(self.header[3])
+        self.data = np.frombuffer(self.mm, dtype=np.float64,
+                                  count=self.capacity * self.width,
+                                  offset=HEADER_BYTES).reshape(self.capacity, self.width)
+
+    @property
+    def count(self):
+        """
+        Total number of records ever written.
+        """
+        return int(self.header[1])
+
+    def append(self, records):
+        """
+        Append records to the buffer.
+
+        Parameters
+        ----------
+        records : array_like
+            (n, width) array, time in column 0.
+        """
+        records = np.atleast_2d(np.asarray(records, dtype=np.float64))
+        n = len(records)
+        if n == 0:
+            return
+        if n > self.capacity:
+            records = records[-self.capacity:]
+            skipped = n - self.capacity
+            n = self.capacity
+        else:
+            skipped = 0
+
+        head = self.count + skipped
+        idx = (head + np.arange(n)) % self.capacity
+
+        self.header[0] += 1  # odd: write in progress
+        self.data[idx] = records
+        self.header[1] = head + n
+        self.header[0] += 1  # even: consistent
+
+    def view(self):
+        """
+        Zero-copy view of the underlying storage.
+
+        Rows are in storage (not time) order, and may change while
+        being read. Use `latest` for a consistent, ordered snapshot.
+        The view shares the buffer's memory: the mapping is only
+        released by `close` once every view has been dropped.
+        """
+        return self.data
+
+    def latest(self, n=None, retries=100):
+        """
+        Consistent snapshot of the most recent records, oldest first.
+
+        Parameters
+        ----------
+        n : int
+            Number of records. If None, all available records.
+
+        Returns
+        -------
+        array of shape (n, width)
+        """
+        for _ in range(retries):
+            seq = int(self.header[0])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            head = int(self.header[1])
+            avail = min(head, self.capacity)
+            m = avail if n is None else min(n, avail)
+            idx = (head - m + np.arange(m)) % self.capacity
+            out = self.data[idx]  # fancy indexing copies
+            if int(self.header[0]) == seq:
+                return out
+        raise RuntimeError('Could not obtain a consistent read of {}'.format(self.name))
+
+    def window(self, seconds):
+        """
+        Records from the last `seconds` (by their recorded time).
+        """
+        d = self.latest()
+        if len(d) == 0:
+            return d
+        return d[d[:, 0] >= d[-1, 0] - seconds]
+
+    def close(self):
+        """
+        Release the buffer. If views (see `view`) are still held, the
+        mapping is left for the garbage collector to release once
+        they are dropped.
+        """
+        self.header = None
+        self.data = None
+        try:
+            self.mm.close()
+        except BufferError:  # views still exported
+            pass
+        self.file.close()
+
+    def unlink(self):
+        """
+        Remove the backing file (writer only).
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,495 @@
+"""
+Accelerated soak testing of the loggers.
+
+Runs the real logging loops (`logCO2`, `logTempO2`) against simulated
+sensors on a virtual clock (see `swmeas.clock`), on which sleeping just
+moves time forward, so weeks of logging run in minutes:
+
+    from swmeas.soak import soak
+    report = soak('CO2', days=90, interval=30)
+
+or from the command line:
+
+    swmeas soak CO2 --days 90
+
+While it runs, the process's memory (RSS), open file descriptors and the
+size of the log folder are sampled every virtual hour, and loops that
+take longer than the interval are counted. At the end, the dated
+folders are checked: one per day (or hour), each holding only rows of
+its own day. The report lists any problems found, e.g. memory or file
+descriptors that keep growing.
+
+Only the simulated measurement times (latencies, waits) pass on the
+virtual clock, so overruns are of the measurement schedule, not of the
+time taken by the computer.
+"""
+import os
+import math
+import shutil
+import tempfile
+import time as _time
+import datetime as dt
+import numpy as np
+
+from . import clock
+from .helpers import modbus_crc
+from .reprocess import DATED
+
+# folder name format of timed_dir
+FORMATS = {'day': '%Y-%m-%d', 'hour': '%Y-%m-%d-%H'}
+
+
+class SimK30(object):
+    """
+    A simulated K-30 CO2 sensor, in place of its serial port.
+
+    CO2 follows a daily cycle plus noise, and a fraction of requests
+    get no response.
+
+    Parameters
+    ----------
+    latency : float
+        Time (s) taken by each request.
+    dropout : float
+        Fraction of requests without a response.
+    seed : int
+        Random seed.
+    """
+
+    def __init__(self, latency=0.05, dropout=0.001, seed=0):
+        self.latency = latency
+        self.dropout = dropout
+        self.rng = np.random.RandomState(seed)
+        self.requests = 0
+
+    def flushInput(self):
+        pass
+
+    def write(self, msg):
+        self.requests += 1
+
+    def read(self, n):
+        clock.sleep(self.latency)
+        if self.rng.rand() < self.dropout:
+            return b''  # timed out
+        t = clock.time()
+        co2 = 420 + 30 * math.sin(2 * math.pi * t / 86400.) + self.rng.randn()
+        co2 = int(max(0, min(co2, 0xFFFF)))
+        resp = bytes(bytearray([0xFE, 0x44, 0x02, co2 >> 8, co2 & 0xFF]))
+        return (resp + modbus_crc(resp))[:n]
+
+    def close(self):
+        pass
+
+
+class SimPiccolo(object):
+    """
+    A simulated Pyroscience Piccolo2 O2 / temperature meter, in place
+    of its serial port.
+
+    Parameters
+    ----------
+    latency : float
+        Time (s) taken by each command.
+    measure_time : float
+        Time (s) taken by a measurement ('MSR').
+    dropout : float
+        Fraction of measurements without a response.
+    warmup : float
+        Time (s) after power-up ('#PWUP') during which measurements
+        have a non-zero status.
+    seed : int
+        Random seed.
+    """
+
+    def __init__(self, latency=0.02, measure_time=0.3, dropout=0.001, warmup=0., seed=0):
+        self.latency = latency
+        self.measure_time = measure_time
+        self.dropout = dropout
+        self.warmup = warmup
+        self.rng = np.random.RandomState(seed)
+        self.cmd = ''
+        self.powered_at = -np.inf
+
+    def write(self, msg):
+        self.cmd = msg.rstrip()
+        if self.cmd == '#PWUP':
+            self.powered_at = clock.monotonic()
+
+    def readline(self):
+        cmd = self.cmd.split(' ')[0]
+        clock.sleep(self.measure_time if cmd == 'MSR' else self.latency)
+        if cmd == '#VERS':
+            return 'Piccolo2 (simulated)\r'
+        if cmd != 'RAL':
+            return self.cmd + '\r'
+        if self.rng.rand() < self.dropout:
+            return ''  # timed out
+        day = 2 * math.pi * clock.time() / 86400.
+        temp = int(20000 + 2000 * math.sin(day) + 50 * self.rng.randn())
+        o2 = int(200000 + 10000 * math.cos(day) + 500 * self.rng.randn())
+        status = int(clock.monotonic() - self.powered_at < self.warmup)
+        vals = [status, 20000, 250000, o2, 98000, temp, temp, 100000, 1000, 0, 0, 1, 20900]
+        return 'RAL 1 ' + ' '.join(str(v) for v in vals) + '\r'
+
+    def close(self):
+        pass
+
+
+def sim_sensor(stype, **kwargs):
+    """
+    A sensor driver connected to a simulated sensor.
+
+    Parameters
+    ----------
+    stype : str
+        'CO2' or 'TempO2'.
+    **kwargs
+        Passed to SimK30 or SimPiccolo.
+    """
+    if stype == 'CO2':
+        from .CO2_sensor import CO2_sensor
+        sensor = CO2_sensor(connect=False)
+        sensor.sensor = SimK30(**kwargs)
+    elif stype == 'TempO2':
+        from .O2_sensor import O2_sensor
+        sensor = O2_sensor(connect=False)
+        sensor.sensor = SimPiccolo(**kwargs)
+        sensor.powered = True
+    else:
+        raise ValueError("stype must be either 'CO2' or 'TempO2'")
+    sensor.ID = 'SIM'
+    sensor.name = 'sim'
+    sensor.label = '{} sensor (simulated)\n'.format(stype)
+    return sensor
+
+
+def rss():
+    """
+    Resident memory of this process (kB), or None if unknown.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # peak
+    except ImportError:
+        return None
+
+
+def open_fds():
+    """
+    Number of open file descriptors of this process, or None if unknown.
+    """
+    for d in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(d):
+            return len(os.listdir(d))
+    return None
+
+
+def disk_usage(path):
+    """
+    Total size (bytes) of the files in a folder.
+    """
+    total = 0
+    for d, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(d, f))
+            except OSError:
+                pass
+    return total
+
+
+class Monitor(object):
+    """
+    Samples the state of the process as the virtual clock moves.
+
+    Add to a VirtualClock's listeners, and wrap the sensor with `watch`.
+
+    Parameters
+    ----------
+    data_dir : str
+        Log folder, whose size is sampled.
+    interval : float
+        Logging interval (s), to detect overruns.
+    sample_every : float
+        Virtual seconds between samples.
+    """
+
+    def __init__(self, data_dir, interval, sample_every=3600.):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.sample_every = sample_every
+        self.samples = []
+        self.next_sample = None
+        self.loops = 0
+        self.overruns = 0
+        self.max_loop = 0.
+        self.t_loop = None
+        self.t_wall = _time.time()
+
+    def watch(self, sensor):
+        """
+        Count the logging loops of sensor (each starts with a call to
+        its read_multi).
+        """
+        read_multi = sensor.read_multi
+
+        def watched(*args, **kwargs):
+            self.loop()
+            return read_multi(*args, **kwargs)
+        sensor.read_multi = watched
+        return sensor
+
+    def loop(self):
+        t = clock.monotonic()
+        if self.t_loop is not None:
+            gap = t - self.t_loop
+            self.max_loop = max(self.max_loop, gap)
+            if gap > self.interval * (1 + 1e-6):
+                self.overruns += 1
+        self.t_loop = t
+        self.loops += 1
+
+    def sample(self):
+        self.samples.append((clock.monotonic(), _time.time() - self.t_wall, rss(),
+                             open_fds(), disk_usage(self.data_dir), self.loops))
+
+    def __call__(self, clk):
+        if self.next_sample is None:
+            self.next_sample = clk.monotonic()
+        if clk.monotonic() >= self.next_sample:
+            self.sample()
+            self.next_sample += self.sample_every
+
+    def array(self):
+        """
+        The samples, as a structured array.
+        """
+        return np.array([tuple(np.nan if v is None else v for v in s) for s in self.samples],
+                        dtype=[('elapsed', 'f8'), ('wall', 'f8'), ('rss_kB', 'f8'),
+                               ('fds', 'f8'), ('disk_bytes', 'f8'), ('loops', 'f8')])
+
+
+def _slope(x, y):
+    """
+    Least-squares slope of y against x (NaN if it can't be fit).
+    """
+    ok = np.isfinite(x) & np.isfinite(y)
+    if ok.sum() < 2:
+        return np.nan
+    return np.polyfit(x[ok], y[ok], 1)[0]
+
+
+def check_rotation(data_dir, files, new_folder_every='day', start=None, end=None, slack=0.):
+    """
+    Check the dated folders of a log: that there is one for each day (or
+    hour) from start to end, and that the rows in each file are all
+    from that day (or hour). The folder is chosen at the start of each
+    loop, so rows up to slack seconds after the end of the day are
+    allowed.
+
+    Parameters
+    ----------
+    data_dir : str
+        Log folder.
+    files : list
+        Log files in each folder to check, e.g. ['co2.csv'].
+    new_folder_every : str
+        'day' or 'hour'.
+    start, end : float
+        Epoch times of the start and end of logging.
+    slack : float
+        Time (s) rows can run on into the next day (or hour), e.g. the
+        logging interval.
+
+    Returns
+    -------
+    dict with the number of folders, those expected, folders that are
+    missing or named for another period, and the number of rows in the
+    wrong folder.
+    """
+    from .merge import read_log
+    hourly = 'hour' in new_folder_every
+    fmt = FORMATS['hour' if hourly else 'day']
+    step = dt.timedelta(hours=1) if hourly else dt.timedelta(days=1)
+    folders = sorted(d for d in os.listdir(data_dir)
+                     if DATED.match(d) and os.path.isdir(os.path.join(data_dir, d)))
+    misplaced = 0
+    unexpected = []
+    for d in folders:
+        try:
+            t0 = dt.datetime.strptime(d, fmt)
+        except ValueError:
+            unexpected.append(d)  # named for another period
+            continue
+        t1 = _time.mktime((t0 + step).timetuple()) + slack
+        t0 = _time.mktime(t0.timetuple())
+        for file in files:
+            path = os.path.join(data_dir, d, file)
+            if not os.path.exists(path):
+                continue
+            times = read_log(path)[0]
+            misplaced += int(((times < t0) | (times >= t1)).sum())
+    expected = []
+    if start is not None and end is not None:
+        step = step.total_seconds()
+        t = start
+        while t <= end:
+            name = dt.datetime.fromtimestamp(t).strftime(fmt)
+            if name not in expected:
+                expected.append(name)
+            t += step / 4
+        name = dt.datetime.fromtimestamp(end).strftime(fmt)
+        if name not in expected:
+            expected.append(name)
+    return {'folders': len(folders), 'expected': len(expected),
+            'missing': [e for e in expected if e not in folders],
+            'unexpected': unexpected, 'misplaced_rows': misplaced}
+
+
+def soak(stype='CO2', days=90., interval=30, n=5, wait=1., new_folder_every='day',
+         data_dir=None, start=None, sample_every=3600., keep=False,
+         rss_limit=64., sim=None, verbose=True, **kwargs):
+    """
+    Soak test a logger on a simulated sensor, under a virtual clock.
+
+    Parameters
+    ----------
+    stype : str
+        Logger to run: 'CO2' or 'TempO2'.
+    days : float
+        Virtual time to log for (days).
+    interval, n, wait, new_folder_every :
+        Passed to the logger.
+    data_dir : str
+        Log folder. Defaults to a new temporary folder.
+    start : float
+        Virtual epoch time to start at. Defaults to now.
+    sample_every : float
+        Virtual seconds between samples of memory, file descriptors and
+        disk use.
+    keep : bool
+        If False, a temporary data_dir is removed at the end.
+    rss_limit : float
+        Memory growth (kB per virtual day) reported as a leak.
+    sim : dict
+        Keyword arguments of the simulated sensor (SimK30 or
+        SimPiccolo), e.g. latency, dropout.
+    **kwargs
+        Passed to the logger (e.g. qc, index, pyramid). database=True
+        writes to a database in data_dir.
+
+    Returns
+    -------
+    dict : the report, with the samples in 'samples', and a list of
+    any problems found in 'problems'.
+    """
+    from .logger import logCO2, logTempO2
+    loggers = {'CO2': (logCO2, ['co2.csv']),
+               'TempO2': (logTempO2, ['temp.csv', 'o2.csv', 'TempO2_raw.csv'])}
+    if stype not in loggers:
+        raise ValueError("stype must be either 'CO2' or 'TempO2'")
+    log, files = loggers[stype]
+
+    tmp = data_dir is None
+    if tmp:
+        data_dir = tempfile.mkdtemp(prefix='swmeas_soak_')
+    data_dir = data_dir.rstrip('/')
+    if kwargs.get('database') is True:
+        kwargs['database'] = os.path.join(data_dir, 'swmeas.db')
+
+    vclock = clock.VirtualClock(start)
+    t_start = vclock.time()
+    # with adaptive sampling, loops are up to max_interval apart
+    longest = interval
+    if kwargs.get('adaptive') is not None:
+        longest = max(interval, kwargs['adaptive'].get('max_interval', 600))
+    monitor = Monitor(data_dir, longest, sample_every)
+    vclock.listeners.append(monitor)
+    old = clock.set_clock(vclock)
+    try:
+        sensor = monitor.watch(sim_sensor(stype, **(sim or {})))
+        if not os.path.exists(data_dir):
+            os.mkdir(data_dir)
+        monitor.sample()  # baseline
+        log(data_dir=data_dir, interval=interval, stop=days * 86400., n=n, wait=wait,
+            new_folder_every=new_folder_every, sensor=sensor, **kwargs)
+        monitor.sample()
+        t_end = vclock.time()
+    finally:
+        clock.set_clock(old)
+
+    s = monitor.array()
+    vdays = s['elapsed'] / 86400.
+    wall = s['wall'][-1]
+    # fit growth over the second half, after caches (e.g. SQLite's) fill
+    later = vdays >= vdays[-1] / 2
+    report = {'days': vdays[-1], 'wall_s': wall,
+              'speedup': s['elapsed'][-1] / wall if wall > 0 else np.inf,
+              'loops': monitor.loops, 'overruns': monitor.overruns,
+              'max_loop_s': monitor.max_loop,
+              'rss_kB': [s['rss_kB'][0], s['rss_kB'][-1]],
+              'rss_kB_per_day': _slope(vdays[later], s['rss_kB'][later]),
+              'fds': [s['fds'][0], s['fds'][-1]],
+              'disk_bytes': s['disk_bytes'][-1],
+              'disk_bytes_per_day': _slope(vdays, s['disk_bytes']),
+              'samples': s}
+    if new_folder_every is not None:
+        report['rotation'] = check_rotation(data_dir, files, new_folder_every,
+                                            t_start, t_end, slack=longest)
+
+    problems = []
+    if report['rss_kB_per_day'] > rss_limit:
+        problems.append('memory grows by {:.0f} kB/day'.format(report['rss_kB_per_day']))
+    if s['fds'][-1] > s['fds'][0]:
+        problems.append('{:.0f} file descriptors left open'.format(s['fds'][-1] - s['fds'][0]))
+    if monitor.overruns:
+        problems.append('{} loops overran the interval (longest {:.1f} s)'.format(
+            monitor.overruns, monitor.max_loop))
+    rot = report.get('rotation')
+    if rot is not None:
+        if rot['missing']:
+            problems.append('{} folders missing (e.g. {})'.format(len(rot['missing']), rot['missing'][0]))
+        if rot['unexpected']:
+            problems.append('{} folders not named by {} (e.g. {})'.format(
+                len(rot['unexpected']), new_folder_every, rot['unexpected'][0]))
+        if rot['folders'] > rot['expected']:
+            problems.append('{} folders, {} expected'.format(rot['folders'], rot['expected']))
+        if rot['misplaced_rows']:
+            problems.append('{} rows in the wrong folder'.format(rot['misplaced_rows']))
+    report['problems'] = problems
+
+    if verbose:
+        print_report(report)
+    if tmp and not keep:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    else:
+        report['data_dir'] = data_dir
+    return report
+
+
+def print_report(report):
+    print('{:.1f} days logged in {:.1f} s ({:.0f}x real time), {} loops'.format(
+        report['days'], report['wall_s'], report['speedup'], report['loops']))
+    print('  memory: {:.0f} -> {:.0f} kB ({:+.1f} kB/day)'.format(
+        report['rss_kB'][0], report['rss_kB'][1], report['rss_kB_per_day']))
+    print('  file descriptors: {:.0f} -> {:.0f}'.format(*report['fds']))
+    print('  disk: {:.0f} bytes ({:.0f} bytes/day)'.format(
+        report['disk_bytes'], report['disk_bytes_per_day']))
+    print('  overruns: {} (longest loop {:.1f} s)'.format(report['overruns'], report['max_loop_s']))
+    rot = report.get('rotation')
+    if rot is not None:
+        print('  folders: {folders} ({expected} expected), {misplaced_rows} rows misplaced'.format(**rot))
+    if report['problems']:
+        print('Problems:')
+        for p in report['problems']:
+            print('  ' + p)
+    else:
+        print('No problems found.')
@@ -0,0 +1,299 @@
+import os
+import json
+import errno
+import socket
+import threading
+from collections import deque
+
+from .records import as_array, values, value_fields
+
+
+def reading_message(topic, label, reading):
+    """
+    Package a reading (or list of readings) as a message.
+
+    Parameters
+    ----------
+    topic : str
+        Message topic, e.g. 'CO2' or 'TempO2'.
+    label : str
+        Sensor label.
+    reading : ReadingBatch, record or list
+        A single reading, or a batch as returned by `read_multi`.
+
+    Returns
+    -------
+    dict
+    """
+    arr = as_array(reading)
+    return {'topic': topic,
+            'sensor': label.strip(),
+            'fields': list(value_fields(arr.dtype)),
+            'time': arr['time'].tolist(),
+            'values': values(arr).tolist()}
+
+
+def dumps(obj):
+    """
+    JSON of a message: NaN and infinities (not valid JSON) become null.
+    """
+    def clean(o):
+        if isinstance(o, float):
+            return o if o == o and abs(o) != float('inf') else None
+        if isinstance(o, dict):
+            return {k: clean(v) for k, v in o.items()}
+        if isinstance(o, (list, tuple)):
+            return [clean(v) for v in o]
+        return o
+    return json.dumps(clean(obj))
+
+
+def parse_address(address):
+    """
+    Interpret a bus address.
+
+    Parameters
+    ----------
+    address : str or tuple
+        Either a (host, port) tuple, a 'host:port' str, or the
+        path of a Unix domain socket.
+
+    Returns
+    -------
+    (family, address) : tuple
+    """
+    if isinstance(address, (tuple, list)):
+        return socket.AF_INET, (address[0], int(address[1]))
+    if ':' in address and '/' not in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class LocalBus(object):
+    """
+    In-process publish / subscribe channel.
+
+    Subscribers each get their own bounded queue, so a slow
+    consumer only ever loses its own oldest messages.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics=None, maxlen=1000):
+        """
+        Create a new subscription.
+
+        Parameters
+        ----------
+        topics : list
+            Topics to receive. If None, all topics are received.
+        maxlen : int
+            Maximum number of queued messages.
+
+        Returns
+        -------
+        Subscription
+        """
+        sub = Subscription(self, topics, maxlen)
+        with self.lock:
+            self.subscriptions.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            if sub in self.subscriptions:
+                self.subscriptions.remove(sub)
+
+    def publish(self, msg):
+        """
+        Push a message to all subscribers.
+        """
+        with self.lock:
+            subs = list(self.subscriptions)
+        for s in subs:
+            s.push(msg)
+
+    def close(self):
+        with self.lock:
+            self.subscriptions = []
+
+
+class Subscription(object):
+    """
+    A subscriber queue on a LocalBus.
+    """
+
+    def __init__(self, bus, topics=None, maxlen=1000):
+        self.bus = bus
+        self.topics = topics
+        self.queue = deque(maxlen=maxlen)
+        self.ready = threading.Condition()
+
+    def push(self, msg):
+        if self.topics is not None and msg.get('topic') not in self.topics:
+            return
+        with self.ready:
+            self.queue.append(msg)
+            self.ready.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Return the next message, or None if timeout expires.
+        """
+        with self.ready:
+            if not self.queue:
+                self.ready.wait(timeout)
+            if self.queue:
+                return self.queue.popleft()
+        return None
+
+    def drain(self):
+        """
+        Return all queued messages.
+        """
+        with self.ready:
+            out = list(self.queue)
+            self.queue.clear()
+        return out
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class Publisher(object):
+    """
+    Publish messages to any number of subscribers over a local socket.
+
+    Messages are sent as newline-delimited JSON, with missing values
+    as null. The loggers publish one message per batch, holding all of
+    its readings. The publisher never
+    blocks the logger: new connections are accepted at publish time,
+    and subscribers that can't keep up are disconnected.
+
+    Parameters
+    ----------
+    address : str or tuple
+        (host, port), 'host:port' or a Unix domain socket path.
+    bus : LocalBus
+        If given, messages are also pushed to this in-process bus.
+    """
+
+    def __init__(self, address='127.0.0.1:5555', bus=None):
+        self.family, self.address = parse_address(address)
+        self.bus = bus
+        self.clients = []
+
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+        self.server = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen(16)
+        self.server.setblocking(False)
+        if self.family == socket.AF_INET:
+            self.address = self.server.getsockname()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except (socket.error, OSError) as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            conn.setblocking(False)
+            self.clients.append(conn)
+
+    def publish(self, msg):
+        """
+        Send a message to all connected subscribers.
+
+        Parameters
+        ----------
+        msg : dict
+            JSON-serialisable message, e.g. from `reading_message`.
+        """
+        if self.bus is not None:
+            self.bus.publish(msg)
+
+        self._accept()
+        if not self.clients:
+            return
+
+        data = (dumps(msg) + '\n').encode('utf-8')
+        dropped = []
+        for c in self.clients:
+            try:
+                sent = c.send(data)
+                if sent < len(data):
+                    # partial send -> subscriber is too slow
+                    dropped.append(c)
+            except (socket.error, OSError):
+                dropped.append(c)
+        for c in dropped:
+            self.clients.remove(c)
+            c.close()
+
+    def close(self):
+        for c in self.clients:
+            c.close()
+        self.clients = []
+        self.server.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class Subscriber(object):
+    """
+    Receive messages from a Publisher.
+
+    Parameters
+    ----------
+    address : str or tuple
+        Address of the Publisher.
+    topics : list
+        Topics to receive. If None, all topics are received.
+    timeout : float
+        Seconds to wait for each message. None waits forever.
+    """
+
+    def __init__(self, address='127.0.0.1:5555', topics=None, timeout=None):
+        self.family, self.address = parse_address(address)
+        self.topics = topics
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        self.sock.connect(self.address)
+        self.sock.settimeout(timeout)
+        self.buffer = b''
+
+    def get(self):
+        """
+        Return the next message, or None on timeout or disconnect.
+        """
+        while True:
+            while b'\n' in self.buffer:
+                line, self.buffer = self.buffer.split(b'\n', 1)
+                msg = json.loads(line.decode('utf-8'))
+                if self.topics is None or msg.get('topic') in self.topics:
+                    return msg
+            try:
+                chunk = self.sock.recv(65536)
+            except socket.timeout:
+                return None
+            if not chunk:
+                return None
+            self.buffer += chunk
+
+    def __iter__(self):
+        while True:
+            msg = self.get()
+            if msg is None:
+                return
+            yield msg
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,272 @@
+"""
+Sparse time indices of log files.
+
+An index is a sidecar file ('{log}.idx') of (time, byte offset) entries,
+one for the first row of every interval (default 10 minutes) and then
+every `every` rows within it. To read a time range, the index is binary
+searched for the offsets bracketing it, and only the rows in between
+are read:
+
+    from swmeas.timeindex import read_range
+    t, v = read_range('log_data/co2.csv', t0, t1)
+
+Offsets are just positions in the file, so the same index works for csv
+logs and for binary logs of fixed-size records (see `read_range_binary`).
+Loggers keep the index up to date as they write (`Driver.index_files`),
+and `build` (re)creates the index of an existing file.
+
+Rows are assumed to be (nearly) in time order, as written by the loggers.
+"""
+import os
+import numpy as np
+
+from .merge import read_log, parse_times
+
+# index entry: time of the first row after offset, and the offset
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8')])
+
+# defaults: an entry every 100 rows, and at the first row of every 10 min
+EVERY = 100
+INTERVAL = 600.
+
+
+def index_path(path):
+    """
+    The index file of a log file.
+    """
+    return path + '.idx'
+
+
+def select(times, every=EVERY, interval=INTERVAL, bucket=None, count=0):
+    """
+    Which rows get an index entry: the first row of each interval, and
+    every `every` rows after it.
+
+    Parameters
+    ----------
+    times : array
+        Times of the rows (epoch seconds).
+    every, interval :
+        See TimeIndex.
+    bucket : float
+        Interval of the row before the first (None if there isn't one).
+    count : int
+        Rows since the start of that interval.
+
+    Returns
+    -------
+    (mask, bucket, count) : the rows to index, and the state after the
+    last row.
+    """
+    times = np.asarray(times, dtype=float)
+    if len(times) == 0:
+        return np.zeros(0, dtype=bool), bucket, count
+    b = np.floor(times / interval)
+    new = np.empty(len(b), dtype=bool)
+    new[0] = bucket is None or b[0] != bucket
+    new[1:] = b[1:] != b[:-1]
+    # position of each row in its interval
+    i = np.arange(len(b))
+    start = np.maximum.accumulate(np.where(new, i, -1))
+    pos = np.where(start >= 0, i - start, i + count)
+    mask = (pos % every) == 0
+    return mask, b[-1], int(pos[-1]) + 1
+
+
+class TimeIndex(object):
+    """
+    The sparse time index of a log file, for a writer.
+
+    Parameters
+    ----------
+    path : str
+        Log file. The index is written to index_path(path).
+    every : int
+        Rows between entries.
+    interval : float
+        An entry is also made at the first row of every interval (s),
+        so sparse logs are still indexed finely in time.
+    """
+
+    def __init__(self, path, every=EVERY, interval=INTERVAL):
+        self.path = path
+        self.idx_path = index_path(path)
+        self.every = every
+        self.interval = interval
+        self.bucket = None
+        self.count = 0
+        if os.path.exists(self.idx_path):
+            if not os.path.exists(path):
+                os.remove(self.idx_path)  # log was removed
+            else:
+                last = load(path)[-1:]
+                if len(last):
+                    # carry on from the last entry
+                    self.bucket = np.floor(last['time'][0] / interval)
+
+    def add(self, times, offsets):
+        """
+        Record rows appended to the log.
+
+        Parameters
+        ----------
+        times : array
+            Times of the rows (epoch seconds).
+        offsets : array
+            Byte offset of the start of each row.
+        """
+        mask, self.bucket, self.count = select(times, self.every, self.interval,
+                                               self.bucket, self.count)
+        if mask.any():
+            ent = np.zeros(mask.sum(), dtype=INDEX_DTYPE)
+            ent['time'] = np.asarray(times, dtype=float)[mask]
+            ent['offset'] = np.asarray(offsets)[mask]
+            with open(self.idx_path, 'ab') as f:
+                f.write(ent.tobytes())
+
+
+def load(path):
+    """
+    The index entries of a log file (empty if it has no index).
+    """
+    ipath = index_path(path)
+    if not os.path.exists(ipath):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    # ignore a partly written last entry
+    n = os.path.getsize(ipath) // INDEX_DTYPE.itemsize
+    return np.fromfile(ipath, dtype=INDEX_DTYPE, count=n)
+
+
+def seek(index, t0, t1=None):
+    """
+    Binary search an index for the bytes that hold times t0 to t1.
+
+    Returns
+    -------
+    (start, end) : byte offsets. end is None if the range may run to
+    the end of the file.
+    """
+    # running maximum, so a late row can't hide the range
+    tmax = np.maximum.accumulate(index['time'])
+    i = np.searchsorted(tmax, t0, side='left') - 1
+    start = int(index['offset'][i]) if i >= 0 else 0
+    end = None
+    if t1 is not None:
+        # first entry after which every time is > t1
+        tmin = np.minimum.accumulate(index['time'][::-1])[::-1]
+        j = np.searchsorted(tmin, t1, side='right')
+        if j < len(index):
+            end = int(index['offset'][j])
+    return start, end
+
+
+def _csv_rows(path, chunk_size=1 << 24):
+    """
+    Iterate over (times, offsets) of the data rows of a csv log, a
+    chunk at a time.
+    """
+    offset = 0
+    with open(path, 'rb') as f:
+        rest = b''
+        while True:
+            data = f.read(chunk_size)
+            buf = rest + data
+            end = buf.rfind(b'\n') + 1
+            if end == 0:
+                if not data:
+                    return
+                rest = buf
+                continue
+            lines = buf[:end].split(b'\n')[:-1]
+            starts = np.cumsum([0] + [len(l) + 1 for l in lines[:-1]]) + offset
+            keep = [i for i, l in enumerate(lines) if l and not l.startswith(b'#')]
+            if keep:
+                tstrs = [lines[i][:lines[i].find(b',')].decode('utf-8') for i in keep]
+                yield parse_times(tstrs), starts[keep]
+            offset += end
+            rest = buf[end:]
+            if not data:
+                return
+
+
+def build(path, dtype=None, every=EVERY, interval=INTERVAL):
+    """
+    (Re)create the index of an existing log file.
+
+    Parameters
+    ----------
+    path : str
+        Log file.
+    dtype : numpy.dtype
+        If given, the log is binary: a sequence of records of dtype,
+        with a 'time' field (epoch seconds). Otherwise, a csv log.
+    every, interval :
+        See TimeIndex.
+
+    Returns
+    -------
+    array of index entries.
+    """
+    ipath = index_path(path)
+    if os.path.exists(ipath):
+        os.remove(ipath)
+    idx = TimeIndex(path, every, interval)
+    if dtype is None:
+        for times, offsets in _csv_rows(path):
+            idx.add(times, offsets)
+    else:
+        dtype = np.dtype(dtype)
+        n = os.path.getsize(path) // dtype.itemsize
+        if n:
+            times = np.memmap(path, dtype=dtype, mode='r', shape=(n,))['time']
+            idx.add(times, np.arange(n, dtype=np.uint64) * dtype.itemsize)
+    return load(path)
+
+
+def _index(path, dtype, every, interval):
+    index = load(path)
+    if len(index) == 0 and os.path.exists(path) and os.path.getsize(path):
+        index = build(path, dtype, every, interval)
+    return index
+
+
+def read_range(path, t0, t1, every=EVERY, interval=INTERVAL):
+    """
+    Read the rows of a csv log between times t0 and t1 (inclusive).
+
+    The index is built first if the log doesn't have one.
+
+    Returns
+    -------
+    (times, values) : as `swmeas.merge.read_log`.
+    """
+    start, end = seek(_index(path, None, every, interval), t0, t1)
+    times, values, _ = read_log(path, start, end)
+    keep = (times >= t0) & (times <= t1)
+    return times[keep], values[keep]
+
+
+def read_range_binary(path, dtype, t0, t1, every=EVERY, interval=INTERVAL):
+    """
+    Read the records of a binary log between times t0 and t1 (inclusive).
+
+    Parameters
+    ----------
+    path : str
+        Log file of records of dtype, with a 'time' field.
+    dtype : numpy.dtype
+        Record dtype, e.g. `swmeas.records.CO2_DTYPE`.
+
+    Returns
+    -------
+    structured array of records.
+    """
+    dtype = np.dtype(dtype)
+    start, end = seek(_index(path, dtype, every, interval), t0, t1)
+    if end is None:
+        end = os.path.getsize(path) // dtype.itemsize * dtype.itemsize
+    n = (end - start) // dtype.itemsize
+    with open(path, 'rb') as f:
+        f.seek(start)
+        rec = np.fromfile(f, dtype=dtype, count=n)
+    return rec[(rec['time'] >= t0) & (rec['time'] <= t1)]
@@ -0,0 +1,456 @@
+"""
+Record and replay of sensor traffic.
+
+A trace is a compact binary file of every response read from a sensor
+(the raw bytes or line from a serial sensor, or the raw ADC counts from
+a LabJack), with the time it was requested and how long it took. The
+loggers record one with trace=:
+
+    logCO2(data_dir='./log_data/', trace='./log_data/co2.trace')
+
+and a trace can be replayed through the same parsing, QC and output
+code, at the recorded speed or as fast as possible:
+
+    from swmeas.trace import replay
+    replay('./log_data/co2.trace', data_dir='./replay_data/', speed=None)
+
+or from the command line:
+
+    swmeas replay ./log_data/co2.trace --data-dir ./replay_data
+
+Replayed readings are identical to the recorded ones (times included),
+and the loggers run on a VirtualClock (see `swmeas.clock`) following
+the recorded times, so folders rotate as they did.
+
+Format: the magic bytes MAGIC, then frames of a FRAME header (kind,
+source, t_utc, t_mono, latency, length) and length bytes of payload.
+SOURCE frames describe a sensor (json), and the others are its
+responses. A trace can be appended to by a restarted logger, and a
+partly written last frame is ignored.
+"""
+import os
+import json
+import mmap
+import struct
+import time as _time
+from collections import OrderedDict
+import numpy as np
+
+from . import clock
+
+MAGIC = b'SWTRACE\x01'
+
+# kind, source, t_utc, t_mono, latency, payload length
+FRAME = struct.Struct('<BHddfI')
+
+# frame kinds
+SOURCE, BYTES, TEXT, INTS, JSON = range(5)
+
+
+class ReplayFinished(Exception):
+    """
+    Raised when a replayed sensor is read after its last response.
+    """
+    pass
+
+
+def encode(resp):
+    """
+    (kind, payload) of a response.
+    """
+    if isinstance(resp, (bytes, bytearray)):
+        return BYTES, bytes(resp)
+    if isinstance(resp, str):
+        return TEXT, resp.encode('utf-8')
+    arr = np.asarray(resp)
+    if arr.ndim == 1 and arr.dtype.kind in 'iu':
+        return INTS, arr.astype('<i8').tobytes()
+    return JSON, json.dumps(resp).encode('utf-8')
+
+
+def decode(kind, payload):
+    """
+    Inverse of encode.
+    """
+    if kind == BYTES:
+        return bytes(payload)
+    if kind == TEXT:
+        return payload.decode('utf-8')
+    if kind == INTS:
+        return np.frombuffer(payload, dtype='<i8').tolist()
+    return json.loads(payload.decode('utf-8'))
+
+
+def describe(driver):
+    """
+    What is needed to rebuild a driver that parses like this one.
+    """
+    from .driver import Driver
+    for cls in type(driver).__mro__:  # e.g. CO2_sensor for AsyncCO2_sensor
+        if cls.__name__ in ('CO2_sensor', 'O2_sensor', 'pH_sensor', 'K30Unit'):
+            break
+    else:
+        cls = type(driver)
+    info = {'class': cls.__name__, 'stype': driver.STYPE,
+            'ID': getattr(driver, 'ID', None), 'name': getattr(driver, 'name', ''),
+            'label': driver.label, 'state': {}}
+    if cls.__name__ == 'pH_sensor':
+        info['state'] = dict((k, getattr(driver, k)) for k in
+                             ('probes', 'gainindex', 'cal', 'cal_temp', 'temp_slope', 'temp_offset'))
+    elif cls.__name__ == 'K30Unit':
+        info['state'] = {'address': driver.address, 'bus': driver.bus.name}
+    elif not isinstance(driver, Driver):
+        raise ValueError("Can't trace a {}".format(cls.__name__))
+    return info
+
+
+def source_key(info):
+    """
+    Name of a sensor in a trace, e.g. 'CO2_sensor:tank1'.
+    """
+    return '{}:{}'.format(info['class'], info['name'] or info['ID'] or '')
+
+
+class Recorder(object):
+    """
+    Records the responses of sensors to a trace file.
+
+    Parameters
+    ----------
+    path : str
+        Trace file. Appended to if it exists.
+    buffering : int
+        Write buffer (bytes). Call flush to write out what's buffered.
+    """
+
+    def __init__(self, path, buffering=1 << 16):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.path = path
+        self.f = open(path, 'ab', buffering)
+        if new:
+            self.f.write(MAGIC)
+        self.sources = []
+        self.frames = 0
+
+    def _write(self, kind, source, t_utc, t_mono, latency, payload):
+        self.f.write(FRAME.pack(kind, source, t_utc, t_mono, latency, len(payload)) + payload)
+        self.frames += 1
+
+    def attach(self, driver, **params):
+        """
+        Record every response parsed by driver from now on.
+
+        Parameters
+        ----------
+        driver : Driver
+            Sensor to record.
+        **params
+            Stored with the sensor's description, e.g. the interval, n
+            and wait of the logger, used as defaults by `replay`.
+        """
+        info = describe(driver)
+        info['params'] = params
+        source = len(self.sources)
+        self.sources.append(info)
+        self._write(SOURCE, source, clock.time(), clock.monotonic(), 0.,
+                    json.dumps(info).encode('utf-8'))
+        parse = driver.parse
+
+        def traced(resp, t_utc, t_mono, latency, out=None):
+            kind, payload = encode(resp)
+            self._write(kind, source, t_utc, t_mono, latency, payload)
+            return parse(resp, t_utc, t_mono, latency, out)
+        driver.parse = traced
+        return driver
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def _frames(path):
+    """
+    Iterate over (kind, source, t_utc, t_mono, latency, payload) of the
+    frames of a trace.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a trace file: {}".format(path))
+        size = os.fstat(f.fileno()).st_size
+        if size == len(MAGIC):
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = len(MAGIC)
+            while pos + FRAME.size <= size:
+                kind, source, t_utc, t_mono, latency, n = FRAME.unpack_from(data, pos)
+                pos += FRAME.size
+                if pos + n > size:
+                    return  # partly written
+                yield kind, source, t_utc, t_mono, latency, data[pos:pos + n]
+                pos += n
+        finally:
+            data.close()
+
+
+def transactions(path, key=None):
+    """
+    Iterate over the responses in a trace.
+
+    Parameters
+    ----------
+    path : str
+        Trace file.
+    key : str
+        Only responses of this sensor (see `scan`).
+
+    Yields
+    ------
+    (key, t_utc, t_mono, latency, response)
+    """
+    sources = {}
+    for kind, source, t_utc, t_mono, latency, payload in _frames(path):
+        if kind == SOURCE:
+            # a restarted recorder re-uses source numbers
+            sources[source] = source_key(json.loads(payload.decode('utf-8')))
+            continue
+        k = sources[source]
+        if key is None or k == key:
+            yield k, t_utc, t_mono, latency, decode(kind, payload)
+
+
+def scan(path):
+    """
+    The sensors in a trace.
+
+    Returns
+    -------
+    OrderedDict of {key: info}, where info is the sensor's description
+    (as recorded), with the number of responses ('count') and the times
+    of the first and last ('t0', 't1').
+    """
+    out = OrderedDict()
+    sources = {}
+    for kind, source, t_utc, t_mono, latency, payload in _frames(path):
+        if kind == SOURCE:
+            info = json.loads(payload.decode('utf-8'))
+            k = sources[source] = source_key(info)
+            if k not in out:
+                info.update(count=0, t0=None, t1=None)
+                out[k] = info
+            continue
+        info = out[sources[source]]
+        info['count'] += 1
+        if info['t0'] is None:
+            info['t0'] = t_utc
+        info['t1'] = t_utc + latency
+    return out
+
+
+def build(info, bus=None):
+    """
+    A (not connected) driver that parses like the recorded one.
+
+    Parameters
+    ----------
+    info : dict
+        Sensor description, from `scan`.
+    bus : CO2Bus
+        For a K30Unit, the bus to take it from.
+    """
+    cls, state = info['class'], info['state']
+    if cls == 'CO2_sensor':
+        from .CO2_sensor import CO2_sensor
+        driver = CO2_sensor(connect=False)
+    elif cls == 'O2_sensor':
+        from .O2_sensor import O2_sensor
+        driver = O2_sensor(connect=False)
+    elif cls == 'pH_sensor':
+        from .pH_sensor import pH_sensor
+        driver = pH_sensor(state['gainindex'], [(n, tuple(c)) for n, c in state['probes']],
+                           connect=False)
+        driver.cal = tuple(state['cal'])
+        driver.cal_temp = tuple(state['cal_temp'])
+        driver.temp_slope = state['temp_slope']
+        driver.temp_offset = state['temp_offset']
+    elif cls == 'K30Unit':
+        if bus is None:
+            raise ValueError('A K30Unit is replayed as part of its CO2Bus (see Player.bus).')
+        driver = bus.unit(state['address'])
+    else:
+        raise ValueError("Can't replay a {}".format(cls))
+    if cls != 'pH_sensor':
+        driver.ID = info['ID']
+        driver.name = info['name']
+    driver.label = info['label']
+    return driver
+
+
+class Player(object):
+    """
+    Replays the sensors in a trace.
+
+    The drivers returned by `driver` and `bus` read the recorded
+    responses, in order, through their own parse. While replaying, the
+    player's clock (a VirtualClock) should be in use (see
+    `swmeas.clock.set_clock`): it is moved on to the time of each
+    response as it is read, so code timed by it runs as it did.
+
+    Parameters
+    ----------
+    path : str
+        Trace file.
+    speed : float
+        Replay speed: 1 for the recorded speed, 10 for 10x, None (or 0)
+        for as fast as possible.
+    """
+
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+        self.sources = scan(path)
+        t0 = [s['t0'] for s in self.sources.values() if s['t0'] is not None]
+        self.t0 = min(t0) if t0 else clock.time()
+        self.clock = clock.VirtualClock(self.t0)
+        self.wall0 = None
+
+    def keys(self, stype=None):
+        """
+        Keys of the sensors in the trace (of type stype).
+        """
+        return [k for k, s in self.sources.items() if stype is None or s['stype'] == stype]
+
+    def duration(self, keys=None):
+        """
+        Time (s) from the first to the last recorded response.
+        """
+        srcs = [self.sources[k] for k in (keys or self.sources) if self.sources[k]['t0'] is not None]
+        if not srcs:
+            return 0.
+        return max(s['t1'] for s in srcs) - min(s['t0'] for s in srcs)
+
+    def _wait(self, t_utc):
+        """
+        Hold a response back until it is due, at speed.
+        """
+        if not self.speed:
+            return
+        if self.wall0 is None:
+            self.wall0 = _time.time()
+        delay = self.wall0 + (t_utc - self.t0) / self.speed - _time.time()
+        if delay > 0:
+            _time.sleep(delay)
+
+    def _replay(self, driver, key):
+        stream = transactions(self.path, key)
+
+        def read(out=None, **kwargs):
+            try:
+                _, t_utc, t_mono, latency, resp = next(stream)
+            except StopIteration:
+                raise ReplayFinished('End of {} in {}'.format(key, self.path))
+            self._wait(t_utc)
+            # the clock only moves forward
+            ahead = t_utc + latency - self.clock.time()
+            if ahead > 0:
+                self.clock.advance(ahead)
+            return driver._record(driver.parse(resp, t_utc, t_mono, latency, out))
+        driver.read = read
+        return driver
+
+    def driver(self, key=None):
+        """
+        A driver replaying one sensor.
+
+        Parameters
+        ----------
+        key : str
+            Key of the sensor (see `keys`). May be omitted if the trace
+            has a single sensor.
+        """
+        if key is None:
+            if len(self.sources) != 1:
+                raise ValueError('Trace has several sensors: choose one of {}'.format(self.keys()))
+            key = self.keys()[0]
+        return self._replay(build(self.sources[key]), key)
+
+    def bus(self, name=None):
+        """
+        A CO2Bus replaying the K-30s recorded on a bus.
+
+        Parameters
+        ----------
+        name : str
+            Name of the bus. May be omitted if the trace has one bus.
+        """
+        from .k30bus import CO2Bus
+        units = [(k, s) for k, s in self.sources.items() if s['class'] == 'K30Unit']
+        names = sorted(set(s['state']['bus'] for _, s in units))
+        if name is None:
+            if len(names) != 1:
+                raise ValueError('Trace has {} buses: choose one of {}'.format(len(names), names))
+            name = names[0]
+        units = [(k, s) for k, s in units if s['state']['bus'] == name]
+        if not units:
+            raise ValueError("No bus named '{}' in trace".format(name))
+        bus = CO2Bus(dict((s['state']['address'], s['name']) for _, s in units),
+                     name=name, connect=False)
+        for k, s in units:
+            self._replay(build(s, bus), k)
+        return bus
+
+
+def replay(path, data_dir='./replay_data/', speed=None, key=None, **kwargs):
+    """
+    Replay a trace through the logger of its sensor (logCO2, logTempO2,
+    logpH or logCO2bus).
+
+    Parameters
+    ----------
+    path : str
+        Trace file.
+    data_dir : str
+        Folder for the replayed logger's output.
+    speed : float
+        1 for the recorded speed, None for as fast as possible.
+    key : str
+        Sensor to replay (see `Player.keys`), or the name of a bus. May
+        be omitted if the trace has a single sensor (or bus).
+    **kwargs
+        Passed to the logger (e.g. qc, index, database). interval, n
+        and wait default to those recorded.
+
+    Returns
+    -------
+    The Player.
+    """
+    from .logger import logCO2, logTempO2, logpH, logCO2bus
+    player = Player(path, speed)
+    units = [k for k, s in player.sources.items() if s['class'] == 'K30Unit']
+    buses = set(player.sources[k]['state']['bus'] for k in units)
+    if key in buses or (key is None and units and len(units) == len(player.sources)):
+        sensor = player.bus(key)
+        keys = [k for k in units if player.sources[k]['state']['bus'] == sensor.name]
+        log = logCO2bus
+        kwargs['addresses'] = [u.address for u in sensor.units]
+    else:
+        sensor = player.driver(key)
+        keys = [key or player.keys()[0]]
+        log = {'CO2': logCO2, 'TempO2': logTempO2, 'pH': logpH}.get(player.sources[keys[0]]['stype'])
+        if log is None:
+            raise ValueError("No logger for {}: replay it with Player.driver".format(keys[0]))
+    for k, v in player.sources[keys[0]].get('params', {}).items():
+        kwargs.setdefault(k, v)
+    # stop after the loop that reads the last recorded responses
+    kwargs.setdefault('stop', player.duration(keys) + kwargs.get('interval', 30))
+
+    old = clock.set_clock(player.clock)
+    try:
+        log(data_dir=data_dir, sensor=sensor, **kwargs)
+    except ReplayFinished:
+        print('\nEnd of trace.')
+    finally:
+        clock.set_clock(old)
+    return player
@@ -0,0 +1,334 @@
+import os
+import math
+import time
+import traceback
+import multiprocessing as mp
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .CO2_sensor import CO2_sensor  # imported to register the drivers
+from .O2_sensor import O2_sensor
+from .driver import DRIVERS, get_driver
+from .helpers import timed_dir, write_par
+from .stream import reading_message
+
+# sensor classes available to workers, by type name
+SENSOR_TYPES = DRIVERS
+
+
+def write_CO2(sensor, save_dir, suffix='', **kwargs):
+    sensor.write_batch(os.path.join(save_dir, 'co2{}.csv'.format(suffix)))
+
+
+def write_TempO2(sensor, save_dir, suffix='', mode='water', **kwargs):
+    sensor.write_TempO2_batch(os.path.join(save_dir, 'temp{}.csv'.format(suffix)),
+                              os.path.join(save_dir, 'o2{}.csv'.format(suffix)),
+                              mode=mode)
+    sensor.write(os.path.join(save_dir, 'TempO2_raw{}.csv'.format(suffix)))
+
+
+# functions writing the last batch of each sensor type to save_dir
+WRITERS = {'CO2': write_CO2,
+           'TempO2': write_TempO2}
+
+
+def next_slot(start, interval, now):
+    """
+    Index of the next slot on the global sampling schedule.
+
+    Slot k starts at start + k * interval.
+    """
+    return max(int(math.ceil((now - start) / float(interval))), 0)
+
+
+def acquisition_worker(wid, specs, start, interval, n, wait, out_queue, stop_event):
+    """
+    Acquisition loop run in each worker process.
+
+    Connects to its sensors, and sends a batch of readings of each (read
+    in turn) to out_queue at each slot of the global schedule. Slots
+    missed because reads overran are skipped, so all workers stay in
+    phase.
+
+    Parameters
+    ----------
+    wid : str
+        Name of the worker.
+    specs : list
+        (key, spec) of each sensor of the worker.
+
+    Messages are tuples of:
+        ('ready', key, label, pid)
+        ('data', key, slot, structured array of readings)
+        ('error', wid, traceback, pid)
+    """
+    try:
+        sensors = []
+        for key, spec in specs:
+            sensor = get_driver(spec['type'])(ID=spec.get('ID'), port=spec.get('port'))
+            sensors.append((key, spec, sensor))
+            out_queue.put(('ready', key, sensor.label, os.getpid()))
+
+        slot = next_slot(start, interval, time.time())
+        while not stop_event.is_set():
+            delay = start + slot * interval - time.time()
+            if delay > 0 and stop_event.wait(delay):
+                break
+            for key, spec, sensor in sensors:
+                batch = sensor.read_multi(n, wait, **spec.get('read_kwargs', {}))
+                out_queue.put(('data', key, slot, batch.array.copy()))
+            slot = max(slot + 1, next_slot(start, interval, time.time()))
+    except Exception:
+        out_queue.put(('error', wid, traceback.format_exc(), os.getpid()))
+        raise
+
+
+class AcquisitionPool(object):
+    """
+    Log many sensors at once, in worker processes.
+
+    Each worker owns the serial connections of its sensors and does
+    their reading and parsing, so sensors aren't limited by a single
+    interpreter. By default each sensor has its own worker; with
+    `processes`, sensors are shared out between that many workers, which
+    read theirs in turn. Batches are sent back through a queue to this
+    (coordinating) process, which writes all output files.
+
+    Workers that crash, or that hang (send nothing for `timeout` seconds
+    after their slot), are restarted with an increasing delay, while the
+    others carry on.
+
+    Parameters
+    ----------
+    sensors : list of dicts
+        One dict per sensor, containing 'type' ('CO2' or 'TempO2'),
+        and 'ID' or 'port'. Optional 'name' is used in file names
+        (defaults to ID or port), and 'read_kwargs' is passed to
+        read_multi.
+    data_dir : str
+        folder in which to store the data files.
+    interval : float
+        Time between measurements (seconds), shared by all sensors.
+    n : int
+        The number of measurements to make per sensor per interval.
+    wait : float
+        Time between individual measurements.
+    mode : str
+        O2 output mode, 'water' or 'air'.
+    max_restarts : int
+        Consecutive failures before a worker is abandoned.
+    dashboard : str
+        If specified, readings of all sensors are shown on a web
+        dashboard served on this address. See `swmeas.dashboard`.
+    processes : int
+        Maximum number of worker processes. None for one per sensor.
+    timeout : float
+        Seconds a worker may overrun a slot before it is taken to be
+        hung, and restarted. Defaults to interval plus n * wait for each
+        of its sensors.
+    """
+
+    def __init__(self, sensors, data_dir='./log_data/', interval=30, n=5, wait=1.,
+                 new_folder_every=None, mode='water', max_restarts=5, verbose=False,
+                 dashboard=None, processes=None, timeout=None):
+        self.specs = {}
+        for s in sensors:
+            if s.get('type') not in WRITERS:
+                raise ValueError("Sensor type must be one of {}".format(list(WRITERS)))
+            key = str(s.get('name') or s.get('ID') or s.get('port'))
+            self.specs[key] = s
+        if processes is not None and processes < 1:
+            raise ValueError('processes must be at least 1.')
+        self.data_dir = data_dir
+        self.interval = interval
+        self.n = n
+        self.wait = wait
+        self.new_folder_every = new_folder_every
+        self.mode = mode
+        self.max_restarts = max_restarts
+        self.verbose = verbose
+        self.dashboard = dashboard
+        self.dash = None
+
+        # {worker name: sensor keys}, sensors dealt out in turn
+        keys = sorted(self.specs)
+        nproc = len(keys) if processes is None else min(processes, len(keys))
+        self.groups = dict(('w{}'.format(i), keys[i::nproc]) for i in range(nproc))
+        self.worker_of = dict((k, w) for w, ks in self.groups.items() for k in ks)
+        if timeout is None:
+            self.timeouts = dict((w, interval + n * wait * len(ks)) for w, ks in self.groups.items())
+        else:
+            self.timeouts = dict((w, timeout) for w in self.groups)
+
+        self.queue = mp.Queue()
+        self.stop_event = mp.Event()
+        self.procs = {}
+        self.writers = {}
+        self.restart_at = {}
+        self.deadline = {}
+        self.failures = dict((w, 0) for w in self.groups)
+        self.stats = {k: {'restarts': 0, 'failures': 0, 'hangs': 0, 'batches': 0,
+                          'missed': 0, 'last_slot': None} for k in self.specs}
+        self.start_time = None
+
+    def _spawn(self, wid):
+        p = mp.Process(target=acquisition_worker, name='swmeas-{}'.format(wid),
+                       args=(wid, [(k, self.specs[k]) for k in self.groups[wid]],
+                             self.start_time, self.interval, self.n, self.wait,
+                             self.queue, self.stop_event))
+        p.daemon = True
+        p.start()
+        self.procs[wid] = p
+        # time to connect and read the first slot
+        self.deadline[wid] = time.time() + self.interval + self.timeouts[wid]
+
+    def start(self):
+        """
+        Start all workers on a common schedule.
+        """
+        if not os.path.exists(self.data_dir):
+            os.mkdir(self.data_dir)
+        if self.dashboard is not None:
+            from .dashboard import Dashboard
+            self.dash = Dashboard(self.dashboard)
+        self.start_time = math.ceil(time.time())
+        for wid in sorted(self.groups):
+            self._spawn(wid)
+
+    def check_workers(self):
+        """
+        Restart crashed and hung workers, after a delay that doubles
+        with each consecutive failure.
+        """
+        now = time.time()
+        for wid in list(self.procs):
+            p = self.procs[wid]
+            if p is None:
+                if now >= self.restart_at[wid]:
+                    print('Restarting worker {}...'.format(wid))
+                    for k in self.groups[wid]:
+                        self.stats[k]['restarts'] += 1
+                    self._spawn(wid)
+                continue
+            if p.is_alive():
+                if now < self.deadline[wid]:
+                    continue
+                print('Worker {} ({}) is {:.0f} s late. Restarting it.'.format(
+                    wid, ', '.join(self.groups[wid]), now - self.deadline[wid] + self.timeouts[wid]))
+                for k in self.groups[wid]:
+                    self.stats[k]['hangs'] += 1
+                p.terminate()
+            p.join()
+            self.failures[wid] += 1
+            for k in self.groups[wid]:
+                self.stats[k]['failures'] += 1
+            if self.failures[wid] > self.max_restarts:
+                print('Worker {} failed {} times. Giving up.'.format(wid, self.failures[wid]))
+                del self.procs[wid]
+            else:
+                self.procs[wid] = None
+                self.restart_at[wid] = now + min(60, 2 ** self.failures[wid])
+
+    def handle(self, msg):
+        """
+        Process a message from a worker.
+        """
+        kind, key = msg[:2]
+        if kind == 'error':
+            print('Worker {} (pid {}) failed:\n{}'.format(key, msg[3], msg[2]))
+            return
+        spec = self.specs[key]
+        wid = self.worker_of[key]
+        if kind == 'ready':
+            w = get_driver(spec['type'])(ID=spec.get('ID'), port=spec.get('port'),
+                                         name=key, connect=False)
+            w.label = msg[2]
+            self.writers[key] = w
+            slot = next_slot(self.start_time, self.interval, time.time())
+            self.deadline[wid] = self.start_time + slot * self.interval + self.timeouts[wid]
+        elif kind == 'data':
+            slot, arr = msg[2:]
+            st = self.stats[key]
+            if st['last_slot'] is not None and slot > st['last_slot'] + 1:
+                st['missed'] += slot - st['last_slot'] - 1
+            st['last_slot'] = slot
+            st['batches'] += 1
+            st['failures'] = 0
+            self.failures[wid] = 0
+            # the worker's next slot is due an interval later
+            self.deadline[wid] = self.start_time + (slot + 1) * self.interval + self.timeouts[wid]
+
+            if self.new_folder_every is not None:
+                save_dir = timed_dir(self.data_dir, self.new_folder_every)
+            else:
+                save_dir = self.data_dir
+            w = self.writers[key]
+            w.last_read = arr
+            WRITERS[spec['type']](w, save_dir, suffix='_' + key, mode=self.mode)
+            if self.dash is not None:
+                self.dash.publish(reading_message(key, w.label, arr))
+            if self.verbose:
+                print(key + ': ' + w.write_str[:-1])
+
+    def run(self, stop=0):
+        """
+        Run until stop seconds have elapsed (or forever if stop is 0).
+        """
+        self.start()
+        t0 = time.time()
+        try:
+            while stop <= 0 or time.time() - t0 < stop:
+                try:
+                    self.handle(self.queue.get(timeout=1.))
+                except queue.Empty:
+                    pass
+                self.check_workers()
+                if len(self.procs) == 0:
+                    print('No workers left.')
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout=5.):
+        """
+        Stop all workers and write any remaining data.
+        """
+        self.stop_event.set()
+        for p in self.procs.values():
+            if p is not None:
+                p.join(timeout)
+                if p.is_alive():
+                    p.terminate()
+        while True:
+            try:
+                self.handle(self.queue.get(timeout=.1))
+            except queue.Empty:
+                break
+        self.procs = {}
+        if self.dash is not None:
+            self.dash.close()
+            self.dash = None
+        print('\nFinished.')
+
+
+def logPool(sensors, data_dir='./log_data/', interval=30, stop=0, n=5, wait=1.,
+            mode='water', new_folder_every=None, max_restarts=5, verbose=False,
+            dashboard=None, processes=None, timeout=None, **kwargs):
+    """
+    Log many sensors in parallel worker processes.
+
+    See `AcquisitionPool` for parameters. stop is the run time in
+    seconds (0 runs until interrupted).
+    """
+    if not os.path.exists(data_dir):
+        os.mkdir(data_dir)
+    write_par(locals(), data_dir + '/logPool.json')
+
+    pool = AcquisitionPool(sensors, data_dir, interval, n, wait, new_folder_every, mode,
+                           max_restarts, verbose, dashboard, processes, timeout)
+    pool.run(stop)
+    return pool
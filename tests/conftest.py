@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from swmeas import clock
+from swmeas.helpers import modbus_crc
+
+
+@pytest.fixture
+def virtual_clock():
+    """
+    Run a test on a VirtualClock, so the loggers don't really sleep.
+    """
+    clk = clock.VirtualClock(1.7e9)
+    old = clock.set_clock(clk)
+    yield clk
+    clock.set_clock(old)
+
+
+class SimBus(object):
+    """
+    Simulated RS-485 line of K-30s, answering at any address.
+    """
+
+    def __init__(self, seed=0):
+        self.rng = np.random.RandomState(seed)
+        self.buffer = b''
+
+    def flushInput(self):
+        self.buffer = b''
+
+    def write(self, msg):
+        address = bytearray(msg)[0]
+        co2 = int(400 + address + 5 * self.rng.randn())
+        resp = bytes(bytearray([address, 0x44, 0x02, co2 >> 8, co2 & 0xFF]))
+        self.buffer = resp + modbus_crc(resp)
+
+    def read(self, n):
+        clock.sleep(0.02)
+        out, self.buffer = self.buffer[:n], self.buffer[n:]
+        return out
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sim_bus():
+    """
+    A CO2Bus of two sensors ('a' at 1 and 'b' at 2) on a SimBus.
+    """
+    from swmeas.k30bus import CO2Bus
+    bus = CO2Bus({1: 'a', 2: 'b'}, connect=False)
+    bus.sensor = SimBus()
+    return bus
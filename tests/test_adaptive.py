@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from swmeas.adaptive import AdaptiveSampler
+
+
+def batch(t0, mean, std=0., n=5):
+    return t0 + np.arange(n), mean + std * np.array([-1, 1, -1, 1, 0][:n])
+
+
+def test_interval_follows_variability():
+    s = AdaptiveSampler(interval=60, min_interval=10, max_interval=240, std_threshold=1., calm=2)
+    # noisy: halved down to min_interval
+    assert [s.update(*batch(60 * i, 400, std=5)) for i in range(4)] == [30, 15, 10, 10]
+    # quiet: doubled after every 2 quiet batches, up to max_interval
+    out = [s.update(*batch(300 + 60 * i, 400)) for i in range(10)]
+    assert out == [10, 20, 20, 40, 40, 80, 80, 160, 160, 240]
+
+
+def test_rate_threshold():
+    s = AdaptiveSampler(interval=60, rate_threshold=2., std_threshold=None)
+    s.update(*batch(0, 400))
+    # 10 units in a minute
+    assert s.update(*batch(60, 410)) == 30
+    assert s.rate == pytest.approx(10.)
+
+
+def test_missing_readings_leave_interval():
+    s = AdaptiveSampler(interval=60, std_threshold=1.)
+    assert s.update(np.arange(3.), np.full(3, np.nan)) == 60
+    assert len(s.history) == 0
+
+
+def test_threshold_required():
+    with pytest.raises(ValueError):
+        AdaptiveSampler(interval=60)
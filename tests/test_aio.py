@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+serial = pytest.importorskip('serial')
+
+from swmeas.aio import AsyncCO2_sensor, AsyncSerial  # noqa: E402
+from swmeas.helpers import modbus_crc  # noqa: E402
+from swmeas.qc import QC_MISSING  # noqa: E402
+
+RESPONSE = b'\xfe\x44\x02\x01\x90' + modbus_crc(b'\xfe\x44\x02\x01\x90')  # 400 ppm
+
+
+@pytest.fixture
+def pty():
+    """
+    (master fd, serial.Serial on the slave end) of a pseudo-terminal.
+    """
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), timeout=5)
+    yield master, ser
+    ser.close()
+    os.close(master)
+    os.close(slave)
+
+
+def test_read_waits_for_the_whole_response(pty):
+    master, ser = pty
+
+    async def main():
+        t = AsyncSerial(ser)
+        loop = asyncio.get_running_loop()
+        loop.call_later(.05, os.write, master, b'ab')
+        loop.call_later(.1, os.write, master, b'cd\rrest')
+        line = await t.readline(b'\r', timeout=1.)
+        short = await t.read(10, timeout=.1)
+        return line, short
+
+    line, short = asyncio.run(main())
+    assert line == b'abcd\r' and short == b'rest'
+    # the port's own timeout is left alone
+    assert ser.timeout == 5
+
+
+def test_async_driver_reads_and_times_out(pty, virtual_clock):
+    master, ser = pty
+    s = AsyncCO2_sensor(connect=False)
+    s.sensor = ser
+    s.transport = AsyncSerial(ser)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(.05, os.write, master, RESPONSE)
+        r = await s.read(timeout=1.)
+        ok = (float(r['co2']), int(r['flag']), float(r['time']))
+        r = await s.read(timeout=.1)  # no response
+        return ok, (float(r['co2']), int(r['flag']))
+
+    ok, missing = asyncio.run(main())
+    assert ok[:2] == (400., 0)
+    # timestamped on the logger's clock
+    assert ok[2] == 1.7e9
+    assert np.isnan(missing[0]) and missing[1] == QC_MISSING
+    assert s.stats['reads'] == 2 and s.stats['flagged'] == 1
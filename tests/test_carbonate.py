@@ -0,0 +1,34 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from swmeas.carbonate import carbonate_system, constants
+
+
+def test_constants_check_values():
+    # S = 35, T = 25 C (Dickson, Sabine & Christian 2007, SOP Guide ch. 5)
+    K = constants(25., 35.)
+    assert np.log(K['K0']) == pytest.approx(-3.5617, abs=1e-4)
+    assert np.log10(K['K1']) == pytest.approx(-5.8472, abs=1e-4)
+    assert np.log10(K['K2']) == pytest.approx(-8.9660, abs=1e-4)
+    assert np.log(K['KB']) == pytest.approx(-19.7964, abs=1e-4)
+
+
+@pytest.mark.parametrize('type1,type2', [(a, b) for a, b in itertools.combinations(
+    ['pH', 'pCO2', 'DIC', 'TA'], 2)])
+def test_round_trip(type1, type2):
+    T = np.array([5., 15., 25.])
+    S = np.array([30., 33., 35.])
+    ref = carbonate_system(2300., [2000., 2100., 2150.], 'TA', 'DIC', T, S)
+    out = carbonate_system(ref[type1], ref[type2], type1, type2, T, S)
+    for k in ('pH', 'pCO2', 'fCO2', 'DIC', 'TA', 'CO3', 'OmegaA'):
+        assert np.allclose(out[k], ref[k], rtol=1e-6), k
+    assert np.allclose(ref['TA'], 2300.) and np.allclose(ref['DIC'], [2000., 2100., 2150.])
+
+
+def test_bad_parameters():
+    with pytest.raises(ValueError):
+        carbonate_system(400., 2000., 'pCO2', 'DOC')
+    with pytest.raises(ValueError):
+        carbonate_system(400., 400., 'pCO2', 'fCO2')
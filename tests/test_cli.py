@@ -0,0 +1,38 @@
+import pytest
+
+from swmeas import cli
+
+
+def unsupported(*argv):
+    p = cli.parser()
+    args = p.parse_args(['log'] + list(argv))
+    return cli.unsupported_options(args, vars(p.parse_args(['log', args.sensor])))
+
+
+def test_supported_options():
+    assert unsupported('CO2', '--ring', 'r', '--qc', '--pyramid', '-n', '3') == []
+    assert unsupported('CO2bus', '--addresses', '1', '2', '--dashboard', 'x', '--ring', 'r') == []
+    assert unsupported('pH', '--trace', 't', '--database', 'd', '--probes', 'a=2,0') == []
+    assert unsupported('Pool', '--sensors', 's.json', '--mode', 'air', '--processes', '2') == []
+    assert unsupported('auto', '--auto-mode', 'TempO2', '--path', '.') == []
+
+
+def test_unsupported_options():
+    assert unsupported('Pool', '--ring', 'r', '--qc', '--trace', 't') == ['--qc', '--ring', '--trace']
+    assert unsupported('CO2', '--mode', 'air', '--port', 'p') == ['--mode', '--port']
+    assert unsupported('pH', '--id', 'x') == ['--id']
+    assert unsupported('CO2', '--probes', 'a=2,0') == ['--probes']
+    assert unsupported('auto', '-n', '3') == ['-n']
+
+
+def test_main_rejects_unsupported_options():
+    with pytest.raises(SystemExit) as e:
+        cli.main(['log', 'Pool', '--sensors', 's.json', '--ring', 'r'])
+    assert e.value.code == 2
+
+
+def test_probes():
+    args = cli.parser().parse_args(['log', 'pH', '--probes', 'a=2,0', 'b=3,1'])
+    assert args.probes == [('a', (2, 0)), ('b', (3, 1))]
+    with pytest.raises(SystemExit):
+        cli.parser().parse_args(['log', 'pH', '--probes', 'a=2'])
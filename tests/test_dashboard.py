@@ -0,0 +1,36 @@
+import json
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+import pytest
+
+from swmeas.dashboard import Dashboard
+
+
+def message(sensor, t, value):
+    return {'topic': 'CO2', 'sensor': sensor, 'fields': ['co2'], 'time': [t], 'values': [[value]]}
+
+
+@pytest.fixture
+def dashboard():
+    d = Dashboard('127.0.0.1:0', history=2)
+    yield d
+    d.close()
+
+
+def get(d, path):
+    return urlopen('http://{}:{}/{}'.format(d.address[0], d.address[1], path), timeout=5).read()
+
+
+def test_history_kept_per_sensor(dashboard):
+    for i in range(5):
+        dashboard.publish(message('a', i, 400. + i))
+    dashboard.publish(message('b', 0, float('nan')))
+    msgs = json.loads(get(dashboard, 'history').decode('utf-8'))
+    # the busy sensor doesn't push the other out of the history
+    assert [(m['sensor'], m['time'][0]) for m in msgs] == [('a', 3), ('a', 4), ('b', 0)]
+    assert msgs[-1]['values'] == [[None]]
+
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from swmeas.database import Database, connect, query
+from swmeas.records import CO2_DTYPE
+
+T0 = 1.7e9
+
+
+def readings(t, co2):
+    arr = np.zeros(len(t), dtype=CO2_DTYPE)
+    arr['time'] = t
+    arr['co2'] = co2
+    return arr
+
+
+@pytest.fixture
+def db(tmp_path):
+    d = Database(str(tmp_path / 'log.db'))
+    yield d
+    d.close()
+
+
+def test_time_queries(db):
+    t = T0 + np.arange(10.)
+    db.write('CO2', 'A', readings(t, 400 + np.arange(10.)))
+    db.write('CO2', 'B', readings(t + .5, 500 + np.arange(10.)))
+
+    d = query(db.path, 'CO2', sensor='A', t0=T0 + 2, t1=T0 + 5)
+    assert np.array_equal(d['time'], t[2:6])
+    assert np.array_equal(d['co2'], [402., 403., 404., 405.])
+    # both sensors, in time order
+    d = query(db.path, 'CO2', t0=T0 + 8)
+    assert np.array_equal(d['time'], [T0 + 8, T0 + 8.5, T0 + 9, T0 + 9.5])
+    # the most recent readings, still in time order
+    d = query(db.path, 'CO2', sensor='B', limit=3, fields=['co2'])
+    assert d.dtype.names == ('time', 'co2')
+    assert np.array_equal(d['co2'], [507., 508., 509.])
+    assert len(query(db.path, 'CO2', t0=T0 + 100)) == 0
+
+
+def test_nan_round_trip(db):
+    db.write('CO2', 'A', readings(T0 + np.arange(3.), [400., np.nan, 402.]))
+    c = connect(db.path)
+    assert c.execute('SELECT COUNT(*) FROM CO2 WHERE co2 IS NULL').fetchone()[0] == 1
+    c.close()
+    assert np.array_equal(query(db.path, 'CO2')['co2'], [400., np.nan, 402.], equal_nan=True)
+
+
+def test_batched_commits(tmp_path, virtual_clock):
+    db = Database(str(tmp_path / 'log.db'), commit_every=3, commit_interval=60.)
+    db.write('CO2', 'A', readings([T0], [400.]))
+    reader = connect(db.path)
+    count = lambda: reader.execute('SELECT COUNT(*) FROM CO2').fetchone()[0]
+    # the table exists, but the reading isn't committed yet
+    assert count() == 0
+    db.write('CO2', 'A', readings([T0 + 1], [401.]))
+    db.write('CO2', 'A', readings([T0 + 2], [402.]))
+    assert count() == 3
+    # a slow writer is committed after commit_interval
+    db.write('CO2', 'A', readings([T0 + 3], [403.]))
+    virtual_clock.sleep(61.)
+    db.write('CO2', 'A', readings([T0 + 64], [404.]))
+    assert count() == 5
+    db.write('CO2', 'A', readings([T0 + 65], [405.]))
+    db.close()
+    assert count() == 6
+    reader.close()
+
+
+def test_query_unknown_table(db):
+    db.write('CO2', 'A', readings([T0], [400.]))
+    with pytest.raises(ValueError):
+        db.query('pH')
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from swmeas.CO2_sensor import CO2_sensor
+from swmeas.O2_sensor import O2_sensor
+from swmeas.driver import get_driver
+from swmeas.helpers import modbus_crc
+from swmeas.merge import read_log
+from swmeas.qc import QC_MISSING, QC_COMM, QC_STATUS
+from swmeas.records import O2_FIELDS, format_time
+from swmeas.soak import sim_sensor
+
+RAL = [0, 20000, 250000, 200000, 98000, 20500, 20000, 100000, 1000, 0, 0, 1, 20900]
+
+
+def k30_response(co2, address=0xFE):
+    resp = bytes(bytearray([address, 0x44, 0x02, co2 >> 8, co2 & 0xFF]))
+    return resp + modbus_crc(resp)
+
+
+def test_co2_parse():
+    s = CO2_sensor(connect=False)
+    r = s.parse(k30_response(412), 1.7e9, 10., .05)
+    assert r['co2'] == 412 and r['flag'] == 0
+    assert r['time'] == 1.7e9 and r['t_mono'] == 10.
+    assert np.isclose(r['latency'], .05)
+
+    bad = bytearray(k30_response(412))
+    bad[-1] ^= 0xFF
+    assert s.parse(bytes(bad), 1.7e9, 10., .05)['flag'] == QC_COMM
+
+    r = s.parse(b'\xfe\x44', 1.7e9, 10., .5)
+    assert np.isnan(r['co2']) and r['flag'] == QC_MISSING
+
+
+def test_o2_parse():
+    s = O2_sensor(connect=False)
+    r = s.parse('RAL 1 ' + ' '.join(str(v) for v in RAL) + '\r', 1.7e9, 0., .3)
+    assert [r[f] for f in O2_FIELDS] == RAL and r['flag'] == 0
+
+    status = [1] + RAL[1:]
+    assert s.parse('RAL 1 ' + ' '.join(str(v) for v in status), 1.7e9, 0., .3)['flag'] == QC_STATUS
+
+    r = s.parse('RAL 1 0 20000', 1.7e9, 0., 1.)
+    assert r['flag'] == QC_MISSING and np.isnan(r['tempSample'])
+
+
+def test_missing():
+    r = CO2_sensor(connect=False).missing(1.7e9, 5., 1.)
+    assert np.isnan(r['co2']) and r['flag'] == QC_MISSING and r['time'] == 1.7e9
+
+
+def test_get_driver():
+    assert get_driver('CO2') is CO2_sensor
+    with pytest.raises(ValueError):
+        get_driver('CH4')
+
+
+def test_co2_write_round_trip(tmp_path, virtual_clock):
+    s = sim_sensor('CO2', dropout=0.)
+    path = str(tmp_path / 'co2.csv')
+    batches = []
+    for _ in range(3):
+        s.read_multi(5, 1.)
+        s.write_batch(path)
+        batches.append(s.batch.array.copy())
+    times, values, _ = read_log(path)
+    assert list(format_time(times)) == [format_time(b['time'][0]) for b in batches]
+    assert np.array_equal(values, np.array([b['co2'] for b in batches]))
+
+
+def test_o2_write_round_trip(tmp_path, virtual_clock):
+    s = sim_sensor('TempO2', dropout=0.)
+    path = str(tmp_path / 'TempO2_raw.csv')
+    s.read_multi(4, .5)
+    s.write(path)
+    arr = s.batch.array
+    times, values, _ = read_log(path)
+    assert np.array_equal(format_time(times), format_time(arr['time']))
+    assert np.array_equal(values, np.array([arr[f] for f in O2_FIELDS]).T)
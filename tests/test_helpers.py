@@ -0,0 +1,22 @@
+import numpy as np
+
+from swmeas.helpers import RowEncoder, encode_rows, fmt
+
+
+def test_encoder_matches_fmt():
+    rng = np.random.RandomState(0)
+    values = rng.randn(50, 4) * 1000
+    values[3, 2] = np.nan
+    times = ['2024-01-01T00:00:{:02d}.000Z'.format(i) for i in range(50)]
+    for dec in (0, 1, 3):
+        expected = ''.join(fmt([t] + list(v), dec, ',') + '\n' for t, v in zip(times, values))
+        assert encode_rows(times, values, dec) == expected
+        # in several chunks
+        assert RowEncoder(dec, chunk=7).encode(times, values) == expected
+
+
+def test_encoder_per_column_decimals():
+    enc = RowEncoder(dec=[1, None, 3], sep=';')
+    assert enc.encode(['t'], [1.25, 2., 3.]) == 't;1.2;2.0;3.000\n'
+    assert enc.encode([], np.empty((0, 3))) == ''
+
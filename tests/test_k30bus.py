@@ -0,0 +1,58 @@
+import json
+import os
+
+import numpy as np
+
+from conftest import SimBus
+from swmeas.driver import get_driver
+from swmeas.helpers import find_sensor, modbus_crc
+from swmeas.k30bus import CO2Bus
+from swmeas.logger import logCO2bus
+from swmeas.qc import QC_COMM
+
+
+def k30_response(co2, address=0xFE):
+    resp = bytes(bytearray([address, 0x44, 0x02, co2 >> 8, co2 & 0xFF]))
+    return resp + modbus_crc(resp)
+
+
+def test_unit_parse(sim_bus):
+    a, b = sim_bus.units
+    assert a.parse(k30_response(400, 1), 1.7e9, 0., 0.)['flag'] == 0
+    # a reply from another sensor
+    r = a.parse(k30_response(400, 2), 1.7e9, 0., 0.)
+    assert np.isnan(r['co2']) and r['flag'] == QC_COMM
+
+
+def test_modbus_crc():
+    # the K-30 'read CO2' request
+    assert modbus_crc(b'\xfe\x44\x00\x08\x02') == b'\x9f\x25'
+
+
+def test_bus_is_registered():
+    assert get_driver('CO2bus') is CO2Bus
+
+
+def test_find_bus_adapter(tmp_path, monkeypatch):
+    from serial.tools import list_ports
+    path = str(tmp_path / 'SNs.json')
+    with open(path, 'w') as f:
+        json.dump({'CO2_sensor_SNs': [['K30SN', 1]], 'CO2bus_sensor_SNs': [['RS485SN', 'bus']]}, f)
+    monkeypatch.setattr(list_ports, 'comports', lambda: [
+        ('/dev/ttyUSB0', 'K-30', 'USB SER=K30SN'), ('/dev/ttyUSB1', 'RS-485', 'USB SER=RS485SN')])
+    assert find_sensor('CO2bus', path) == ['RS485SN', 'bus', '/dev/ttyUSB1']
+    assert find_sensor('CO2', path) == ['K30SN', 1, '/dev/ttyUSB0']
+
+
+def test_logger_passes_only_bus_options(tmp_path, virtual_clock, monkeypatch):
+    buses = []
+
+    def connect(self):
+        self.sensor = SimBus()
+        buses.append(self)
+    monkeypatch.setattr(CO2Bus, 'connect', connect)
+    # as from auto_log: the options of other loggers come along too
+    logCO2bus([1, 2], data_dir=str(tmp_path / 'bus'), interval=10, stop=30, n=2,
+              mode='air', GainIndex=0, max_failures=5, retry_every=2)
+    assert buses[0].max_failures == 5 and buses[0].retry_every == 2
+    assert os.path.exists(str(tmp_path / 'bus' / 'co2_0x01.csv'))
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+
+import pytest
+
+from swmeas import logger
+from swmeas.pH_sensor import pH_sensor
+from swmeas.soak import sim_sensor
+
+OPTIONS = dict(qc=True, pyramid=True, index=True,
+               adaptive={'std_threshold': .5, 'min_interval': 5})
+
+
+def test_logCO2_outputs(tmp_path, virtual_clock):
+    d = str(tmp_path / 'co2')
+    logger.logCO2(d, interval=20, stop=200, sensor=sim_sensor('CO2'),
+                  database=str(tmp_path / 'log.db'), **OPTIONS)
+    for f in ('co2.csv', 'co2.csv.idx', 'co2_qc.csv', 'CO2_sampling.csv', 'logCO2.json',
+              'pyramid/co2_pyramid.json'):
+        assert os.path.exists(os.path.join(d, f)), f
+    with sqlite3.connect(str(tmp_path / 'log.db')) as c:
+        assert c.execute('SELECT COUNT(*) FROM CO2').fetchone()[0] > 0
+
+
+def test_logTempO2_outputs(tmp_path, virtual_clock):
+    d = str(tmp_path / 'o2')
+    logger.logTempO2(d, interval=20, stop=200, sensor=sim_sensor('TempO2'), **OPTIONS)
+    for f in ('temp.csv', 'o2.csv', 'TempO2_raw.csv', 'TempO2_qc.csv', 'TempO2_sampling.csv',
+              'pyramid/o2_pyramid.json', 'pyramid/temp_pyramid.json'):
+        assert os.path.exists(os.path.join(d, f)), f
+
+
+def test_logCO2bus_outputs(tmp_path, virtual_clock, sim_bus):
+    d = str(tmp_path / 'bus')
+    logger.logCO2bus([1, 2], data_dir=d, interval=20, stop=200, sensor=sim_bus, **OPTIONS)
+    for name in ('a', 'b'):
+        for f in ('co2_{}.csv', 'co2_{}.csv.idx', 'co2_{}_qc.csv', 'CO2_{}_sampling.csv',
+                  'pyramid/co2_{}_pyramid.json'):
+            assert os.path.exists(os.path.join(d, f.format(name))), f.format(name)
+
+
+class FakeU6(object):
+    def getFeedback(self, *cmds):
+        return [int(256 * (40000 + 10 * i)) for i in range(len(cmds))]
+
+
+def test_logpH_probes(tmp_path, virtual_clock):
+    s = pH_sensor(probes={'b': (3, 1), 'a': (2, 0)}, connect=False)
+    s.sensor, s.comm = FakeU6(), list(range(5))
+    s.cal = s.cal_temp = (1e-5, 1e-5, 32768.)
+    s.temp_slope, s.temp_offset = 1., 273.
+    assert s.volt_fields == ('pH_a', 'pH_temp_a', 'pH_b', 'pH_temp_b')
+
+    d = str(tmp_path / 'pH')
+    logger.logpH(d, interval=10, stop=50, sensor=s, qc=True)
+    with open(os.path.join(d, 'pH.csv')) as f:
+        rows = [l.split(',') for l in f if not l.startswith('#')]
+    with open(os.path.join(d, 'pH_qc.csv')) as f:
+        flags = [l.split(',') for l in f if not l.startswith('#')]
+    # a row per reading, and a flag per field (probes and LabJack
+    # temperature) for each batch of 5 readings
+    assert len(rows) == 25 and all(len(r) == 6 for r in rows)
+    assert len(flags) == 5 and all(len(f) == 6 for f in flags)
+    assert [f[0] for f in flags] == [r[0] for r in rows[::5]]
+
+
+def test_outputs_closed_on_interrupt(tmp_path, virtual_clock):
+    s = sim_sensor('CO2')
+    parse = s.parse
+    calls = [0]
+
+    def interrupted(*args, **kwargs):
+        calls[0] += 1
+        if calls[0] == 12:
+            raise KeyboardInterrupt
+        return parse(*args, **kwargs)
+    s.parse = interrupted
+
+    path = str(tmp_path / 'co2.trace')
+    with pytest.raises(KeyboardInterrupt):
+        logger.logCO2(str(tmp_path / 'co2'), interval=10, sensor=s, trace=path)
+    # the trace was flushed and closed, with every response before the interrupt
+    from swmeas.trace import scan
+    assert list(scan(path).values())[0]['count'] == 12
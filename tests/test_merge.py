@@ -0,0 +1,66 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from swmeas.merge import MergeEngine, merge_dir, parse_times, read_log
+from swmeas.records import format_time
+
+T0 = 1699999980.  # a multiple of 60 s
+
+
+def write_batches(path, t, rows):
+    with open(path, 'w') as f:
+        f.write('# lab\n# Time (UTC),...\n')
+        for ts, r in zip(format_time(t), rows):
+            f.write(ts + ',' + ','.join('{:.2f}'.format(v) for v in r) + '\n')
+
+
+def test_merge_grid(tmp_path):
+    d = str(tmp_path)
+    t = T0 + np.arange(0, 600, 30.)
+    write_batches(os.path.join(d, 'co2.csv'), t, [[400 + i, 402 + i] for i in range(len(t))])
+    write_batches(os.path.join(d, 'temp.csv'), t + 15, [[20 + i / 10.] for i in range(len(t))])
+    write_batches(os.path.join(d, 'o2.csv'), t[:-4], [[250.] for _ in t[:-4]])
+
+    merge_dir(d, freq=60.)
+    times, values, _ = read_log(os.path.join(d, 'merged.csv'))
+    with open(os.path.join(d, 'merged.csv')) as f:
+        assert f.readlines()[1] == '# Time (UTC),CO2,O2,Temp,pH,pH_temp\n'
+    # grid covered by all the logged sources, pH.csv isn't there
+    assert np.array_equal(times, T0 + np.arange(60, 421, 60.))
+    i = (times - T0) / 30.
+    assert np.allclose(values[:, 0], 401 + i)
+    assert np.all(values[:, 1] == 250.)
+    assert np.allclose(values[:, 2], 20 + (i - .5) / 10.)
+    assert np.isnan(values[:, 3:]).all()
+
+
+def test_merge_update_is_incremental(tmp_path):
+    d = str(tmp_path)
+    eng = MergeEngine(d, sources={'CO2': ('co2.csv', None), 'pH': ('pH.csv', {'pH': 0})},
+                      freq=10., method='asof')
+    write_batches(os.path.join(d, 'co2.csv'), T0 + np.arange(0, 100, 5.), [[1.]] * 20)
+    t, v = eng.update()
+    assert len(t) == 10
+    with open(os.path.join(d, 'co2.csv'), 'a') as f:
+        f.write(format_time(T0 + 100.) + ',2.00\n')
+    t2, v2 = eng.update()
+    assert np.array_equal(t2, [T0 + 100.]) and v2[0, 0] == 2.
+
+
+@pytest.fixture
+def halifax(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/Halifax')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_parse_legacy_local_times(halifax):
+    # UTC-4 in summer, UTC-3 in winter
+    t = parse_times(['2024-07-01-12:00:00', '2024-01-01-12:00:00', '2024-07-01T16:00:00.000Z'])
+    assert list(format_time(t)) == ['2024-07-01T15:00:00.000Z', '2024-01-01T16:00:00.000Z',
+                                    '2024-07-01T16:00:00.000Z']
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from swmeas.oxygen import ML_TO_UMOL, O2_saturation, O2_solubility, convert_raw, derive
+
+RAW = [0, 20000, 250000, 200000, 98000, 20500, 20000, 100000, 1000, 0, 0, 1, 20900]
+
+
+def test_solubility_check_value():
+    # Garcia & Gordon (1992): 6.315 ml/L at T = 10 C, S = 35
+    assert O2_solubility(10., 35.) / ML_TO_UMOL == pytest.approx(6.315, abs=5e-4)
+    # less soluble when warmer, saltier, or at lower pressure
+    assert O2_solubility(20., 35.) < O2_solubility(10., 35.)
+    assert O2_solubility(10., 35.) < O2_solubility(10., 0.)
+    assert O2_solubility(10., 35., .5) < .5 * O2_solubility(10., 35.)
+
+
+def test_solubility_broadcasts():
+    T = np.linspace(0, 30, 7)
+    assert np.allclose(O2_solubility(T, 35.), [O2_solubility(t, 35.) for t in T])
+    assert np.allclose(O2_saturation(O2_solubility(T, 30.), T, 30.), 100.)
+
+
+def test_convert_raw():
+    phys = convert_raw([RAW, RAW])
+    assert phys['umolar'].tolist() == [250., 250.]
+    assert phys['tempSample'][0] == pytest.approx(20.5)
+    assert phys['status'][0] == 0
+
+
+def test_derive_uses_meter_pressure():
+    out = derive([RAW], S=35.)
+    # no pressure recorded: 1 atm
+    assert out['solubility'][0] == pytest.approx(O2_solubility(20.5, 35.))
+    assert out['saturation'][0] == pytest.approx(100 * 250. / out['solubility'][0])
+    raw = list(RAW)
+    raw[9] = 506625  # 506.625 mbar
+    assert derive([raw])['solubility'][0] == pytest.approx(O2_solubility(20.5, 35., .5))
@@ -0,0 +1,37 @@
+import pytest
+
+from swmeas import clock, trace
+from swmeas.power import DutyCycle
+from swmeas.soak import sim_sensor
+
+
+def test_wake_polls_status_until_warm(tmp_path, virtual_clock):
+    s = sim_sensor('TempO2', dropout=0., warmup=2.)
+    rec = trace.Recorder(str(tmp_path / 'o2.trace'))
+    rec.attach(s)
+    dc = DutyCycle(s, warmup=1., poll_wait=.5)
+
+    measured = dc.wake()
+    # power-up takes .22 s, each poll .36 s: warm at the 3rd poll
+    assert measured == pytest.approx(.22 + 3 * .36 + 2 * .5)
+    assert dc.warmup == pytest.approx(.7 * 1. + .3 * measured)
+    # the polls aren't readings
+    rec.close()
+    assert s.last_read is None and s.stats['reads'] == 0
+    assert list(trace.scan(str(tmp_path / 'o2.trace')).values())[0]['count'] == 0
+
+
+def test_idle_powers_down_and_is_warm_in_time(virtual_clock):
+    s = sim_sensor('TempO2', dropout=0., warmup=2.)
+    dc = DutyCycle(s, warmup=3., margin=.5, min_off=5.)
+    t0 = clock.monotonic()
+    dc.idle(60.)
+    assert clock.monotonic() - t0 == pytest.approx(60.)
+    assert s.powered and dc.cycles == 1
+    assert s.status() == 0
+    r = dc.report()
+    assert r['off_time'] > 55. and r['duty'] < .1
+
+    # too short to power down
+    dc.idle(6.)
+    assert dc.cycles == 1
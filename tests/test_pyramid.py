@@ -0,0 +1,48 @@
+import numpy as np
+
+from swmeas.pyramid import LEVELS, Pyramid
+
+T0 = 1699920000.  # a multiple of 1 day
+
+
+def reference(t, v, width):
+    b = np.floor(t / width) * width
+    starts = np.unique(b)
+    return (starts, np.array([(b == s).sum() for s in starts]),
+            np.array([v[b == s].min() for s in starts]),
+            np.array([v[b == s].max() for s in starts]),
+            np.array([v[b == s].mean() for s in starts]))
+
+
+def test_levels_match_direct_binning(tmp_path):
+    rng = np.random.RandomState(0)
+    t = T0 + np.cumsum(rng.uniform(5, 55, 6000))  # ~2 days
+    v = 400 + 20 * rng.randn(len(t))
+    v[100] = np.nan
+
+    d = str(tmp_path)
+    pyr = Pyramid(d, 'co2')
+    for i, chunk in enumerate(np.array_split(np.arange(len(t)), 37)):
+        if i == 20:
+            pyr = Pyramid(d, 'co2')  # restarted
+        pyr.add(t[chunk], v[chunk])
+
+    ok = ~np.isnan(v)
+    for label, width in LEVELS:
+        got = pyr.level(label)
+        ref = reference(t[ok], v[ok], width)
+        assert np.array_equal(got[0], ref[0]), label
+        assert np.array_equal(got[1], ref[1]), label
+        for g, r in zip(got[2:], ref[2:]):
+            assert np.allclose(g, r, atol=5e-4), label
+
+
+def test_window_chooses_level(tmp_path):
+    pyr = Pyramid(str(tmp_path), 'co2')
+    t = T0 + np.arange(0, 86400 * 3, 30.)
+    pyr.add(t, np.ones(len(t)))
+    assert pyr.window(T0, T0 + 600)[0] is None  # use the raw data
+    label, (bt, n, mn, mx, mean) = pyr.window(T0, T0 + 86400)
+    assert label == '10min' and len(bt) == 145 and (n == 20).all()
+    assert pyr.window(T0, T0 + 86400 * 3)[0] == '10min'
+    assert pyr.window(T0, T0 + 86400 * 3, max_points=100)[0] == '1h'
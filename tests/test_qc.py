@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from swmeas import qc
+from swmeas.qc import (QC_AMBIENT, QC_MISSING, QC_RANGE, QC_SPIKE, QC_STATUS, QC_STUCK,
+                       QCStage, check, field_config, qc_log)
+from swmeas.records import PH_DTYPE, new_reading, ph_fields, reading_dtype
+from swmeas.soak import sim_sensor
+
+
+def test_check():
+    x = 400 + np.arange(30) % 3.
+    x[5] = np.nan
+    x[10] = 900.
+    x[20] = -1.
+    x[22:] = 401.
+    flags = check({'co2': x}, qc.DEFAULT_QC['CO2'])
+    assert flags[5] == QC_MISSING
+    assert flags[10] == QC_SPIKE
+    assert flags[20] == QC_RANGE | QC_SPIKE
+    assert (flags[:5] == 0).all()
+
+    flags = check({'co2': np.full(25, 400.)}, qc.DEFAULT_QC['CO2'])
+    assert (flags == QC_STUCK).all()
+
+    o2 = {'status': np.array([0, 3]), 'ambientLight': np.array([0, 3e6])}
+    assert check(o2, qc.DEFAULT_QC['TempO2']).tolist() == [0, QC_STATUS | QC_AMBIENT]
+
+
+def test_check_without_configured_fields():
+    arr = np.zeros(4, dtype=PH_DTYPE)
+    flags = check(arr, {'co2': {'range': (0, 1)}})
+    assert flags.dtype == np.uint16 and flags.tolist() == [0, 0, 0, 0]
+
+
+def test_field_config_of_probes():
+    fields = ph_fields(['a', 'b']) + ['co2_x']
+    config = field_config(qc.DEFAULT_QC['pH'], fields)
+    assert sorted(config) == ['pH_a', 'pH_b', 'pH_temp_a', 'pH_temp_b']
+    assert config['pH_b'] is qc.DEFAULT_QC['pH']['pH']
+    assert config['pH_temp_a'] is qc.DEFAULT_QC['pH']['pH_temp']
+
+
+def test_stage_checks_every_probe():
+    fields = ph_fields(['a', 'b'])
+    dtype = reading_dtype(fields)
+    stage = QCStage('pH', fields=fields)
+    for i in range(3):
+        arr = np.zeros(5, dtype=dtype)
+        arr['time'] = 1.7e9 + 5 * i + np.arange(5)
+        arr['pH_a'] = .1
+        arr['pH_b'] = .2
+        if i == 2:
+            arr['pH_b'][0] = .5  # spike, seen across the batch boundary
+            arr['pH_a'][4] = 3.
+        arr['flag'][1] = QC_MISSING  # set by the sensor
+        flags = stage(arr)
+    assert flags.tolist() == [QC_SPIKE, QC_MISSING, 0, 0, QC_RANGE]
+
+
+def test_stage_default_fields():
+    stage = QCStage('pH')
+    r = new_reading(PH_DTYPE)
+    r['pH'] = 3.
+    arr = np.array([r])
+    assert stage(arr).tolist() == [QC_RANGE]
+
+
+@pytest.fixture
+def o2_logs(tmp_path, virtual_clock):
+    s = sim_sensor('TempO2', dropout=0.)
+    for i in range(4):
+        s.read_multi(5, 1.)
+        arr = s.batch.array
+        if i == 2:
+            arr['tempSample'][1] = 60000  # 60 C
+            arr['umolar'][3] = 2000000  # 2000 umol/L
+            arr['percentO2'][3] = 150000  # 150 %
+        s.write(str(tmp_path / 'TempO2_raw.csv'))
+        s.write_TempO2_batch(str(tmp_path / 'temp.csv'), str(tmp_path / 'o2.csv'), 'water')
+        s.write_TempO2_batch(str(tmp_path / 'temp_air.csv'), str(tmp_path / 'o2_air.csv'), 'air')
+    return tmp_path
+
+
+@pytest.mark.parametrize('file,row,col,flag', [
+    ('temp.csv', 2, 1, QC_RANGE | QC_SPIKE),
+    ('o2.csv', 2, 3, QC_RANGE | QC_SPIKE),
+    ('o2_air.csv', 2, 3, QC_RANGE),
+])
+def test_qc_log_batch_files(o2_logs, file, row, col, flag):
+    t, flags = qc_log(str(o2_logs / file), 'TempO2', out_path=str(o2_logs / 'qc.csv'))
+    assert flags.shape == (4, 5)
+    expected = np.zeros((4, 5), dtype=np.uint16)
+    expected[row, col] = flag
+    assert np.array_equal(flags, expected)
+    with open(str(o2_logs / 'qc.csv')) as f:
+        assert len(f.readlines()) == 6
+
+
+def test_qc_log_raw_file(o2_logs):
+    t, flags = qc_log(str(o2_logs / 'TempO2_raw.csv'), 'TempO2')
+    assert flags.shape == (20, 1)
+    assert np.flatnonzero(flags).tolist() == [11, 13]
+    assert flags[11, 0] & QC_RANGE and flags[13, 0] & QC_RANGE
+
+
+def test_qc_log_co2(tmp_path, virtual_clock):
+    s = sim_sensor('CO2', dropout=0.)
+    for _ in range(3):
+        s.read_multi(4, 1.)
+        s.batch.array['co2'][2] = 20000.
+        s.write_batch(str(tmp_path / 'co2_a.csv'))
+    t, flags = qc_log(str(tmp_path / 'co2_a.csv'), 'CO2')
+    assert (flags[:, 2] & QC_RANGE).all() and (flags[:, [0, 1, 3]] == 0).all()
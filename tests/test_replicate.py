@@ -0,0 +1,131 @@
+import os
+
+import pytest
+
+from swmeas.replicate import Agent, Collector, pack
+
+
+def append(path, data, mode='ab'):
+    d = os.path.dirname(path)
+    if not os.path.exists(d):
+        os.makedirs(d)
+    with open(path, mode) as f:
+        f.write(data)
+
+
+def rows(start, n):
+    return ''.join('2024-01-01T00:{:02d}:00.000Z,400.0\n'.format(i) for i in range(start, start + n)).encode()
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    src, dst = str(tmp_path / 'src'), str(tmp_path / 'dst')
+    os.makedirs(src)
+    return src, dst
+
+
+def same(src, dst, rel):
+    with open(os.path.join(src, rel), 'rb') as a, open(os.path.join(dst, 'pi', rel), 'rb') as b:
+        return a.read() == b.read()
+
+
+def sync_all(agent):
+    sent = []
+    while True:
+        n = agent.sync()
+        if not n:
+            return sent
+        sent.append(n)
+
+
+def test_batches_and_partial_lines(dirs):
+    src, dst = dirs
+    csv = os.path.join(src, 'day', 'co2.csv')
+    append(csv, rows(0, 50) + b'2024-01-01T00:50:00.000Z,40')
+    sent = sync_all(Agent(src, dst, node='pi', batch_bytes=500))
+    assert max(sent) <= 500 and len(sent) > 1
+    # the incomplete last line is held back
+    with open(os.path.join(dst, 'pi', 'day', 'co2.csv'), 'rb') as f:
+        assert f.read() == rows(0, 50)
+
+    # a restarted agent carries on from its saved state
+    append(csv, b'1.0\n')
+    agent = Agent(src, dst, node='pi', batch_bytes=500)
+    assert agent.sync() == len('2024-01-01T00:50:00.000Z,401.0\n')
+    assert agent.sync() == 0
+    assert same(src, dst, 'day/co2.csv')
+
+
+def test_lost_ack_is_resent_once(dirs):
+    src, dst = dirs
+    csv = os.path.join(src, 'co2.csv')
+    append(csv, rows(0, 5))
+    agent = Agent(src, dst, node='pi')
+    agent.sync()
+
+    class LostAck(object):
+        def __init__(self, target):
+            self.target = target
+
+        def send(self, payload):
+            self.target.send(payload)
+            raise IOError('ack lost')
+
+    append(csv, rows(5, 5))
+    agent.target = LostAck(Collector(dst))
+    with pytest.raises(IOError):
+        agent.sync()
+    agent.target = Collector(dst)
+    assert agent.sync() == len(rows(5, 5))
+    assert same(src, dst, 'co2.csv')
+
+
+def test_collector_gap(dirs):
+    src, dst = dirs
+    csv = os.path.join(src, 'co2.csv')
+    append(csv, rows(0, 5))
+    agent = Agent(src, dst, node='pi')
+    agent.sync()
+    # the collector's copy is lost: it acks 0, and the agent resends it all
+    os.remove(os.path.join(dst, 'pi', 'co2.csv'))
+    append(csv, rows(5, 1))
+    sync_all(agent)
+    assert same(src, dst, 'co2.csv')
+
+
+def test_binary_logs_send_appended_bytes(dirs):
+    src, dst = dirs
+    trace = os.path.join(src, 'co2.trace')
+    append(trace, os.urandom(50000))
+    agent = Agent(src, dst, node='pi', batch_bytes=16384)
+    assert max(sync_all(agent)) <= 16384
+    # no complete lines in binary files: all new bytes are sent
+    append(trace, os.urandom(100))
+    assert agent.sync() == 100
+    assert same(src, dst, 'co2.trace')
+
+
+def test_rewritten_files(dirs):
+    src, dst = dirs
+    par = os.path.join(src, 'logCO2.json')
+    csv = os.path.join(src, 'co2.csv')
+    append(par, b'{"n": 5}', 'wb')
+    append(csv, rows(0, 10))
+    agent = Agent(src, dst, node='pi')
+    sync_all(agent)
+
+    # same size, new contents
+    append(par, b'{"n": 6}', 'wb')
+    os.utime(par, (0, 1))
+    with open(csv, 'rb') as f:
+        data = f.read().replace(b'400.0', b'399.0', 1)
+    append(csv, data, 'wb')
+    sync_all(agent)
+    assert same(src, dst, 'logCO2.json')
+    assert same(src, dst, 'co2.csv')
+
+
+def test_collector_rejects_paths_outside_node(dirs):
+    _, dst = dirs
+    with pytest.raises(ValueError):
+        Collector(dst).receive(pack('pi', [('../../x', 0, b'x', True)]))
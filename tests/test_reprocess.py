@@ -0,0 +1,106 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from swmeas.merge import read_log
+from swmeas.oxygen import rederive_TempO2
+from swmeas.records import format_time
+from swmeas.reprocess import reprocess
+
+RAW = [0, 20000, 250000, 200000, 98000, 20500, 20000, 100000, 1000, 0, 0, 1, 20900.]
+
+
+def write_raw(folder, t):
+    raw = np.tile(RAW, (len(t), 1))
+    raw[:, 5] += np.arange(len(t)) * 1000  # tempSample
+    with open(os.path.join(folder, 'TempO2_raw.csv'), 'w') as f:
+        f.write('# lab\n# Time (UTC),...\n')
+        for ts, r in zip(format_time(t), raw):
+            f.write(ts + ',' + ','.join('{:.1f}'.format(v) for v in r) + '\n')
+
+
+def read_rows(path):
+    with open(path) as f:
+        return [l.rstrip().split(',') for l in f if not l.startswith('#')]
+
+
+def test_rederive_keeps_logged_batches(tmp_path):
+    # logged with n=5, then restarted with n=3, which overwrote the json
+    d = str(tmp_path)
+    with open(os.path.join(d, 'logTempO2.json'), 'w') as f:
+        json.dump({'n': 3}, f)
+    t = 1.7e9 + np.arange(16.)
+    write_raw(d, t)
+    ts = format_time(t)
+    with open(os.path.join(d, 'temp.csv'), 'w') as f:
+        f.write('# lab\n# Time (UTC),Temperature (C)\n')
+        for i, k in [(0, 5), (5, 5), (10, 3), (13, 3)]:
+            f.write(ts[i] + ',0' * k + '\n')
+
+    rederive_TempO2(os.path.join(d, 'TempO2_raw.csv'), os.path.join(d, 'temp.csv'),
+                    os.path.join(d, 'o2.csv'))
+    rows = read_rows(os.path.join(d, 'temp.csv'))
+    assert [len(r) - 1 for r in rows] == [5, 5, 3, 3]
+    assert [r[0] for r in rows] == [ts[0], ts[5], ts[10], ts[13]]
+    assert rows[2][1:] == ['30.50', '31.50', '32.50']
+    assert sorted(os.listdir(d)) == ['TempO2_raw.csv', 'logTempO2.json', 'o2.csv', 'temp.csv']
+
+
+def test_reprocess_skips_active_folders(tmp_path):
+    root = str(tmp_path)
+    with open(os.path.join(root, 'logTempO2.json'), 'w') as f:
+        json.dump({'n': 4}, f)
+    old = time.time() - 86400
+    for day in ('2024-01-01', '2024-01-02'):
+        d = os.path.join(root, day)
+        os.mkdir(d)
+        write_raw(d, 1.7e9 + np.arange(8.))
+    os.utime(os.path.join(root, '2024-01-01', 'TempO2_raw.csv'), (old, old))
+
+    res = reprocess(root, ['o2'], processes=1, verbose=False)
+    assert res[os.path.join(root, '2024-01-01')] == {'o2': 'done'}
+    assert res[os.path.join(root, '2024-01-02')] == {'o2': 'active'}
+    assert not os.path.exists(os.path.join(root, '2024-01-02', 'o2.csv'))
+
+    res = reprocess(root, ['o2'], processes=1, verbose=False, active=0)
+    assert res[os.path.join(root, '2024-01-02')] == {'o2': 'done'}
+
+
+def test_merge_uses_logged_probes(tmp_path):
+    root = str(tmp_path)
+    with open(os.path.join(root, 'logpH.json'), 'w') as f:
+        json.dump({'probes': [['a', [2, 0]], ['b', [3, 1]]]}, f)
+    d = os.path.join(root, '2024-01-01')
+    os.mkdir(d)
+    t = 1699999980. + np.arange(0, 300, 10.)
+    with open(os.path.join(d, 'pH.csv'), 'w') as f:
+        f.write('# lab\n# Time (UTC),...\n')
+        for ts in format_time(t):
+            f.write(ts + ',1.0,2.0,3.0,4.0,25.0\n')
+
+    reprocess(root, ['merge'], processes=1, verbose=False, active=0)
+    with open(os.path.join(d, 'merged.csv')) as f:
+        assert f.readlines()[1].rstrip().endswith(',pH_a,pH_temp_a,pH_b,pH_temp_b')
+    _, values, _ = read_log(os.path.join(d, 'merged.csv'))
+    assert np.allclose(values[:, -4:], [1., 2., 3., 4.])
+
+
+def test_merge_twice_replaces(tmp_path):
+    root = str(tmp_path)
+    d = os.path.join(root, '2024-01-01')
+    os.mkdir(d)
+    t = 1699999980. + np.arange(0, 600, 30.)
+    with open(os.path.join(d, 'co2.csv'), 'w') as f:
+        f.write('# lab\n# Time (UTC),...\n')
+        for ts in format_time(t):
+            f.write(ts + ',400.00\n')
+
+    for _ in range(2):
+        res = reprocess(root, ['merge'], processes=1, verbose=False, active=0, force=True)
+        assert res[d] == {'merge': 'done'}
+    rows = read_rows(os.path.join(d, 'merged.csv'))
+    times = [r[0] for r in rows]
+    assert len(times) == 10 and len(set(times)) == len(times)
+    assert not os.path.exists(os.path.join(d, 'merged.csv.tmp'))
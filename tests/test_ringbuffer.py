@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from swmeas.ringbuffer import SharedRing
+
+
+@pytest.fixture
+def ring(tmp_path):
+    r = SharedRing('test', width=2, capacity=8, create=True, directory=str(tmp_path))
+    yield r
+    r.close()
+
+
+def records(t):
+    t = np.asarray(t, dtype=float)
+    return np.column_stack([t, t * 10])
+
+
+def test_reader_sees_appends_in_order(ring, tmp_path):
+    reader = SharedRing('test', directory=str(tmp_path))
+    assert reader.latest().shape == (0, 2)
+    ring.append(records(range(5)))
+    ring.append(records(range(5, 11)))
+    # wrapped round: the oldest 3 were overwritten
+    assert reader.count == 11
+    assert np.array_equal(reader.latest(), records(range(3, 11)))
+    assert np.array_equal(reader.latest(2), records([9, 10]))
+    assert np.array_equal(reader.window(2.), records([8, 9, 10]))
+    reader.close()
+
+
+def test_reader_retries_during_write(ring, tmp_path):
+    reader = SharedRing('test', directory=str(tmp_path))
+    ring.append(records(range(3)))
+    ring.header[0] += 1  # a write in progress
+    with pytest.raises(RuntimeError):
+        reader.latest(retries=3)
+    ring.header[0] += 1
+    assert len(reader.latest()) == 3
+    reader.close()
+
+
+def test_close_with_views_held(ring):
+    ring.append(records(range(3)))
+    v = ring.view()
+    ring.close()
+    assert v[2, 1] == 20.
+
+
+def test_reset_leaves_attached_readers_alone(ring, tmp_path):
+    ring.append(records(range(3)))
+    reader = SharedRing('test', directory=str(tmp_path))
+    new = SharedRing('test', width=3, capacity=4, create=True, directory=str(tmp_path))
+    # the old reader keeps the old buffer, new readers attach to the new one
+    assert np.array_equal(reader.latest(), records(range(3)))
+    fresh = SharedRing('test', directory=str(tmp_path))
+    assert (fresh.width, fresh.capacity, fresh.count) == (3, 4, 0)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['swmeas_test.ring']
+    for r in (reader, new, fresh):
+        r.close()
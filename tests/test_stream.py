@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+
+from swmeas.soak import sim_sensor
+from swmeas.stream import LocalBus, Publisher, Subscriber, reading_message
+
+
+def test_publish_batch_with_missing_values(tmp_path, virtual_clock):
+    s = sim_sensor('CO2', dropout=0.)
+    s.read_multi(3, 1.)
+    s.batch.array['co2'][1] = np.nan
+
+    bus = LocalBus()
+    local = bus.subscribe(['CO2'])
+    pub = Publisher(str(tmp_path / 'bus.sock'), bus=bus)
+    sub = Subscriber(str(tmp_path / 'bus.sock'), timeout=2.)
+    try:
+        msg = reading_message('CO2', s.label, s.batch)
+        pub.publish(msg)
+        got = sub.get()
+    finally:
+        sub.close()
+        pub.close()
+
+    # one message per batch, with the missing reading as null
+    assert got['topic'] == 'CO2' and got['fields'] == ['co2']
+    assert len(got['time']) == 3
+    assert got['values'][1] == [None]
+    assert got['values'][0] == [s.batch.array['co2'][0]]
+    assert local.drain() == [msg]
+    json.loads(json.dumps(got, allow_nan=False))
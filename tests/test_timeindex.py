@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from swmeas import timeindex
+from swmeas.merge import read_log
+from swmeas.soak import sim_sensor
+
+
+def log(path, batches, virtual_clock, index=True):
+    s = sim_sensor('CO2')
+    if index:
+        s.index_files(every=10, interval=120.)
+    for _ in range(batches):
+        s.read_multi(3, 1.)
+        s.write_batch(path)
+        virtual_clock.sleep(7.)
+
+
+def check_ranges(path):
+    times, values, _ = read_log(path)
+    for t0, t1 in [(times[0], times[-1]), (times[5], times[40]),
+                   (times[17] + .5, times[18] - .5), (times[-1] + 1, times[-1] + 100),
+                   (times[0] - 100, times[3])]:
+        t, v = timeindex.read_range(path, t0, t1, every=10, interval=120.)
+        keep = (times >= t0) & (times <= t1)
+        assert np.array_equal(t, times[keep])
+        assert np.array_equal(v, values[keep])
+
+
+def test_read_range_live_index(tmp_path, virtual_clock):
+    path = str(tmp_path / 'co2.csv')
+    log(path, 60, virtual_clock)
+    assert os.path.exists(timeindex.index_path(path))
+    check_ranges(path)
+
+
+def test_read_range_builds_index(tmp_path, virtual_clock):
+    path = str(tmp_path / 'co2.csv')
+    log(path, 60, virtual_clock, index=False)
+    assert not os.path.exists(timeindex.index_path(path))
+    check_ranges(path)
+    assert os.path.exists(timeindex.index_path(path))
+
+
+def test_live_index_matches_build(tmp_path, virtual_clock):
+    path = str(tmp_path / 'co2.csv')
+    log(path, 60, virtual_clock)
+    live = timeindex.load(path)
+    os.remove(timeindex.index_path(path))
+    built = timeindex.build(path, every=10, interval=120.)
+    # live entries have the readings' times, built ones those in the csv (to the ms)
+    assert np.array_equal(live['offset'], built['offset'])
+    assert np.allclose(live['time'], built['time'], rtol=0, atol=1e-3)
@@ -0,0 +1,47 @@
+import filecmp
+import os
+
+import pytest
+
+from swmeas import logger, trace
+from swmeas.soak import sim_sensor
+
+FILES = {'CO2': ['co2.csv'],
+         'TempO2': ['temp.csv', 'o2.csv', 'TempO2_raw.csv']}
+
+
+def same(a, b, files):
+    return all(filecmp.cmp(os.path.join(a, f), os.path.join(b, f), shallow=False) for f in files)
+
+
+@pytest.mark.parametrize('stype', ['CO2', 'TempO2'])
+def test_record_replay(tmp_path, virtual_clock, stype):
+    log = {'CO2': logger.logCO2, 'TempO2': logger.logTempO2}[stype]
+    rec, rep, path = str(tmp_path / 'rec'), str(tmp_path / 'rep'), str(tmp_path / 'log.trace')
+    log(rec, interval=20, stop=300, n=4, wait=1., sensor=sim_sensor(stype, dropout=.05),
+        trace=path, qc=True)
+
+    info = list(trace.scan(path).values())
+    assert len(info) == 1 and info[0]['stype'] == stype and info[0]['count'] == 15 * 4
+
+    trace.replay(path, rep, qc=True)
+    assert same(rec, rep, FILES[stype] + ['{}_qc.csv'.format('co2' if stype == 'CO2' else stype)])
+
+
+def test_record_replay_bus(tmp_path, virtual_clock, sim_bus):
+    rec, rep, path = str(tmp_path / 'rec'), str(tmp_path / 'rep'), str(tmp_path / 'bus.trace')
+    logger.logCO2bus([1, 2], data_dir=rec, interval=10, stop=100, n=3, wait=1.,
+                     sensor=sim_bus, trace=path)
+    assert len(trace.scan(path)) == 2
+
+    trace.replay(path, rep)
+    assert same(rec, rep, ['co2_a.csv', 'co2_b.csv'])
+
+
+def test_replay_is_repeatable(tmp_path, virtual_clock):
+    path = str(tmp_path / 'log.trace')
+    logger.logCO2(str(tmp_path / 'rec'), interval=10, stop=60, n=2, wait=1.,
+                  sensor=sim_sensor('CO2'), trace=path)
+    for d in ('a', 'b'):
+        trace.replay(path, str(tmp_path / d))
+    assert same(str(tmp_path / 'a'), str(tmp_path / 'b'), ['co2.csv'])
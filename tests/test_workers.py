@@ -0,0 +1,58 @@
+import multiprocessing as mp
+import time
+
+import pytest
+
+from swmeas import workers
+from swmeas.CO2_sensor import CO2_sensor
+
+# the fake driver reaches the workers by being registered before they fork
+pytestmark = pytest.mark.skipif(mp.get_start_method() != 'fork',
+                                reason='workers only see test drivers when forked')
+
+
+class FakePort(object):
+    def __init__(self, hang_at=None):
+        self.hang_at = hang_at
+        self.reads = 0
+
+    def flushInput(self):
+        pass
+
+    def write(self, msg):
+        pass
+
+    def read(self, n):
+        self.reads += 1
+        if self.reads == self.hang_at:
+            time.sleep(1000)
+        return b'\xfe\x44\x02\x01\x90\x00\x00'  # 400 ppm
+
+
+class FakeCO2(CO2_sensor):
+    def connect(self):
+        self.label = 'fake {}\n'.format(self.ID)
+        # sensor 'H' hangs in its 4th read
+        self.sensor = FakePort(4 if self.ID == 'H' else None)
+
+
+@pytest.fixture
+def fake_co2(monkeypatch):
+    monkeypatch.setitem(workers.SENSOR_TYPES, 'CO2', FakeCO2)
+
+
+def test_processes_share_sensors(tmp_path, fake_co2):
+    pool = workers.logPool([{'type': 'CO2', 'ID': x} for x in 'ABC'], str(tmp_path),
+                           interval=.5, stop=3, n=2, wait=.01, processes=2)
+    assert sorted(len(k) for k in pool.groups.values()) == [1, 2]
+    for k, st in pool.stats.items():
+        assert st['batches'] >= 3 and st['failures'] == 0, k
+
+
+def test_hung_worker_is_restarted(tmp_path, fake_co2):
+    pool = workers.logPool([{'type': 'CO2', 'ID': x} for x in 'AH'], str(tmp_path),
+                           interval=.5, stop=6, n=1, wait=.01, timeout=1.)
+    assert pool.stats['H']['hangs'] >= 1 and pool.stats['H']['restarts'] >= 1
+    assert pool.stats['A']['hangs'] == 0 and pool.stats['A']['missed'] == 0
+    # logging carried on after the restart
+    assert pool.stats['H']['last_slot'] > 6